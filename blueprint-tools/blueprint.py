@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Shared helpers for reading Tuono blueprints (see blog_blueprints/).
+
+A blueprint is a YAML mapping with the sections in SECTIONS. Variables are
+referenced anywhere in a string value as (( name )), with or without the
+spaces.
+'''
+
+import os
+import re
+import yaml
+
+try:
+    # The libyaml based parser is several times faster than the pure
+    # Python one
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+SECTIONS = ('variables', 'presets', 'location', 'networking', 'security',
+            'compute')
+
+VENUES = ('aws', 'azure')
+
+BLUEPRINT_SUFFIXES = ('.yaml', '.yml')
+
+INTERPOLATION = re.compile(r'\(\(\s*([A-Za-z_][A-Za-z0-9_-]*)\s*\)\)')
+
+
+def load_blueprint(text):
+    '''Parse the text of a blueprint'''
+
+    return yaml.load(text, Loader=SafeLoader)
+
+
+def walk_strings(node, path=()):
+    '''Yield (path, value) for every string in a parsed blueprint'''
+
+    if isinstance(node, str):
+        yield path, node
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            yield from walk_strings(value, path + (str(key),))
+    elif isinstance(node, list):
+        for index, value in enumerate(node):
+            yield from walk_strings(value, path + (str(index),))
+
+
+def interpolations(node):
+    '''Yield (path, variable name) for every (( variable )) reference'''
+
+    for path, value in walk_strings(node):
+        for match in INTERPOLATION.finditer(value):
+            yield path, match.group(1)
+
+
+def section(blueprint, *keys):
+    '''The mapping at blueprint[keys[0]][keys[1]]..., or {} when absent'''
+
+    node = blueprint
+    for key in keys:
+        if not isinstance(node, dict):
+            return {}
+        node = node.get(key)
+    return node if isinstance(node, dict) else {}
+
+
+def find_blueprints(paths):
+    '''Expand files and directories into a sorted list of blueprint files'''
+
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in os.walk(path):
+                found.extend(os.path.join(directory, name) for name in files
+                             if name.endswith(BLUEPRINT_SUFFIXES))
+        else:
+            found.append(path)
+    return sorted(found)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Render Tuono blueprints locally for a venue and a set of variable values.
+
+USAGE: ./render_blueprints.py <blueprint>
+                              --venue aws|azure [--venue ...]
+                              --set <name>=<value> [--set ...] (optional)
+                              --matrix <matrix.yaml> (optional)
+                              --output-dir <directory> (optional)
+
+Each variable takes the value given with --set (or by the matrix), else its
+preset for the venue, else its default. Every (( variable )) is then
+replaced: a string that is only a reference takes the typed value of the
+variable, other strings have the value substituted as text. The variables
+and presets sections are dropped and venue specific mappings (regions and
+the venue: blocks of images and secrets) keep only the selected venue.
+
+Rendered blueprints are written with sorted keys and a fixed layout, so
+identical inputs always render to identical bytes.
+
+A matrix is a YAML list of variable mappings, or a mapping of variable
+names to lists of values whose combinations are all rendered. The source
+blueprint is parsed once, and each blueprint x venue x variables
+combination is written to the output directory as
+<blueprint>-<venue>-<number>.yaml, with an index.yaml listing the
+variables each file was rendered with.
+'''
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import yaml
+
+from blueprint import INTERPOLATION
+from blueprint import VENUES
+from blueprint import load_blueprint
+from blueprint import section
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+
+class RenderError(ValueError):
+    '''A blueprint cannot be rendered with the given venue and values'''
+
+
+class BlueprintDumper(SafeDumper):
+    '''Write multi-line strings, such as userdata, as literal blocks'''
+
+
+def represent_str(dumper, value):
+    if '\n' in value:
+        return dumper.represent_scalar('tag:yaml.org,2002:str', value,
+                                       style='|')
+    return dumper.represent_scalar('tag:yaml.org,2002:str', value)
+
+
+BlueprintDumper.add_representer(str, represent_str)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Render Tuono blueprints for a venue')
+
+    parser.add_argument('blueprint',
+                        help='Blueprint to render')
+
+    parser.add_argument('-v', '--venue', action='append', required=True,
+                        choices=VENUES,
+                        help='Venue to render for, may be repeated')
+
+    parser.add_argument('-s', '--set', action='append', default=[],
+                        metavar='NAME=VALUE', dest='values',
+                        help='Value of a variable, may be repeated')
+
+    parser.add_argument('-m', '--matrix',
+                        help='YAML file of variable values to render')
+
+    parser.add_argument('-o', '--output-dir',
+                        help='Write each rendering to this directory '
+                             'instead of standard output')
+
+    return parser.parse_args()
+
+
+def coerce(value, variable_type):
+    '''Convert a value to the declared type of its variable'''
+
+    if variable_type == 'integer' and not isinstance(value, int):
+        return int(value)
+    if variable_type == 'boolean' and isinstance(value, str):
+        return value.lower() in ('true', 'yes', '1')
+    return value
+
+
+def dump_blueprint(blueprint):
+    '''Deterministic YAML text of a rendered blueprint'''
+
+    return yaml.dump(blueprint, Dumper=BlueprintDumper, sort_keys=True,
+                     default_flow_style=False, allow_unicode=True,
+                     width=4096, explicit_start=True)
+
+
+class Renderer():
+    '''A parsed blueprint, rendered for any number of venues and values'''
+
+    def __init__(self, text):
+        self.blueprint = load_blueprint(text)
+        if not isinstance(self.blueprint, dict):
+            raise RenderError("A blueprint must be a mapping of sections")
+        self.variables = section(self.blueprint, 'variables')
+        self.presets = section(self.blueprint, 'presets', 'venue')
+        # Rendered text by (venue, values as JSON), living as long as this
+        self.renderings = {}
+
+    def resolve(self, venue, values):
+        '''The value of every variable for a venue'''
+
+        resolved = {}
+        missing = []
+        for name, variable in self.variables.items():
+            variable = variable if isinstance(variable, dict) else {}
+            if name in values:
+                value = values[name]
+            elif name in section(self.presets, venue):
+                value = self.presets[venue][name]
+            elif 'default' in variable:
+                value = variable['default']
+            else:
+                missing.append(name)
+                continue
+            try:
+                resolved[name] = coerce(value, variable.get('type'))
+            except ValueError:
+                raise RenderError(f"Variable {name!r} must be "
+                                  f"{variable.get('type')}, not {value!r}")
+
+        unknown = sorted(set(values) - set(self.variables))
+        if unknown:
+            raise RenderError(f"Unknown variables: {', '.join(unknown)}")
+        if missing:
+            raise RenderError(f"No value for variables: "
+                              f"{', '.join(missing)} (venue {venue})")
+        return resolved
+
+    def substitute(self, node, venue, resolved, path=()):
+        if isinstance(node, str):
+            match = INTERPOLATION.fullmatch(node.strip())
+            if match and match.group(1) in resolved:
+                return resolved[match.group(1)]
+
+            def replace(match):
+                if match.group(1) not in resolved:
+                    raise RenderError(f"Undeclared variable "
+                                      f"{match.group(1)!r}")
+                return str(resolved[match.group(1)])
+            return INTERPOLATION.sub(replace, node)
+
+        if isinstance(node, list):
+            return [self.substitute(value, venue, resolved, path)
+                    for value in node]
+
+        if isinstance(node, dict):
+            # The venue keys of a region only keep the selected venue
+            in_region = path[:2] == ('location', 'region') and len(path) == 3
+            rendered = {}
+            for key, value in node.items():
+                if in_region and key in VENUES and key != venue:
+                    continue
+                # As do the venue: blocks of images and secrets
+                if key == 'venue' and isinstance(value, dict):
+                    if venue not in value:
+                        continue
+                    value = {venue: value[venue]}
+                rendered[key] = self.substitute(value, venue, resolved,
+                                                path + (key,))
+            return rendered
+
+        return node
+
+    def render(self, venue, values=None):
+        '''The blueprint rendered for a venue and variable values'''
+
+        resolved = self.resolve(venue, values or {})
+        body = {name: value for name, value in self.blueprint.items()
+                if name not in ('variables', 'presets')}
+
+        rendered = self.substitute(body, venue, resolved)
+        for region in section(rendered, 'location', 'region').values():
+            if isinstance(region, dict) and venue not in region:
+                raise RenderError(f"A region has no {venue} location")
+        return rendered
+
+    def render_text(self, venue, values=None):
+        '''The rendered blueprint as YAML text, memoized'''
+
+        key = (venue, json.dumps(values or {}, sort_keys=True))
+        if key not in self.renderings:
+            self.renderings[key] = dump_blueprint(self.render(venue, values))
+        return self.renderings[key]
+
+
+def parse_values(assignments):
+    '''{name: value} from NAME=VALUE strings'''
+
+    values = {}
+    for assignment in assignments:
+        name, separator, value = assignment.partition('=')
+        if not separator:
+            raise RenderError(f"Expected NAME=VALUE, not {assignment!r}")
+        values[name] = value
+    return values
+
+
+def load_matrix(filename):
+    '''The variable mappings listed in, or combined from, a matrix file'''
+
+    with open(filename) as matrix_file:
+        try:
+            matrix = load_blueprint(matrix_file.read())
+        except yaml.YAMLError as error:
+            raise RenderError(f"{filename}: {error}")
+
+    if isinstance(matrix, list):
+        for number, variables in enumerate(matrix, 1):
+            if not isinstance(variables, dict):
+                raise RenderError(f"{filename}: entry {number} of the "
+                                  f"matrix is not a mapping of variables")
+        return matrix
+    if isinstance(matrix, dict):
+        names = sorted(matrix)
+        choices = [matrix[name] if isinstance(matrix[name], list)
+                   else [matrix[name]] for name in names]
+        return [dict(zip(names, combination))
+                for combination in itertools.product(*choices)]
+    raise RenderError(f"{filename}: a matrix must be a list or a mapping")
+
+
+def render_matrix(renderer, venues, variable_sets, base=None):
+    '''Yield (venue, values, text) for each venue x variables combination'''
+
+    for venue in venues:
+        for variables in variable_sets:
+            values = dict(base or {}, **variables)
+            yield venue, values, renderer.render_text(venue, values)
+
+
+def main():
+    args = get_args()
+
+    try:
+        with open(args.blueprint) as blueprint:
+            renderer = Renderer(blueprint.read())
+
+        values = parse_values(args.values)
+        variable_sets = load_matrix(args.matrix) if args.matrix else [{}]
+
+        if not args.output_dir:
+            for venue, _, text in render_matrix(renderer, args.venue,
+                                                variable_sets, values):
+                sys.stdout.write(text)
+            return
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(args.blueprint))[0]
+        index = []
+        renderings = render_matrix(renderer, args.venue, variable_sets,
+                                   values)
+        for number, (venue, values, text) in enumerate(renderings, 1):
+            filename = f"{stem}-{venue}-{number}.yaml"
+            with open(os.path.join(args.output_dir, filename), 'w') as out:
+                out.write(text)
+            index.append({'file': filename, 'venue': venue,
+                          'variables': values})
+
+        with open(os.path.join(args.output_dir, 'index.yaml'), 'w') as out:
+            out.write(dump_blueprint(index))
+        print(f"Rendered {len(index)} blueprints into {args.output_dir}")
+
+    except (RenderError, yaml.YAMLError) as error:
+        print(f"{args.blueprint}: {error}", file=sys.stderr)
+        sys.exit(1)
+    except OSError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
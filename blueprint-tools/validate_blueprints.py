@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Validate Tuono blueprints locally, before they reach the portal.
+
+USAGE: ./validate_blueprints.py <blueprint or directory> [...]
+                                --workers <workers> (optional)
+                                --cache <cache.json> | --no-cache (optional)
+                                --format text|json (optional)
+
+Each blueprint is checked for:
+
+    sections        unknown top level sections
+    references      subnet -> network, subnet/nic -> firewall,
+                    firewall rule -> protocol, folder -> region,
+                    vm -> image, nic -> subnet, configure.secrets -> secret
+    variables       every (( variable )) is declared, declared variables
+                    are used, preset variables have a value for every venue
+                    listed under presets
+    ranges          network and subnet ranges are valid CIDRs, subnets lie
+                    inside their network and do not overlap each other
+
+Directories are searched for *.yaml and *.yml files, which are validated in
+parallel across all cores. Results are cached by the SHA-256 of each file's
+content, so unchanged files are not parsed again. The exit status is 1 when
+any blueprint has an error.
+'''
+
+import argparse
+import hashlib
+import ipaddress
+import json
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+
+from blueprint import INTERPOLATION
+from blueprint import SECTIONS
+from blueprint import VENUES
+from blueprint import find_blueprints
+from blueprint import interpolations
+from blueprint import load_blueprint
+from blueprint import section
+
+CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'tuono',
+                     'blueprint_validation.json')
+
+# Bump when the checks change, so that cached results are not reused
+RULES_VERSION = 1
+
+# Files handed to each worker process at a time
+CHUNK_SIZE = 16
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Validate Tuono blueprints')
+
+    parser.add_argument('paths', nargs='+',
+                        help='Blueprint files or directories of blueprints')
+
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+
+    parser.add_argument('--cache', default=CACHE,
+                        help='Cache of results by file content hash')
+
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Validate every file, ignoring the cache')
+
+    parser.add_argument('-f', '--format', choices=['text', 'json'],
+                        default='text',
+                        help='Report format')
+
+    return parser.parse_args()
+
+
+def problem(path, message, severity='error'):
+    return {'path': '.'.join(path), 'message': message,
+            'severity': severity}
+
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def parse_range(value, path, problems):
+    '''The network of a range, or None when it is interpolated or invalid'''
+
+    if not isinstance(value, str) or INTERPOLATION.search(value):
+        return None
+    try:
+        return ipaddress.ip_network(value)
+    except ValueError as error:
+        problems.append(problem(path, f"invalid range {value!r}: {error}"))
+        return None
+
+
+def check_sections(blueprint, problems):
+    for name in blueprint:
+        if name not in SECTIONS:
+            problems.append(problem((str(name),),
+                                    f"unknown section {name!r}", 'warning'))
+
+
+def check_variables(blueprint, problems):
+    variables = section(blueprint, 'variables')
+
+    used = set()
+    for path, name in interpolations(blueprint):
+        used.add(name)
+        if name not in variables:
+            problems.append(problem(path, f"undeclared variable {name!r}"))
+
+    for name in variables:
+        if name not in used:
+            problems.append(problem(('variables', name),
+                                    f"variable {name!r} is never used",
+                                    'warning'))
+
+    presets = section(blueprint, 'presets', 'venue')
+    preset_variables = [name for name, variable in variables.items()
+                        if isinstance(variable, dict) and variable.get('preset')]
+
+    for venue, values in presets.items():
+        path = ('presets', 'venue', str(venue))
+        if venue not in VENUES:
+            problems.append(problem(path, f"unknown venue {venue!r}"))
+        values = values if isinstance(values, dict) else {}
+        for name in values:
+            if name not in variables:
+                problems.append(problem(path + (name,),
+                                        f"preset for undeclared variable "
+                                        f"{name!r}"))
+            elif name not in preset_variables:
+                problems.append(problem(path + (name,),
+                                        f"variable {name!r} is not declared "
+                                        f"with preset: true"))
+        for name in preset_variables:
+            if name not in values:
+                problems.append(problem(path, f"no preset value for "
+                                              f"variable {name!r}"))
+
+    if preset_variables and not presets:
+        problems.append(problem(('presets',),
+                                f"variables {', '.join(preset_variables)} "
+                                f"are presets, but no presets are defined"))
+
+
+def check_location(blueprint, problems):
+    regions = section(blueprint, 'location', 'region')
+
+    for name, region in regions.items():
+        for venue in section(regions, name):
+            if venue not in VENUES:
+                problems.append(problem(('location', 'region', name, venue),
+                                        f"unknown venue {venue!r}"))
+
+    for name, folder in section(blueprint, 'location', 'folder').items():
+        region = folder.get('region') if isinstance(folder, dict) else None
+        path = ('location', 'folder', name, 'region')
+        if region is None:
+            problems.append(problem(path, "folder has no region"))
+        elif region not in regions:
+            problems.append(problem(path, f"unknown region {region!r}"))
+
+
+def check_networking(blueprint, problems):
+    networks = section(blueprint, 'networking', 'network')
+    subnets = section(blueprint, 'networking', 'subnet')
+    protocols = section(blueprint, 'networking', 'protocol')
+    firewalls = section(blueprint, 'networking', 'firewall')
+
+    ranges = {}
+    for name, network in networks.items():
+        if isinstance(network, dict):
+            ranges[name] = parse_range(network.get('range'),
+                                       ('networking', 'network', name,
+                                        'range'), problems)
+
+    # Subnet ranges by network, to find overlapping siblings
+    siblings = {}
+    for name, subnet in subnets.items():
+        if not isinstance(subnet, dict):
+            continue
+        path = ('networking', 'subnet', name)
+
+        network = subnet.get('network')
+        if network is None:
+            problems.append(problem(path + ('network',),
+                                    "subnet has no network"))
+        elif network not in networks:
+            problems.append(problem(path + ('network',),
+                                    f"unknown network {network!r}"))
+
+        for firewall in as_list(subnet.get('firewall')):
+            if firewall not in firewalls:
+                problems.append(problem(path + ('firewall',),
+                                        f"unknown firewall {firewall!r}"))
+
+        subnet_range = parse_range(subnet.get('range'), path + ('range',),
+                                   problems)
+        network_range = ranges.get(network)
+        if subnet_range is None or network_range is None:
+            continue
+        if subnet_range.version != network_range.version or \
+                not subnet_range.subnet_of(network_range):
+            problems.append(problem(path + ('range',),
+                                    f"{subnet_range} is not inside network "
+                                    f"{network!r} ({network_range})"))
+            continue
+        for other, other_range in siblings.get(network, []):
+            if subnet_range.overlaps(other_range):
+                problems.append(problem(path + ('range',),
+                                        f"{subnet_range} overlaps subnet "
+                                        f"{other!r} ({other_range})"))
+        siblings.setdefault(network, []).append((name, subnet_range))
+
+    for name, firewall in firewalls.items():
+        rules = firewall.get('rules') if isinstance(firewall, dict) else None
+        for index, rule in enumerate(as_list(rules)):
+            if not isinstance(rule, dict):
+                continue
+            path = ('networking', 'firewall', name, 'rules', str(index),
+                    'protocols')
+            for protocol in as_list(rule.get('protocols')):
+                if protocol not in protocols:
+                    problems.append(problem(path, f"unknown protocol "
+                                                  f"{protocol!r}"))
+
+
+def check_compute(blueprint, problems):
+    images = section(blueprint, 'compute', 'image')
+    subnets = section(blueprint, 'networking', 'subnet')
+    firewalls = section(blueprint, 'networking', 'firewall')
+    secrets = section(blueprint, 'security', 'secret')
+
+    for name, vm in section(blueprint, 'compute', 'vm').items():
+        if not isinstance(vm, dict):
+            continue
+        path = ('compute', 'vm', name)
+
+        image = vm.get('image')
+        if image is not None and image not in images:
+            problems.append(problem(path + ('image',),
+                                    f"unknown image {image!r}"))
+
+        for nic_name, nic in section(vm, 'nics').items():
+            if not isinstance(nic, dict):
+                continue
+            nic_path = path + ('nics', nic_name)
+            subnet = nic.get('subnet')
+            if subnet is not None and subnet not in subnets:
+                problems.append(problem(nic_path + ('subnet',),
+                                        f"unknown subnet {subnet!r}"))
+            for firewall in as_list(nic.get('firewall')):
+                if firewall not in firewalls:
+                    problems.append(problem(nic_path + ('firewall',),
+                                            f"unknown firewall "
+                                            f"{firewall!r}"))
+
+        for secret in as_list(section(vm, 'configure').get('secrets')):
+            if secret not in secrets:
+                problems.append(problem(path + ('configure', 'secrets'),
+                                        f"unknown secret {secret!r}"))
+
+
+CHECKS = [check_sections, check_variables, check_location, check_networking,
+          check_compute]
+
+
+def validate(text):
+    '''The problems found in the text of a blueprint'''
+
+    try:
+        blueprint = load_blueprint(text)
+    except Exception as error:
+        return [problem((), f"not valid YAML: {error}")]
+
+    if not isinstance(blueprint, dict):
+        return [problem((), "a blueprint must be a mapping of sections")]
+
+    problems = []
+    for check in CHECKS:
+        check(blueprint, problems)
+    return problems
+
+
+def validate_file(filename):
+    with open(filename, 'rb') as blueprint:
+        return validate(blueprint.read())
+
+
+def content_hash(data):
+    return hashlib.sha256(
+        f"{RULES_VERSION}:".encode() + data).hexdigest()
+
+
+def load_cache(filename):
+    try:
+        with open(filename) as cache:
+            return json.load(cache)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(filename, cache):
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    temporary = f"{filename}.tmp"
+    with open(temporary, 'w') as output:
+        json.dump(cache, output)
+    os.replace(temporary, filename)
+
+
+def validate_files(filenames, workers, cache=None):
+    '''{filename: problems}, validating the files not in the cache'''
+
+    results = {}
+    digests = {}
+    todo = []
+    for filename in filenames:
+        with open(filename, 'rb') as blueprint:
+            digest = content_hash(blueprint.read())
+        digests[filename] = digest
+        if cache is not None and digest in cache:
+            results[filename] = cache[digest]
+        else:
+            todo.append(filename)
+
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            problems = executor.map(validate_file, todo,
+                                    chunksize=CHUNK_SIZE)
+            results.update(zip(todo, problems))
+    else:
+        results.update((filename, validate_file(filename))
+                       for filename in todo)
+
+    if cache is not None:
+        for filename in todo:
+            cache[digests[filename]] = results[filename]
+
+    return results, len(todo)
+
+
+def main():
+    args = get_args()
+
+    filenames = find_blueprints(args.paths)
+    cache = None if args.no_cache else load_cache(args.cache)
+
+    results, validated = validate_files(filenames, args.workers, cache)
+
+    if cache is not None:
+        save_cache(args.cache, cache)
+
+    errors = 0
+    if args.format == 'json':
+        print(json.dumps(results, indent=2, sort_keys=True))
+    for filename in filenames:
+        for found in results[filename]:
+            if found['severity'] == 'error':
+                errors += 1
+            if args.format == 'text':
+                location = f":{found['path']}" if found['path'] else ''
+                print(f"{filename}{location}: {found['severity']}: "
+                      f"{found['message']}")
+
+    if args.format == 'text':
+        print(f"{len(filenames)} blueprints, {validated} validated, "
+              f"{len(filenames) - validated} unchanged, {errors} errors",
+              file=sys.stderr)
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
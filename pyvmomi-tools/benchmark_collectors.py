@@ -0,0 +1,136 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+Benchmark the inventory collection strategies against a synthetic vCenter
+(see fake_vcenter), reporting for each the wall time, the number of calls
+that would have been SOAP round trips and the peak Python memory use.
+
+    ./benchmark_collectors.py --datacenters 2 --clusters 4 --hosts 8 \
+        --vms 20 --disks 2 --latency-ms 1
+'''
+
+import argparse
+import os
+import time
+import tracemalloc
+
+from build_data_dictionary import walk_inventory
+from datastore_index import build_datastore_index
+from emitters import emit_json_lines
+from fake_vcenter import FakeVCenter
+from network_index import build_network_index
+from property_collector import collect_inventory
+from property_collector import iter_vm_records
+
+
+def serial(content):
+    '''
+    The original walk, dereferencing every property in turn
+    '''
+    walk_inventory(content)
+
+
+def serial_indexed(content):
+    walk_inventory(content, build_datastore_index(content),
+                   build_network_index(content))
+
+
+def bulk(content):
+    collect_inventory(content,
+                      datastore_index=build_datastore_index(content),
+                      network_index=build_network_index(content))
+
+
+def bulk_stream(content):
+    records = iter_vm_records(content,
+                              datastore_index=build_datastore_index(content),
+                              network_index=build_network_index(content))
+    with open(os.devnull, 'w') as stream:
+        emit_json_lines(records, stream)
+
+
+STRATEGIES = [('serial', serial),
+              ('serial-indexed', serial_indexed),
+              ('bulk', bulk),
+              ('bulk-stream', bulk_stream)]
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the collectors against a synthetic vCenter'
+    )
+
+    parser.add_argument('--datacenters', type=int, default=1)
+    parser.add_argument('--clusters', type=int, default=2,
+                        help='Clusters per datacenter')
+    parser.add_argument('--hosts', type=int, default=4,
+                        help='Hosts per cluster')
+    parser.add_argument('--vms', type=int, default=10,
+                        help='VMs per host')
+    parser.add_argument('--disks', type=int, default=2,
+                        help='Disks per VM')
+    parser.add_argument('--nics', type=int, default=1,
+                        help='NICs per VM')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Simulated latency of each SOAP call')
+    parser.add_argument('--strategy', action='append',
+                        choices=[name for name, _ in STRATEGIES],
+                        help='Strategy to run (default: all); may be '
+                             'repeated')
+    args = parser.parse_args()
+    return args
+
+
+def measure(vcenter, strategy):
+    '''
+    Returns (seconds, SOAP calls, peak bytes) for one run of strategy
+    '''
+    vcenter.stub.reset()
+    tracemalloc.start()
+    start = time.perf_counter()
+    strategy(vcenter.service_instance.RetrieveContent())
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, vcenter.stub.call_count(), peak
+
+
+def main():
+    args = get_args()
+    vcenter = FakeVCenter(datacenters=args.datacenters,
+                          clusters=args.clusters, hosts=args.hosts,
+                          vms=args.vms, disks=args.disks, nics=args.nics,
+                          latency=args.latency_ms / 1000.0)
+    vm_count = args.datacenters * args.clusters * args.hosts * args.vms
+    print('%d VMs, %d disks and %d NICs each, %.1fms per call\n' %
+          (vm_count, args.disks, args.nics, args.latency_ms))
+
+    print('%-16s %10s %12s %12s' % ('strategy', 'seconds', 'SOAP calls',
+                                    'peak MiB'))
+    for name, strategy in STRATEGIES:
+        if args.strategy and name not in args.strategy:
+            continue
+        elapsed, calls, peak = measure(vcenter, strategy)
+        print('%-16s %10.3f %12d %12.1f' % (name, elapsed, calls,
+                                            peak / 1024.0 ** 2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+Generate Tuono blueprints (see blog_blueprints/) from collected inventory.
+
+The input is the output of build_data_dictionary in any of its formats.
+VMs with the same shape (cores, memory, image, disks and networks) are
+grouped into a single compute.vm definition with a count, images are
+deduplicated by guest OS and every port group a VM is attached to becomes a
+networking.subnet. Grouping is done with dictionaries keyed by shape, so an
+estate is converted in a single pass.
+
+The first virtual disk of a VM is taken to be its boot disk, which a
+blueprint provisions from the image, so only the remaining disks are
+listed. Values which cannot be derived from vSphere are set to 'XXXX'.
+'''
+
+import argparse
+import ipaddress
+import math
+import os
+import re
+import sys
+
+from emitters import dump_yaml
+from emitters import read_records
+from utilities import parse_storage_size
+
+PLACEHOLDER = 'XXXX'
+
+DEFAULT_SUBNET = 'default'
+
+# Address space from which subnets whose range is unknown are allocated
+UNALLOCATED_SPACE = ipaddress.ip_network('10.0.0.0/8')
+
+# (guest OS substring, publisher, product, sku)
+GUEST_IMAGES = [
+    ('Ubuntu', 'Canonical', 'UbuntuServer', PLACEHOLDER),
+    ('Windows Server 2019', 'MicrosoftWindowsServer', 'WindowsServer',
+     '2019-Datacenter'),
+    ('Windows Server 2016', 'MicrosoftWindowsServer', 'WindowsServer',
+     '2016-Datacenter'),
+    ('Windows Server 2012', 'MicrosoftWindowsServer', 'WindowsServer',
+     '2012-R2-Datacenter'),
+    ('Red Hat Enterprise Linux', 'RedHat', 'RHEL', PLACEHOLDER),
+    ('CentOS', 'OpenLogic', 'CentOS', PLACEHOLDER),
+    ('SUSE Linux Enterprise', 'SUSE', 'sles', PLACEHOLDER),
+    ('Debian', 'Debian', 'debian', PLACEHOLDER),
+]
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Generate Tuono blueprints from collected inventory'
+    )
+
+    parser.add_argument('inventory',
+                        help="Output of build_data_dictionary, or '-' for "
+                             "stdin")
+    parser.add_argument('-d', '--per-cluster',
+                        action='store', metavar='DIRECTORY',
+                        help='Write one blueprint per cluster to DIRECTORY '
+                             'instead of one blueprint to stdout')
+    parser.add_argument('--aws-region',
+                        default=PLACEHOLDER,
+                        help='AWS region for the generated location')
+    parser.add_argument('--azure-region',
+                        default=PLACEHOLDER,
+                        help='Azure region for the generated location')
+    args = parser.parse_args()
+    return args
+
+
+def slugify(name):
+    return re.sub(r'[^a-z0-9]+', '-', str(name).lower()).strip('-')
+
+
+def natural_key(label):
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', label)]
+
+
+def to_gb(size_in_bytes):
+    return int(math.ceil(size_in_bytes / 1024.0 ** 3))
+
+
+def memory_in_gb(memory):
+    '''
+    ComputeSpec reports memory as e.g. '4.0Gb'
+    '''
+    return '%g GB' % float(memory[:-len('Gb')])
+
+
+def image_definition(guest):
+    for match, publisher, product, sku in GUEST_IMAGES:
+        if match in guest:
+            break
+    else:
+        publisher, product, sku = PLACEHOLDER, PLACEHOLDER, PLACEHOLDER
+    return {'publisher': publisher,
+            'product': product,
+            'sku': sku,
+            'venue': {'aws': {'image_id': PLACEHOLDER}}}
+
+
+class BlueprintBuilder:
+    '''
+    Accumulates VM records into the stanzas of a blueprint
+    '''
+
+    def __init__(self, folder, aws_region=PLACEHOLDER,
+                 azure_region=PLACEHOLDER):
+        self.folder = slugify(folder)
+        self.aws_region = aws_region
+        self.azure_region = azure_region
+        self.images = {}
+        self.subnets = {}
+        self.shapes = {}
+        self.shape_names = set()
+
+    def image(self, guest):
+        guest = guest or 'unknown'
+        name = slugify(guest)
+        if name not in self.images:
+            self.images[name] = image_definition(guest)
+        return name
+
+    def subnet(self, nic):
+        network = nic.get('network') or DEFAULT_SUBNET
+        name = slugify(network)
+        if name not in self.subnets:
+            self.subnets[name] = nic.get('subnet')
+        elif self.subnets[name] is None:
+            self.subnets[name] = nic.get('subnet')
+        return name
+
+    def add(self, record):
+        vm = record['compute']['vm']
+
+        image = self.image(vm.get('image'))
+
+        disks = []
+        labels = sorted(vm.get('disks', {}), key=natural_key)
+        for label in labels[1:]:
+            size = parse_storage_size(vm['disks'][label]['size'])
+            disks.append((slugify(label), to_gb(size)))
+
+        nics = []
+        vm_nics = vm.get('nics')
+        if isinstance(vm_nics, dict) and vm_nics:
+            for label in sorted(vm_nics, key=natural_key):
+                nics.append((slugify(label), self.subnet(vm_nics[label])))
+        else:
+            nics.append(('nic-1', self.subnet({})))
+
+        shape = (vm['cores'], memory_in_gb(vm['memory']), image,
+                 tuple(disks), tuple(nics))
+        if shape in self.shapes:
+            self.shapes[shape]['count'] += 1
+        else:
+            self.shapes[shape] = {'name': self.shape_name(shape),
+                                  'count': 1}
+
+    def shape_name(self, shape):
+        cores, memory, image, _, _ = shape
+        base = '%s-%dcpu-%sgb' % (image, cores,
+                                  slugify(memory.split()[0]))
+        name = base
+        suffix = 1
+        while name in self.shape_names:
+            suffix += 1
+            name = '%s-%d' % (base, suffix)
+        self.shape_names.add(name)
+        return name
+
+    def subnet_ranges(self):
+        '''
+        Returns {subnet name: network}, allocating a /24 for each subnet
+        whose range is unknown from space not used by the known ones
+        '''
+        ranges = {}
+        for name, cidr in self.subnets.items():
+            if cidr is not None:
+                ranges[name] = ipaddress.ip_network(cidr, strict=False)
+
+        used = list(ranges.values())
+        candidates = UNALLOCATED_SPACE.subnets(new_prefix=24)
+        for name in sorted(self.subnets):
+            if name in ranges:
+                continue
+            for candidate in candidates:
+                if not any(candidate.overlaps(network) for network in used):
+                    ranges[name] = candidate
+                    used.append(candidate)
+                    break
+        return ranges
+
+    def networking(self):
+        networks = {}
+        subnets = {}
+        for name, subnet_range in self.subnet_ranges().items():
+            network_range = supernet(subnet_range)
+            network_name = 'network-' + slugify(str(network_range))
+            networks[network_name] = {'range': str(network_range),
+                                      'scope': 'private'}
+            subnets[name] = {'range': str(subnet_range),
+                             'network': network_name,
+                             'scope': 'private'}
+        return {'network': networks, 'subnet': subnets}
+
+    def blueprint(self):
+        vms = {}
+        for shape, group in self.shapes.items():
+            cores, memory, image, disks, nics = shape
+            vm = {'cores': cores,
+                  'memory': memory,
+                  'image': image,
+                  'count': group['count']}
+            if disks:
+                vm['disks'] = dict((label, {'size': '%d GB' % size})
+                                   for label, size in disks)
+            vm['nics'] = dict((label,
+                               {'ips': [{'private': {'type': 'dynamic'}}],
+                                'subnet': subnet})
+                              for label, subnet in nics)
+            vms[group['name']] = vm
+
+        return {'location': {'region': {'vsphere': {
+                                 'aws': self.aws_region,
+                                 'azure': self.azure_region}},
+                             'folder': {self.folder: {
+                                 'region': 'vsphere'}}},
+                'networking': self.networking(),
+                'compute': {'image': self.images,
+                            'vm': vms}}
+
+
+def supernet(network):
+    '''
+    The private address block containing a subnet, or the /16 around it
+    '''
+    for block in ['10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16']:
+        block = ipaddress.ip_network(block)
+        if network.subnet_of(block):
+            return block
+    if network.prefixlen > 16:
+        return network.supernet(new_prefix=16)
+    return network
+
+
+def generate(records, per_cluster=False, aws_region=PLACEHOLDER,
+             azure_region=PLACEHOLDER):
+    '''
+    Returns {name: blueprint}, with one blueprint per cluster or a single
+    blueprint named 'vsphere'
+    '''
+    builders = {}
+    for record in records:
+        if per_cluster:
+            name = slugify('%s-%s' % (record['datacenter'],
+                                      record['cluster']))
+        else:
+            name = 'vsphere'
+        if name not in builders:
+            builders[name] = BlueprintBuilder(name, aws_region, azure_region)
+        builders[name].add(record)
+
+    return dict((name, builder.blueprint())
+                for name, builder in builders.items())
+
+
+def main():
+    args = get_args()
+
+    if args.inventory == '-':
+        records = read_records(sys.stdin)
+        blueprints = generate(records, bool(args.per_cluster),
+                              args.aws_region, args.azure_region)
+    else:
+        with open(args.inventory) as stream:
+            blueprints = generate(read_records(stream),
+                                  bool(args.per_cluster),
+                                  args.aws_region, args.azure_region)
+
+    if not args.per_cluster:
+        for blueprint in blueprints.values():
+            print('---')
+            print(dump_yaml(blueprint))
+        return
+
+    os.makedirs(args.per_cluster, exist_ok=True)
+    for name, blueprint in blueprints.items():
+        filename = os.path.join(args.per_cluster, name + '.yaml')
+        with open(filename, 'w') as output:
+            output.write('---\n')
+            output.write(dump_yaml(blueprint))
+
+if __name__ == '__main__':
+    main()
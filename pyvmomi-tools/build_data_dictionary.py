@@ -22,46 +22,220 @@ Build a data structure representing configurations for virtual machines
 on a per-cluster basis
 '''
 
-import json
-import yaml
+import sys
 
-from pyVmomi import vim
-from pyVmomi import vmodl
-from pyVim import connect
+from lazy import vim
 
+from login import build_arg_parser
 from login import get_service_instance
 from compute_spec import ComputeSpec
+from datastore_index import build_datastore_index
+from network_index import build_network_index
+from emitters import FORMATS
+from emitters import dump_yaml
+from emitters import emit_records
+from property_collector import collect_inventory
+from property_collector import iter_vm_records
+from property_collector import make_record
+from property_collector import retrieve_properties
+from scope import add_scope_arguments
+from scope import scope_from_args
+
+
+def get_args():
+    parser = build_arg_parser()
+    parser.add_argument('--strategy',
+                        choices=['bulk', 'serial'], default='bulk',
+                        help='Retrieve the inventory in bulk with the '
+                             'PropertyCollector (default) or by walking '
+                             'each managed object in turn')
+    parser.add_argument('--format',
+                        choices=FORMATS, default='yaml',
+                        help='Output one nested YAML document (default), or '
+                             'stream one record per VM as JSON Lines or as '
+                             'YAML documents')
+    parser.add_argument('--capacity-report',
+                        metavar='FILE',
+                        help='Also write a capacity and right-sizing report '
+                             '(see capacity_report) to FILE')
+    add_scope_arguments(parser)
+    return parser.parse_args()
+
+
+def iter_children(folder, entity_type):
+    '''
+    Yields the entities of a type below a folder, looking inside nested
+    folders
+    '''
+    for child in folder.childEntity:
+        if isinstance(child, vim.Folder):
+            for entity in iter_children(child, entity_type):
+                yield entity
+        elif isinstance(child, entity_type):
+            yield child
+
+
+def vm_folder_path(vm):
+    '''
+    The path of a VM's folder below its datacenter's VM folder
+    '''
+    names = []
+    folder = vm.parent
+    while isinstance(folder, vim.Folder):
+        names.append(folder.name)
+        folder = folder.parent
+    return '/'.join(reversed(names[:-1]))
+
+
+def walk_selects_vm(scope, vm):
+    '''
+    Scope.selects_vm for the serial walk, dereferencing only the properties
+    the scope tests
+    '''
+    return scope.selects_vm(
+        vm.name,
+        folder=vm_folder_path(vm) if scope.folders else None,
+        tags=[tag.key for tag in vm.tag] if scope.tags else (),
+        power_state=vm.runtime.powerState if scope.powered_on else None,
+        uuid=vm_instance_uuid(vm) if scope.shard else None)
+
+
+def vm_instance_uuid(vm):
+    '''
+    The instance UUID of a VM, or None while its configuration is
+    unavailable (e.g. an inaccessible VM), in which case Scope shards it by
+    name like the bulk collector does
+    '''
+    config = vm.config
+    return config.instanceUuid if config is not None else None
+
+
+def selected_datacenters(content, scope):
+    '''
+    The datacenters the scope selects, or None when it selects them all, to
+    root the datastore and network indexes at
+    '''
+    if not scope.datacenters:
+        return None
+    datacenter_specs = {vim.Datacenter: ['name']}
+    return [datacenter for datacenter, properties
+            in retrieve_properties(content, datacenter_specs)
+            if scope.selects_datacenter(properties['name'])]
+
+
+def walk_hosts(content, scope=None):
+    '''
+    Yields (datacenter, cluster, host) for every host in scope. Datacenters
+    and clusters may sit in nested folders, and standalone hosts are
+    reported under their ComputeResource.
+    '''
+    for dc in iter_children(content.rootFolder, vim.Datacenter):
+        if scope is not None and not scope.selects_datacenter(dc.name):
+            continue
+        for cluster in iter_children(dc.hostFolder, vim.ComputeResource):
+            if scope is not None and \
+                    not scope.selects_location(dc.name, cluster.name):
+                continue
+            for host in cluster.host:
+                yield dc, cluster, host
+
+
+def walk_vms(host, scope=None):
+    for vm in host.vm:
+        if scope is None or scope.is_everything() or \
+                walk_selects_vm(scope, vm):
+            yield vm
+
+
+def walk_inventory(content, datastore_index=None, network_index=None,
+                   capacity=None, scope=None):
+    data_dict = {}
+    for dc in iter_children(content.rootFolder, vim.Datacenter):
+        if scope is None or scope.selects_datacenter(dc.name):
+            data_dict[dc.name] = {}
+
+    for dc, cluster, host in walk_hosts(content, scope):
+        hostname = host.summary.config.name
+        data_dict[dc.name].setdefault(cluster.name, {})[hostname] = {}
+
+        for vm in walk_vms(host, scope):
+            compute_spec = ComputeSpec(vm,
+                                       datastore_index=datastore_index,
+                                       network_index=network_index)
+            vmname = vm.summary.config.name
+            if capacity is not None:
+                capacity.add_vm_record(dc.name, cluster.name, hostname,
+                                       vmname, compute_spec.record)
+            data_dict[dc.name][cluster.name][hostname][vmname] = {}
+            vm_dict = data_dict[dc.name][cluster.name][hostname][vmname]
+            vm_dict['compute'] = compute_spec.record
+
+    return data_dict
+
+
+def walk_records(content, datastore_index=None, network_index=None,
+                 capacity=None, scope=None):
+    for dc, cluster, host in walk_hosts(content, scope):
+        hostname = host.summary.config.name
+        for vm in walk_vms(host, scope):
+            compute_spec = ComputeSpec(vm,
+                                       datastore_index=datastore_index,
+                                       network_index=network_index)
+            vmname = vm.summary.config.name
+            if capacity is not None:
+                capacity.add_vm_record(dc.name, cluster.name, hostname,
+                                       vmname, compute_spec.record)
+            uuid = vm.config.instanceUuid
+            yield make_record(dc.name, cluster.name, hostname,
+                              vmname, uuid, compute_spec.record)
+
 
 def main():
-    si = get_service_instance()
+    args = get_args()
+    si = get_service_instance(args)
     if not si:
         raise Exception('Authentication failed ...... please check your \
                         credentials and try again')
 
     content = si.RetrieveContent()
-    data_dict = {}
-    datacenters = content.rootFolder.childEntity
-    for dc in datacenters:
-        data_dict[dc.name] = {}
-        clusters = dc.hostFolder.childEntity
-
-        for cluster in clusters:
-            data_dict[dc.name][cluster.name] = {}
-            hosts = cluster.host
-
-            for host in hosts:
-                hostname = host.summary.config.name
-                data_dict[dc.name][cluster.name][hostname] = {}
-                vms = host.vm
-
-                for vm in vms:
-                    compute_spec = ComputeSpec(vm)
-                    vmname = vm.summary.config.name
-                    data_dict[dc.name][cluster.name][hostname][vmname] = {}
-                    vm_dict = data_dict[dc.name][cluster.name][hostname][vmname]
-                    vm_dict['compute'] = compute_spec.as_dictionary()
-
-    print(yaml.dump(data_dict))
+    scope = scope_from_args(args)
+
+    datacenters = selected_datacenters(content, scope)
+    datastore_index = build_datastore_index(content, datacenters)
+    network_index = build_network_index(content, datacenters)
+
+    capacity = None
+    if args.capacity_report:
+        # NumPy is only needed for the report
+        from capacity_report import InventoryTable
+        capacity = InventoryTable()
+
+    if args.format != 'yaml':
+        if args.strategy == 'serial':
+            records = walk_records(content, datastore_index, network_index,
+                                   capacity, scope)
+        else:
+            records = iter_vm_records(content,
+                                      datastore_index=datastore_index,
+                                      network_index=network_index,
+                                      capacity=capacity, scope=scope)
+        emit_records(records, sys.stdout, args.format)
+    else:
+        if args.strategy == 'serial':
+            data_dict = walk_inventory(content, datastore_index,
+                                       network_index, capacity, scope)
+        else:
+            data_dict = collect_inventory(content,
+                                          datastore_index=datastore_index,
+                                          network_index=network_index,
+                                          capacity=capacity, scope=scope)
+
+        print(dump_yaml(data_dict))
+
+    if capacity is not None:
+        from capacity_report import capacity_report
+        with open(args.capacity_report, 'w') as report:
+            report.write(dump_yaml(capacity_report(capacity)))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,322 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+
+'''
+Capacity and right-sizing report over collected inventory.
+
+VMs are held in a columnar InventoryTable: one NumPy array per numeric
+column (cores, memory, disk and SSD capacity) and integer codes for the
+datacenter, cluster and host of each VM. The table is filled either from
+the records.VmRecord of each VM during collection (see build_data_dictionary
+--capacity-report) or, when reading the output of build_data_dictionary, by
+parsing its display strings once on load.
+
+The report totals cores, memory and disk per cluster and per host with
+np.bincount, and matches every VM to the smallest AWS and Azure instance
+size that fits it by comparing the VM columns against the whole instance
+catalogue at once. The matched sizes give the number_of_cores and
+memory_in_gb values used in the presets.venue tables of a blueprint.
+'''
+
+import argparse
+import array
+import sys
+
+from lazy import numpy as np
+
+from emitters import dump_yaml
+from emitters import read_records
+from records import VmRecord
+from utilities import parse_storage_size
+
+GIB = 1024.0 ** 3
+
+# (instance size, vCPUs, memory in GiB) of the general purpose, compute
+# and memory optimised families
+INSTANCE_TYPES = {
+    'aws': [
+        ('t3.nano', 2, 0.5), ('t3.micro', 2, 1), ('t3.small', 2, 2),
+        ('t3.medium', 2, 4),
+        ('c5.large', 2, 4), ('c5.xlarge', 4, 8), ('c5.2xlarge', 8, 16),
+        ('c5.4xlarge', 16, 32), ('c5.9xlarge', 36, 72),
+        ('c5.18xlarge', 72, 144),
+        ('m5.large', 2, 8), ('m5.xlarge', 4, 16), ('m5.2xlarge', 8, 32),
+        ('m5.4xlarge', 16, 64), ('m5.8xlarge', 32, 128),
+        ('m5.12xlarge', 48, 192), ('m5.16xlarge', 64, 256),
+        ('m5.24xlarge', 96, 384),
+        ('r5.large', 2, 16), ('r5.xlarge', 4, 32), ('r5.2xlarge', 8, 64),
+        ('r5.4xlarge', 16, 128), ('r5.8xlarge', 32, 256),
+        ('r5.12xlarge', 48, 384), ('r5.16xlarge', 64, 512),
+        ('r5.24xlarge', 96, 768),
+    ],
+    'azure': [
+        ('Standard_B1s', 1, 1), ('Standard_B1ms', 1, 2),
+        ('Standard_B2s', 2, 4), ('Standard_B2ms', 2, 8),
+        ('Standard_F2s_v2', 2, 4), ('Standard_F4s_v2', 4, 8),
+        ('Standard_F8s_v2', 8, 16), ('Standard_F16s_v2', 16, 32),
+        ('Standard_F32s_v2', 32, 64), ('Standard_F64s_v2', 64, 128),
+        ('Standard_D2s_v3', 2, 8), ('Standard_D4s_v3', 4, 16),
+        ('Standard_D8s_v3', 8, 32), ('Standard_D16s_v3', 16, 64),
+        ('Standard_D32s_v3', 32, 128), ('Standard_D48s_v3', 48, 192),
+        ('Standard_D64s_v3', 64, 256),
+        ('Standard_E2s_v3', 2, 16), ('Standard_E4s_v3', 4, 32),
+        ('Standard_E8s_v3', 8, 64), ('Standard_E16s_v3', 16, 128),
+        ('Standard_E32s_v3', 32, 256), ('Standard_E48s_v3', 48, 384),
+        ('Standard_E64s_v3', 64, 432),
+    ],
+}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Capacity and right-sizing report for collected '
+                    'inventory'
+    )
+
+    parser.add_argument('inventory',
+                        help="Output of build_data_dictionary, or '-' for "
+                             "stdin")
+    parser.add_argument('--per-vm',
+                        action='store_true',
+                        help='Also list the instance sizes of every VM')
+    args = parser.parse_args()
+    return args
+
+
+def memory_in_mb(memory):
+    '''
+    ComputeSpec reports memory as e.g. '4.0Gb'
+    '''
+    return float(memory[:-len('Gb')]) * 1024
+
+
+class Labels:
+    '''
+    Integer codes for repeated strings, such as cluster names
+    '''
+
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def code(self, name):
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+
+class InventoryTable:
+    '''
+    Columnar VM table. Rows are appended to compact typed arrays, which
+    columns() exposes as NumPy arrays without copying.
+    '''
+
+    def __init__(self):
+        self.clusters = Labels()
+        self.hosts = Labels()
+        self.vms = []
+        self.cluster_codes = array.array('i')
+        self.host_codes = array.array('i')
+        self.cores = array.array('i')
+        self.memory_mb = array.array('d')
+        self.disk_bytes = array.array('d')
+        self.ssd_bytes = array.array('d')
+
+    def __len__(self):
+        return len(self.vms)
+
+    def add(self, datacenter, cluster, host, vmname, cores, memory_mb,
+            disks):
+        '''
+        disks is a list of (capacity in bytes, on SSD) pairs
+        '''
+        cluster_key = (datacenter, cluster)
+        self.cluster_codes.append(self.clusters.code(cluster_key))
+        self.host_codes.append(self.hosts.code(cluster_key + (host,)))
+        self.vms.append((datacenter, cluster, host, vmname))
+        self.cores.append(cores or 0)
+        self.memory_mb.append(memory_mb or 0)
+        self.disk_bytes.append(sum(size for size, ssd in disks))
+        self.ssd_bytes.append(sum(size for size, ssd in disks if ssd))
+
+    def add_vm_record(self, datacenter, cluster, host, vmname, vm_record):
+        self.add(datacenter, cluster, host, vmname, vm_record.cores,
+                 vm_record.memory_mb,
+                 [(disk.capacity_bytes, disk.ssd)
+                  for disk in vm_record.disks])
+
+    def add_record(self, record):
+        '''
+        Add a record read back from build_data_dictionary output, parsing
+        its display strings
+        '''
+        if isinstance(record['compute'], VmRecord):
+            self.add_vm_record(record['datacenter'], record['cluster'],
+                               record['host'], record['vm'],
+                               record['compute'])
+            return
+
+        vm = record['compute']['vm']
+        disks = [(parse_storage_size(disk['size']),
+                  disk.get('type') == 'ssd')
+                 for disk in (vm.get('disks') or {}).values()]
+        self.add(record['datacenter'], record['cluster'], record['host'],
+                 record['vm'], vm.get('cores'),
+                 memory_in_mb(vm['memory']) if vm.get('memory') else 0,
+                 disks)
+
+    def columns(self):
+        return {'cluster': np.frombuffer(self.cluster_codes, dtype=np.intc),
+                'host': np.frombuffer(self.host_codes, dtype=np.intc),
+                'cores': np.frombuffer(self.cores, dtype=np.intc),
+                'memory_mb': np.frombuffer(self.memory_mb),
+                'disk_bytes': np.frombuffer(self.disk_bytes),
+                'ssd_bytes': np.frombuffer(self.ssd_bytes)}
+
+
+def catalogue(venue):
+    '''
+    The instance sizes of a venue as arrays, cheapest first
+    '''
+    names, cores, memory = zip(*INSTANCE_TYPES[venue])
+    cores = np.array(cores)
+    memory_gb = np.array(memory, dtype=float)
+    # Order by size, taking a vCPU to cost about as much as 4 GiB
+    order = np.lexsort((memory_gb, cores, cores * 4 + memory_gb))
+    return np.array(names)[order], cores[order], memory_gb[order]
+
+
+def match_instances(cores, memory_gb, venue):
+    '''
+    The index into the catalogue of the smallest instance size that fits
+    each VM, and whether the VM fits any size at all
+    '''
+    names, instance_cores, instance_memory = catalogue(venue)
+    fits = (instance_cores[np.newaxis, :] >= cores[:, np.newaxis]) & \
+           (instance_memory[np.newaxis, :] >= memory_gb[:, np.newaxis])
+    fitted = fits.any(axis=1)
+    # The first fitting size is the cheapest; VMs larger than every size
+    # get the largest, which callers must mask out with fitted
+    choice = np.where(fitted, fits.argmax(axis=1), len(names) - 1)
+    return names, instance_cores, instance_memory, choice, fitted
+
+
+def totals(columns, codes, count):
+    '''
+    Sum the numeric columns grouped by codes
+    '''
+    return {'vms': np.bincount(codes, minlength=count),
+            'cores': np.bincount(codes, columns['cores'], count),
+            'memory_gb': np.bincount(codes, columns['memory_mb'],
+                                     count) / 1024,
+            'disk_gb': np.bincount(codes, columns['disk_bytes'],
+                                   count) / GIB,
+            'ssd_gb': np.bincount(codes, columns['ssd_bytes'], count) / GIB}
+
+
+def group_report(names, sums):
+    report = {}
+    for index, name in enumerate(names):
+        report['/'.join(name)] = {
+            'vms': int(sums['vms'][index]),
+            'cores': int(sums['cores'][index]),
+            'memory_gb': round(float(sums['memory_gb'][index]), 1),
+            'disk_gb': round(float(sums['disk_gb'][index]), 1),
+            'ssd_gb': round(float(sums['ssd_gb'][index]), 1)}
+    return report
+
+
+def capacity_report(table, per_vm=False):
+    '''
+    Aggregates per cluster and host, and instance sizes per venue
+    '''
+    columns = table.columns()
+    cores = columns['cores']
+    memory_gb = columns['memory_mb'] / 1024
+
+    report = {
+        'totals': {'vms': len(table),
+                   'cores': int(cores.sum()),
+                   'memory_gb': round(float(memory_gb.sum()), 1),
+                   'disk_gb': round(float(columns['disk_bytes'].sum() /
+                                          GIB), 1),
+                   'ssd_gb': round(float(columns['ssd_bytes'].sum() /
+                                         GIB), 1)},
+        'clusters': group_report(table.clusters.names,
+                                 totals(columns, columns['cluster'],
+                                        len(table.clusters.names))),
+        'hosts': group_report(table.hosts.names,
+                              totals(columns, columns['host'],
+                                     len(table.hosts.names))),
+        'instances': {}}
+
+    presets = {}
+    for venue in sorted(INSTANCE_TYPES):
+        names, instance_cores, instance_memory, choice, fitted = \
+            match_instances(cores, memory_gb, venue)
+        counts = np.bincount(choice[fitted], minlength=len(names))
+        report['instances'][venue] = dict(
+            (str(names[index]), int(counts[index]))
+            for index in np.flatnonzero(counts))
+        oversized = int(len(fitted) - fitted.sum())
+        if oversized:
+            report['instances'][venue]['larger than any size'] = oversized
+        presets[venue] = (names[choice], instance_cores[choice],
+                          instance_memory[choice], fitted)
+
+    if per_vm:
+        vms = []
+        for row, (datacenter, cluster, host, vmname) in enumerate(table.vms):
+            venues = {}
+            for venue, (names, instance_cores, instance_memory, fitted) in \
+                    presets.items():
+                if not fitted[row]:
+                    # Larger than any size: no preset to suggest
+                    venues[venue] = {'instance': None, 'fits': False}
+                    continue
+                venues[venue] = {'instance': str(names[row]),
+                                 'number_of_cores': int(instance_cores[row]),
+                                 'memory_in_gb': float(instance_memory[row])}
+            vms.append({'datacenter': datacenter, 'cluster': cluster,
+                        'host': host, 'vm': vmname,
+                        'presets': {'venue': venues}})
+        report['vms'] = vms
+
+    return report
+
+
+def main():
+    args = get_args()
+
+    table = InventoryTable()
+    if args.inventory == '-':
+        for record in read_records(sys.stdin):
+            table.add_record(record)
+    else:
+        with open(args.inventory) as stream:
+            for record in read_records(stream):
+                table.add_record(record)
+
+    print(dump_yaml(capacity_report(table, args.per_vm)))
+
+if __name__ == '__main__':
+    main()
@@ -22,36 +22,52 @@ An abstraction to contain information on the compute resources
 allocated to a vm.
 '''
 
-import json
-import yaml
-
+from nic_spec import VirtualNicSpec
+from records import VmRecord
 from vdisk_spec import VirtualDiskSpec
 
 class ComputeSpec:
 
-    def __init__(self, vm):
-
-        self.compute_stanza = {}
-        self.vm = {}
-        self.compute_stanza['vm'] = self.vm
+    __slots__ = ('record',)
 
-        # Populate vm specification
+    def __init__(self, vm, properties=None, datastore_index=None,
+                 network_index=None):
+        '''
+        properties, when supplied, holds the values already fetched by the
+        PropertyCollector (see property_collector.VM_PROPERTIES) so that
+        nothing needs to be dereferenced from the managed object itself.
+        datastore_index and network_index, when supplied, are the
+        datastore_index.DatastoreIndex and network_index.NetworkIndex used to
+        describe the disks and NICs.
 
-        summary = vm.summary
-        config = summary.config
-        vm_name = vm.name
+        Only the records.VmRecord of the vm is kept, which references no
+        pyVmomi objects.
+        '''
 
-        self.vm['cores'] = config.numCpu
+        # Populate vm specification
 
-        memory_in_gb = config.memorySizeMB / 1024
-        self.vm['memory'] = str(memory_in_gb) + 'Gb'
+        if properties is None:
+            config = vm.summary.config
+            num_cpu = config.numCpu
+            memory_size_mb = config.memorySizeMB
+            guest_full_name = config.guestFullName
+            devices = None
+            guest_nics = None
+        else:
+            num_cpu = properties.get('summary.config.numCpu')
+            memory_size_mb = properties.get('summary.config.memorySizeMB')
+            guest_full_name = properties.get('summary.config.guestFullName')
+            devices = properties.get('config.hardware.device', [])
+            guest_nics = properties.get('guest.net', [])
 
-        self.vm['image'] = config.guestFullName
+        nic_spec = VirtualNicSpec(vm, devices=devices, guest_nics=guest_nics,
+                                  network_index=network_index)
 
-        self.vm['nic'] = 'XXXX'
+        vdisk_spec = VirtualDiskSpec(vm, devices=devices,
+                                     datastore_index=datastore_index)
 
-        vdisk_spec = VirtualDiskSpec(vm)
-        self.vm['disks'] = vdisk_spec.as_dictionary()
+        self.record = VmRecord(num_cpu, memory_size_mb, guest_full_name,
+                               nic_spec.nics, vdisk_spec.disks)
 
     def as_dictionary(self):
-        return self.compute_stanza
+        return self.record.as_dictionary()
@@ -0,0 +1,82 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+A lookup of datastore attributes, built once per run with a single bulk
+property retrieval, so that virtual disks can be described without a
+remote fetch of their datastore each time.
+
+VMWare MOB:
+    Managed Object Type:        Datastore
+    Property Path :             info, summary.type
+'''
+
+from lazy import vim
+
+from property_collector import retrieve_properties
+
+DATASTORE_PROPERTIES = ['info', 'summary.type']
+
+
+def datastore_attributes(info, datastore_type):
+    '''
+    Returns the attributes of interest for a datastore. Only VMFS datastores
+    report whether they are backed by SSD; NFS, vSAN, vVol and PMem
+    datastores have no vmfs member in their info.
+    '''
+    vmfs = getattr(info, 'vmfs', None)
+    ssd = bool(vmfs.ssd) if vmfs is not None else False
+    return {'type': datastore_type, 'ssd': ssd}
+
+
+class DatastoreIndex:
+
+    def __init__(self):
+        self.datastores = {}
+
+    def add(self, datastore, properties):
+        self.datastores[datastore] = datastore_attributes(
+            properties.get('info'), properties.get('summary.type'))
+
+    def lookup(self, datastore):
+        if datastore not in self.datastores:
+            # Not seen during the bulk retrieval (e.g. created since)
+            summary = datastore.summary
+            self.datastores[datastore] = datastore_attributes(datastore.info,
+                                                              summary.type)
+        return self.datastores[datastore]
+
+    def is_ssd(self, datastore):
+        return self.lookup(datastore)['ssd']
+
+
+def build_datastore_index(content, roots=None):
+    '''
+    Index the datastores below each of roots, or the whole inventory when
+    roots is None
+    '''
+    index = DatastoreIndex()
+    datastore_specs = {vim.Datastore: DATASTORE_PROPERTIES}
+    for root in [None] if roots is None else roots:
+        for datastore, properties in retrieve_properties(content,
+                                                         datastore_specs,
+                                                         root):
+            index.add(datastore, properties)
+    return index
@@ -0,0 +1,134 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+Output formats for collected inventory, and readers for them.
+
+The nested YAML document needs the whole inventory in memory before it can
+be written. The streaming formats write one record per VM as it is
+collected, so memory use stays flat however large the estate:
+
+    jsonl           one JSON object per line
+    yaml-stream     one YAML document per VM
+
+The compute stanza of each VM is held as a records.VmRecord until it is
+written, when it is converted to its dictionary.
+'''
+
+import itertools
+import json
+import yaml
+
+try:
+    # The libyaml based emitter and parser are several times faster than
+    # the pure Python ones
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper
+    from yaml import SafeLoader
+
+from records import VmRecord
+
+FORMATS = ['yaml', 'jsonl', 'yaml-stream']
+
+
+class InventoryDumper(SafeDumper):
+    '''
+    Writes VmRecords as their dictionaries
+    '''
+
+
+InventoryDumper.add_representer(
+    VmRecord,
+    lambda dumper, record: dumper.represent_dict(record.as_dictionary()))
+
+
+def dump_yaml(data):
+    return yaml.dump(data, Dumper=InventoryDumper)
+
+
+def plain_record(record):
+    '''
+    The record with its compute stanza as a dictionary
+    '''
+    if isinstance(record.get('compute'), VmRecord):
+        record = dict(record, compute=record['compute'].as_dictionary())
+    return record
+
+
+def emit_json_lines(records, stream):
+    for record in records:
+        stream.write(json.dumps(plain_record(record), sort_keys=True))
+        stream.write('\n')
+
+
+def emit_yaml_documents(records, stream):
+    for record in records:
+        yaml.dump(record, stream, Dumper=InventoryDumper, explicit_start=True)
+
+
+def emit_records(records, stream, output_format):
+    if output_format == 'jsonl':
+        emit_json_lines(records, stream)
+    elif output_format == 'yaml-stream':
+        emit_yaml_documents(records, stream)
+    else:
+        raise ValueError('Unknown streaming format: %s' % output_format)
+
+
+def flatten_inventory(data_dict):
+    '''
+    Yields the records of a nested datacenter -> cluster -> host -> vm
+    dictionary
+    '''
+    for dc_name, clusters in data_dict.items():
+        for cluster_name, hosts in clusters.items():
+            for hostname, vms in hosts.items():
+                for vmname, vm_dict in vms.items():
+                    yield {'datacenter': dc_name,
+                           'cluster': cluster_name,
+                           'host': hostname,
+                           'vm': vmname,
+                           'compute': vm_dict['compute']}
+
+
+def read_records(stream):
+    '''
+    Yields the VM records of any of the output formats. JSON Lines input is
+    read one line at a time.
+    '''
+    first_line = stream.readline()
+    if first_line.startswith('{'):
+        for line in itertools.chain([first_line], stream):
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+        return
+
+    text = first_line + stream.read()
+    for document in yaml.load_all(text, Loader=SafeLoader):
+        if not document:
+            continue
+        if 'compute' in document and 'vm' in document:
+            yield document
+        else:
+            for record in flatten_inventory(document):
+                yield record
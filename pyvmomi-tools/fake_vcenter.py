@@ -0,0 +1,360 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+A synthetic, in-memory vCenter for measuring the collectors offline.
+
+FakeVCenter generates an inventory of configurable size (datacenters x
+clusters x hosts x VMs x disks) out of genuine pyVmomi managed and data
+objects, bound to a FakeStub instead of a SOAP connection. Every property
+access and method call that would be a SOAP round trip against a real
+vCenter goes through the stub, which counts it and optionally sleeps for a
+configurable latency. The property collector methods used by
+property_collector (CreateContainerView, RetrievePropertiesEx,
+ContinueRetrievePropertiesEx, CancelRetrievePropertiesEx and
+DestroyView) are emulated, with traversal specs followed recursively.
+
+With folders, clusters sit in a nested host folder and half of the VMs in
+the nested VM folder 'apps/web'; standalone adds hosts outside any cluster.
+Every other VM is tagged 'prod' and every fifth VM is powered off.
+'''
+
+import collections
+import itertools
+import time
+
+from lazy import vim
+from lazy import vmodl
+
+GiB = 1024 ** 3
+
+GUESTS = ['Ubuntu Linux (64-bit)',
+          'Microsoft Windows Server 2016 (64-bit)',
+          'Red Hat Enterprise Linux 7 (64-bit)']
+
+
+class FakeStub:
+    '''
+    Stands in for pyVmomi's SoapStubAdapter
+    '''
+
+    def __init__(self, vcenter, latency=0.0):
+        self.vcenter = vcenter
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.cookie = 'vmware_soap_session="fake"'
+        self.results = {}
+        self.tokens = itertools.count(1)
+
+    def call(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def call_count(self):
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+
+    def InvokeAccessor(self, mo, info):
+        self.call('RetrieveProperties')
+        return self.vcenter.properties[mo._moId].get(info.name)
+
+    def InvokeMethod(self, mo, info, args):
+        self.call(info.wsdlName)
+        handler = getattr(self, 'do_' + info.name, None)
+        if handler is None:
+            raise vmodl.fault.NotImplemented()
+        return handler(mo, *args)
+
+    def do_RetrieveContent(self, mo):
+        return self.vcenter.content
+
+    def do_CreateContainerView(self, mo, container, types, recursive):
+        return self.vcenter.create_view(container, types, recursive)
+
+    def do_Destroy(self, mo):
+        self.vcenter.properties.pop(mo._moId, None)
+
+    def do_RetrievePropertiesEx(self, mo, spec_set, options):
+        contents = []
+        for filter_spec in spec_set:
+            contents.extend(self.vcenter.object_contents(filter_spec))
+        page_size = (options and options.maxObjects) or len(contents) or 1
+        return self.page(contents, page_size)
+
+    def do_ContinueRetrievePropertiesEx(self, mo, token):
+        contents, page_size = self.results.pop(token)
+        return self.page(contents, page_size)
+
+    def do_CancelRetrievePropertiesEx(self, mo, token):
+        self.results.pop(token, None)
+
+    def page(self, contents, page_size):
+        token = None
+        if len(contents) > page_size:
+            token = str(next(self.tokens))
+            self.results[token] = (contents[page_size:], page_size)
+        return vmodl.query.PropertyCollector.RetrieveResult(
+            token=token, objects=contents[:page_size])
+
+
+class FakeVCenter:
+    '''
+    An inventory of datacenters x clusters x hosts x VMs, with the given
+    number of disks and NICs per VM
+    '''
+
+    def __init__(self, datacenters=1, clusters=2, hosts=4, vms=10, disks=2,
+                 nics=1, latency=0.0, folders=False, standalone=0):
+        self.stub = FakeStub(self, latency)
+        self.properties = {}
+        self.inventory = []
+        self.ids = itertools.count(1)
+
+        self.root = self.entity(vim.Folder, 'group-d', name='Datacenters',
+                                parent=None, childEntity=[])
+        self.content = vim.ServiceInstanceContent(
+            rootFolder=self.root,
+            propertyCollector=vmodl.query.PropertyCollector(
+                'propertyCollector', self.stub),
+            viewManager=vim.view.ViewManager('ViewManager', self.stub))
+        self.service_instance = vim.ServiceInstance('ServiceInstance',
+                                                    self.stub)
+
+        self.folders = folders
+        self.standalone = standalone
+        for dc_number in range(datacenters):
+            self.add_datacenter('dc%02d' % dc_number, clusters, hosts, vms,
+                                disks, nics)
+
+    def entity(self, managed_type, prefix, **properties):
+        mo = managed_type('%s%d' % (prefix, next(self.ids)), self.stub)
+        self.properties[mo._moId] = properties
+        if issubclass(managed_type, vim.ManagedEntity):
+            self.inventory.append(mo)
+        return mo
+
+    def add_child(self, folder, child):
+        self.properties[folder._moId]['childEntity'].append(child)
+
+    def add_folder(self, parent, prefix, name):
+        folder = self.entity(vim.Folder, prefix, name=name, parent=parent,
+                             childEntity=[])
+        self.add_child(parent, folder)
+        return folder
+
+    def add_datacenter(self, name, clusters, hosts, vms, disks, nics):
+        dc = self.entity(vim.Datacenter, 'datacenter-', name=name,
+                         parent=self.root)
+        self.add_child(self.root, dc)
+        dc_props = self.properties[dc._moId]
+        for folder in ['host', 'vm', 'datastore', 'network']:
+            dc_props[folder + 'Folder'] = self.entity(
+                vim.Folder, 'group-%s' % folder[0], name=folder, parent=dc,
+                childEntity=[])
+
+        cluster_folder = dc_props['hostFolder']
+        dc_props['appsFolder'] = dc_props['vmFolder']
+        if self.folders:
+            cluster_folder = self.add_folder(cluster_folder, 'group-h',
+                                             'clusters')
+            apps = self.add_folder(dc_props['vmFolder'], 'group-v', 'apps')
+            dc_props['appsFolder'] = self.add_folder(apps, 'group-v', 'web')
+
+        datastore_name = name + '-ssd'
+        datastore = self.entity(
+            vim.Datastore, 'datastore-', name=datastore_name,
+            parent=dc_props['datastoreFolder'],
+            info=vim.host.VmfsDatastoreInfo(
+                name=datastore_name, vmfs=vim.host.VmfsVolume(ssd=True)),
+            summary=vim.Datastore.Summary(name=datastore_name, type='VMFS'))
+        self.add_child(dc_props['datastoreFolder'], datastore)
+
+        network = self.entity(vim.Network, 'network-', name=name + '-vm',
+                              parent=dc_props['networkFolder'])
+        self.add_child(dc_props['networkFolder'], network)
+
+        for cluster_number in range(clusters):
+            cluster = self.entity(vim.ClusterComputeResource, 'domain-c',
+                                  name='%s-cluster%02d' % (name,
+                                                           cluster_number),
+                                  parent=cluster_folder, host=[])
+            self.add_child(cluster_folder, cluster)
+            for host_number in range(hosts):
+                self.add_host(dc_props, cluster, host_number, vms, disks,
+                              nics, datastore, network)
+
+        for host_number in range(self.standalone):
+            compute_resource = self.entity(
+                vim.ComputeResource, 'domain-s',
+                name='%s-standalone%02d' % (name, host_number),
+                parent=dc_props['hostFolder'], host=[])
+            self.add_child(dc_props['hostFolder'], compute_resource)
+            self.add_host(dc_props, compute_resource, host_number, vms,
+                          disks, nics, datastore, network)
+
+    def add_host(self, dc_props, cluster, host_number, vms, disks, nics,
+                 datastore, network):
+        cluster_name = self.properties[cluster._moId]['name']
+        hostname = '%s-esx%02d' % (cluster_name, host_number)
+        host = self.entity(
+            vim.HostSystem, 'host-', name=hostname, parent=cluster, vm=[],
+            summary=vim.host.Summary(
+                config=vim.host.Summary.ConfigSummary(name=hostname)))
+        self.properties[cluster._moId]['host'].append(host)
+
+        for vm_number in range(vms):
+            folder = dc_props[('vmFolder', 'appsFolder')[vm_number % 2]]
+            vm = self.add_vm('%s-vm%03d' % (hostname, vm_number), host,
+                             folder, disks, nics, datastore, network)
+            self.properties[host._moId]['vm'].append(vm)
+            self.add_child(folder, vm)
+
+    def add_vm(self, name, host, folder, disks, nics, datastore, network):
+        number = next(self.ids)
+        uuid = '00000000-0000-0000-0000-%012d' % number
+        guest = GUESTS[number % len(GUESTS)]
+
+        devices = []
+        for disk_number in range(disks):
+            devices.append(vim.vm.device.VirtualDisk(
+                key=2000 + disk_number,
+                deviceInfo=vim.Description(
+                    label='Hard disk %d' % (disk_number + 1), summary=''),
+                capacityInBytes=(16 + 48 * disk_number) * GiB,
+                backing=vim.vm.device.VirtualDisk.FlatVer2BackingInfo(
+                    datastore=datastore, diskMode='persistent',
+                    fileName='[%s] %s/%s_%d.vmdk' % (
+                        self.properties[datastore._moId]['name'], name,
+                        name, disk_number))))
+
+        guest_nics = []
+        for nic_number in range(nics):
+            key = 4000 + nic_number
+            devices.append(vim.vm.device.VirtualVmxnet3(
+                key=key,
+                deviceInfo=vim.Description(
+                    label='Network adapter %d' % (nic_number + 1),
+                    summary=''),
+                macAddress='00:50:56:%02x:%02x:%02x' % (
+                    (number >> 16) & 0xff, (number >> 8) & 0xff,
+                    number & 0xff),
+                backing=vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(
+                    network=network,
+                    deviceName=self.properties[network._moId]['name'])))
+            guest_nics.append(vim.vm.GuestInfo.NicInfo(
+                deviceConfigId=key,
+                ipConfig=vim.net.IpConfigInfo(ipAddress=[
+                    vim.net.IpConfigInfo.IpAddress(
+                        ipAddress='10.%d.%d.%d' % (
+                            nic_number, (number >> 8) & 0xff, number & 0xff),
+                        prefixLength=16)])))
+
+        return self.entity(
+            vim.VirtualMachine, 'vm-', name=name, parent=folder,
+            summary=vim.vm.Summary(config=vim.vm.Summary.ConfigSummary(
+                name=name, numCpu=2 ** (number % 3),
+                memorySizeMB=1024 * 2 ** (number % 4),
+                guestFullName=guest, instanceUuid=uuid)),
+            config=vim.vm.ConfigInfo(
+                name=name, instanceUuid=uuid, guestFullName=guest,
+                hardware=vim.vm.VirtualHardware(device=devices)),
+            runtime=vim.vm.RuntimeInfo(
+                host=host,
+                powerState='poweredOff' if number % 5 == 0 else 'poweredOn'),
+            guest=vim.vm.GuestInfo(net=guest_nics),
+            tag=[vim.Tag(key='prod')] if number % 2 == 0 else [])
+
+    def is_descendant(self, entity, container):
+        parent = self.properties[entity._moId].get('parent')
+        while parent is not None:
+            if parent == container:
+                return True
+            parent = self.properties[parent._moId].get('parent')
+        return False
+
+    def create_view(self, container, types, recursive):
+        members = []
+        for entity in self.inventory:
+            if not isinstance(entity, tuple(types)):
+                continue
+            if recursive:
+                if self.is_descendant(entity, container):
+                    members.append(entity)
+            elif self.properties[entity._moId].get('parent') == container:
+                members.append(entity)
+        return self.entity(vim.view.ContainerView, 'session[fake]view-',
+                           view=members)
+
+    def resolve(self, entity, path):
+        '''
+        Returns the value of a property path, with lists converted to the
+        typed arrays the SOAP deserializer would produce
+        '''
+        names = path.split('.')
+        value = self.properties[entity._moId].get(names[0])
+        declared_type = entity._GetPropertyInfo(names[0]).type
+        for name in names[1:]:
+            if value is None:
+                break
+            declared_type = value._GetPropertyInfo(name).type
+            value = getattr(value, name, None)
+        if isinstance(value, list):
+            value = declared_type(value)
+        return value
+
+    def traverse(self, obj, select_set, found):
+        for traversal_spec in select_set or []:
+            if not isinstance(obj, traversal_spec.type):
+                continue
+            children = self.resolve(obj, traversal_spec.path)
+            if children is None:
+                continue
+            if not isinstance(children, list):
+                children = [children]
+            for child in children:
+                if not traversal_spec.skip:
+                    found.append(child)
+                self.traverse(child, traversal_spec.selectSet, found)
+
+    def object_contents(self, filter_spec):
+        contents = []
+        for object_spec in filter_spec.objectSet:
+            entities = [] if object_spec.skip else [object_spec.obj]
+            self.traverse(object_spec.obj, object_spec.selectSet, entities)
+            for entity in entities:
+                paths = []
+                for prop_spec in filter_spec.propSet:
+                    if isinstance(entity, prop_spec.type):
+                        paths.extend(path for path in prop_spec.pathSet
+                                     if path not in paths)
+                if not paths:
+                    continue
+                prop_set = []
+                for path in paths:
+                    value = self.resolve(entity, path)
+                    if value is not None:
+                        prop_set.append(vmodl.DynamicProperty(name=path,
+                                                              val=value))
+                contents.append(vmodl.query.PropertyCollector.ObjectContent(
+                    obj=entity, propSet=prop_set))
+        return contents
@@ -0,0 +1,72 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+
+'''
+Deferred imports of the heavy third party modules.
+
+Importing pyVmomi loads its complete type tables, which costs far more than
+anything a tool does before it has parsed its arguments. The modules here
+stand in for pyVmomi's vim and vmodl and for pyVim.connect, and only import
+the real module the first time one of its attributes is used, so that
+--help and argument errors return without paying for it.
+
+    from lazy import vim
+
+    def is_vm(entity):
+        return isinstance(entity, vim.VirtualMachine)   # imports pyVmomi
+'''
+
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    '''
+    A stand in for a module that is imported on first attribute access.
+    attribute names a member of that module to stand in for instead, as in
+    "from pyVmomi import vim".
+    '''
+    def __init__(self, name, attribute=None):
+        super().__init__(name if attribute is None
+                         else '%s.%s' % (name, attribute))
+        self.__dict__['_lazy_target'] = (name, attribute)
+
+    def _load(self):
+        name, attribute = self._lazy_target
+        module = importlib.import_module(name)
+        if attribute is not None:
+            module = getattr(module, attribute)
+        return module
+
+    def __getattr__(self, attribute):
+        value = getattr(self._load(), attribute)
+        # Later lookups of the same attribute bypass __getattr__ altogether
+        self.__dict__[attribute] = value
+        return value
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+vim = LazyModule('pyVmomi', 'vim')
+vmodl = LazyModule('pyVmomi', 'vmodl')
+connect = LazyModule('pyVim.connect')
+numpy = LazyModule('numpy')
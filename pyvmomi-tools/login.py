@@ -18,16 +18,33 @@
 #
 '''
 Tools to authenticate and return a pyVmomi ServiceInstance
+
+Sessions can optionally be cached on disk between runs. The
+vmware_soap_session cookie is stored, readable by the owner only, and is
+checked with a cheap SessionManager.currentSession call before it is used
+again, so that repeated invocations do not each pay for a full login.
 '''
 
 import argparse
 import atexit
+import contextlib
+import hashlib
+import os
+import ssl
+import threading
+import time
 
-from pyVmomi import vim
-from pyVmomi import vmodl
-from pyVim import connect
+from lazy import vim
+from lazy import vmodl
+from lazy import connect
 
-def get_args():
+SESSION_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'pyvmomi-tools', 'sessions')
+
+# Pooled sessions idle for longer than this are checked before being reused
+VALIDATE_AFTER_SECONDS = 60
+
+def build_arg_parser():
     parser = argparse.ArgumentParser(
         description='Process arguments for querying the vcenter'
     )
@@ -47,31 +64,205 @@ def get_args():
     parser.add_argument('-n', '--nossl',
                         required=False, action='store_true',
                         help='Flag to set only if ssl should not be used')
+    parser.add_argument('-c', '--cache-session',
+                        required=False, action='store_true',
+                        help='Reuse a session cached on disk by a previous '
+                             'run, and keep this one open for the next')
+    return parser
+
+
+def get_args():
+    parser = build_arg_parser()
     args = parser.parse_args()
     return args
 
 
-def get_service_instance():
-    args = get_args()
+def get_service_instance(args=None):
+    if args is None:
+        args = get_args()
+    return connect_to_vcenter(args.host, args.user, args.password,
+                              port=args.port, nossl=args.nossl,
+                              cache_session=args.cache_session)
+
+
+def connect_to_vcenter(host, user, password, port=443, nossl=False,
+                       cache_session=False):
+    if cache_session:
+        service_instance = load_cached_session(host, user, port, nossl)
+        if service_instance:
+            return service_instance
+
     try:
-        if (args.nossl):
-            service_instance = connect.SmartConnectNoSSL(host=args.host,
-                                                        user=args.user,
-                                                        pwd=args.password,
-                                                        port=int(args.port))
+        if (nossl):
+            service_instance = connect.SmartConnectNoSSL(host=host,
+                                                        user=user,
+                                                        pwd=password,
+                                                        port=int(port))
         else:
-            service_instance = connect.SmartConnect(host=args.host,
-                                                    user=args.user,
-                                                    pwd=args.password,
-                                                    port=int(args.port))
+            service_instance = connect.SmartConnect(host=host,
+                                                    user=user,
+                                                    pwd=password,
+                                                    port=int(port))
         if not service_instance:
             print('Problem connecting - check host/username/password')
             return -1
 
-        atexit.register(connect.Disconnect, service_instance)
+        if cache_session:
+            # Left logged in so that the next run can pick it up
+            save_session(host, user, port, service_instance._stub.cookie)
+        else:
+            atexit.register(connect.Disconnect, service_instance)
 
     except vmodl.MethodFault as error:
         print ('Caught vmodl fault : ' + error.msg)
         return None
 
     return service_instance
+
+
+def session_cache_file(host, user, port):
+    key = '%s@%s:%d' % (user, host, int(port))
+    return os.path.join(SESSION_CACHE_DIR,
+                        hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def save_session(host, user, port, cookie):
+    os.makedirs(SESSION_CACHE_DIR, mode=0o700, exist_ok=True)
+    filename = session_cache_file(host, user, port)
+    partial = filename + '.partial'
+    descriptor = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+    # The mode given to os.open only applies to a file it creates
+    os.fchmod(descriptor, 0o600)
+    with os.fdopen(descriptor, 'w') as cache:
+        cache.write(cookie)
+    os.replace(partial, filename)
+
+
+def session_from_cookie(host, port, nossl, cookie):
+    '''
+    A ServiceInstance that joins an existing session rather than logging in
+    '''
+    context = ssl._create_unverified_context() if nossl else None
+    stub = connect.SmartStubAdapter(host=host, port=int(port),
+                                    sslContext=context)
+    stub.cookie = cookie
+    return vim.ServiceInstance('ServiceInstance', stub)
+
+
+def session_is_valid(service_instance):
+    try:
+        session_manager = service_instance.content.sessionManager
+        return session_manager.currentSession is not None
+    except vim.fault.NotAuthenticated:
+        return False
+
+
+def load_cached_session(host, user, port, nossl):
+    filename = session_cache_file(host, user, port)
+    try:
+        with open(filename) as cache:
+            cookie = cache.read()
+    except (IOError, OSError):
+        return None
+
+    service_instance = session_from_cookie(host, port, nossl, cookie)
+    if not session_is_valid(service_instance):
+        forget_session(host, user, port)
+        return None
+    return service_instance
+
+
+def forget_session(host, user, port):
+    try:
+        os.remove(session_cache_file(host, user, port))
+    except OSError:
+        pass
+
+
+class SessionPool:
+    '''
+    A small pool of live ServiceInstances for threaded callers.
+
+    All of the pooled ServiceInstances share one vCenter session, so a
+    threaded tool counts once against the vCenter session limit. When the
+    session expires the pool logs in again and replaces the idle instances.
+    '''
+
+    def __init__(self, host, user, password, port=443, nossl=False, size=4,
+                 cache_session=False):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.nossl = nossl
+        self.cache_session = cache_session
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.cookie = None
+        self.idle = []
+
+    def login(self, stale_cookie=None):
+        with self.lock:
+            if self.cookie is not None and self.cookie != stale_cookie:
+                # Another thread has already logged in again
+                return
+            if stale_cookie is not None and self.cache_session:
+                forget_session(self.host, self.user, self.port)
+            service_instance = connect_to_vcenter(
+                self.host, self.user, self.password, port=self.port,
+                nossl=self.nossl, cache_session=self.cache_session)
+            if not service_instance or service_instance == -1:
+                raise Exception('Authentication to %s failed' % self.host)
+            self.cookie = service_instance._stub.cookie
+            self.idle = [(service_instance, time.time())]
+
+    def checkout(self):
+        if self.cookie is None:
+            self.login()
+
+        with self.lock:
+            if self.idle:
+                service_instance, last_used = self.idle.pop()
+            else:
+                service_instance, last_used = None, None
+
+        if service_instance is None:
+            return session_from_cookie(self.host, self.port, self.nossl,
+                                       self.cookie)
+
+        if time.time() - last_used > VALIDATE_AFTER_SECONDS and \
+                not session_is_valid(service_instance):
+            self.login(stale_cookie=service_instance._stub.cookie)
+            return self.checkout()
+
+        return service_instance
+
+    def checkin(self, service_instance):
+        with self.lock:
+            if service_instance._stub.cookie == self.cookie:
+                self.idle.append((service_instance, time.time()))
+
+    @contextlib.contextmanager
+    def session(self):
+        with self.slots:
+            service_instance = self.checkout()
+            try:
+                yield service_instance
+            except vim.fault.NotAuthenticated:
+                self.login(stale_cookie=service_instance._stub.cookie)
+                raise
+            self.checkin(service_instance)
+
+    def run(self, function, *args, **kwargs):
+        '''
+        Call function(service_instance, *args, **kwargs) with a pooled
+        session, retrying once with a new session if the current one has
+        expired
+        '''
+        try:
+            with self.session() as service_instance:
+                return function(service_instance, *args, **kwargs)
+        except vim.fault.NotAuthenticated:
+            with self.session() as service_instance:
+                return function(service_instance, *args, **kwargs)
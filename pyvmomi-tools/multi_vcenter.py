@@ -0,0 +1,198 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+Collect the inventory of several vCenters concurrently and merge the
+results into one document keyed by vCenter.
+
+The vCenters are listed in a YAML file:
+
+    max_workers: 8
+    vcenters:
+      - host: vcenter01.example.com
+        user: administrator@vsphere.local
+        password_env: VCENTER01_PASSWORD
+        port: 443
+        nossl: false
+        cache_session: false
+        max_concurrency: 2
+
+Sessions are opened from a bounded thread pool and each datacenter is
+walked as a separate task on the same pool. Each vCenter has a
+login.SessionPool of max_concurrency instances sharing a single session,
+which caps the number of tasks talking to any one vCenter at a time so as
+to stay within its session and API limits.
+
+A vCenter that cannot be logged in to or walked does not stop the others
+from being collected: its errors are reported on stderr, whatever was
+collected from it is still output, and the exit status is 1. Errors are
+kept out of the document, where they could be mistaken for a datacenter.
+'''
+
+import argparse
+import getpass
+import os
+import sys
+import yaml
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+
+from lazy import vim
+
+from login import SessionPool
+from datastore_index import build_datastore_index
+from network_index import build_network_index
+from emitters import dump_yaml
+from property_collector import collect_inventory
+from property_collector import retrieve_properties
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_CONCURRENCY = 2
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Collect the inventory of several vCenters at once'
+    )
+
+    parser.add_argument('-f', '--config',
+                        required=True, action='store',
+                        help='YAML file listing the vCenters to query')
+    parser.add_argument('-w', '--workers',
+                        type=int, action='store',
+                        help='Size of the worker pool, overriding the '
+                             'max_workers setting of the config file')
+    args = parser.parse_args()
+    return args
+
+
+class Endpoint:
+    '''
+    A vCenter to collect from, and the pool of sessions bounding the number
+    of concurrent tasks against it
+    '''
+
+    def __init__(self, config):
+        self.host = config['host']
+        user = config['user']
+        password = config.get('password')
+        if password is None and 'password_env' in config:
+            password = os.environ.get(config['password_env'])
+        if password is None:
+            password = getpass.getpass('Password for %s@%s: ' %
+                                       (user, self.host))
+        self.pool = SessionPool(
+            self.host, user, password,
+            port=config.get('port', 443),
+            nossl=config.get('nossl', False),
+            size=config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY),
+            cache_session=config.get('cache_session', False))
+        self.datastore_index = None
+        self.network_index = None
+
+
+def load_endpoints(filename):
+    with open(filename) as config_file:
+        config = yaml.safe_load(config_file)
+    endpoints = [Endpoint(vcenter) for vcenter in config['vcenters']]
+    return config.get('max_workers', DEFAULT_MAX_WORKERS), endpoints
+
+
+def list_datacenters(si, endpoint):
+    '''
+    Index the datastores and networks and list the datacenters of a vCenter
+    '''
+    content = si.RetrieveContent()
+    endpoint.datastore_index = build_datastore_index(content)
+    endpoint.network_index = build_network_index(content)
+    datacenter_specs = {vim.Datacenter: ['name']}
+    return [dc for dc, _ in retrieve_properties(content, datacenter_specs)]
+
+
+def collect_datacenter(si, endpoint, datacenter):
+    return collect_inventory(si.RetrieveContent(), root=datacenter,
+                             datastore_index=endpoint.datastore_index,
+                             network_index=endpoint.network_index)
+
+
+def collect_vcenters(endpoints, max_workers=DEFAULT_MAX_WORKERS):
+    '''
+    Returns {vcenter: {datacenter: {cluster: {host: {vm: ...}}}}} for all of
+    the endpoints, and {vcenter: error} for those that failed in part or
+    whole
+    '''
+    data_dict = dict((endpoint.host, {}) for endpoint in endpoints)
+    errors = dict((endpoint.host, []) for endpoint in endpoints)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        logins = dict((executor.submit(endpoint.pool.run, list_datacenters,
+                                       endpoint), endpoint)
+                      for endpoint in endpoints)
+        walks = {}
+        for future in as_completed(logins):
+            endpoint = logins[future]
+            try:
+                datacenters = future.result()
+            except Exception as error:
+                errors[endpoint.host].append(describe_error(error))
+                continue
+            for datacenter in datacenters:
+                walk = executor.submit(endpoint.pool.run,
+                                       collect_datacenter, endpoint,
+                                       datacenter)
+                walks[walk] = endpoint
+
+        for future in as_completed(walks):
+            endpoint = walks[future]
+            try:
+                data_dict[endpoint.host].update(future.result())
+            except Exception as error:
+                errors[endpoint.host].append(describe_error(error))
+
+    return data_dict, dict((host, '; '.join(messages))
+                           for host, messages in errors.items() if messages)
+
+
+def describe_error(error):
+    '''
+    Returns a one line description of an error, using the message of a
+    vmodl.MethodFault where there is one
+    '''
+    message = getattr(error, 'msg', None) or str(error)
+    return '%s: %s' % (type(error).__name__, message)
+
+
+def main():
+    args = get_args()
+    max_workers, endpoints = load_endpoints(args.config)
+    if args.workers:
+        max_workers = args.workers
+
+    data_dict, errors = collect_vcenters(endpoints, max_workers)
+
+    print(dump_yaml(data_dict))
+    for host, message in errors.items():
+        sys.stderr.write('%s: %s\n' % (host, message))
+    if errors:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
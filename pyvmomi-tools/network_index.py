@@ -0,0 +1,142 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+A lookup of networks, distributed port groups and their VLANs, built once
+per run with a single bulk property retrieval, so that the NICs of every VM
+can be resolved with dictionary lookups rather than a remote fetch per NIC.
+
+VMWare MOB:
+    Managed Object Type:        Network, DistributedVirtualPortgroup,
+                                DistributedVirtualSwitch, HostSystem
+    Property Path :             name, key, config.defaultPortConfig,
+                                config.distributedVirtualSwitch,
+                                config.network.portgroup
+'''
+
+from lazy import vim
+
+from property_collector import retrieve_properties
+
+
+def vlan_of(port_config):
+    '''
+    Returns the VLAN id of a distributed port group, a 'start-end' string
+    for trunks, or None
+    '''
+    vlan = getattr(port_config, 'vlan', None)
+    if isinstance(vlan, vim.dvs.VmwareDistributedVirtualSwitch.PvlanSpec):
+        return vlan.pvlanId
+    vlan_id = getattr(vlan, 'vlanId', None)
+    if isinstance(vlan_id, list):
+        return ','.join('%d-%d' % (vlan_range.start, vlan_range.end)
+                        for vlan_range in vlan_id)
+    return vlan_id
+
+
+class NetworkIndex:
+
+    def __init__(self):
+        self.networks = {}
+        self.portgroups = {}
+        self.switches = {}
+        self.standard_vlans = {}
+
+    def add(self, entity, properties):
+        if isinstance(entity, vim.DistributedVirtualSwitch):
+            self.switches[entity] = properties.get('name')
+        elif isinstance(entity, vim.HostSystem):
+            for portgroup in properties.get('config.network.portgroup', []):
+                self.standard_vlans.setdefault(portgroup.spec.name,
+                                               portgroup.spec.vlanId)
+        elif isinstance(entity, vim.dvs.DistributedVirtualPortgroup):
+            self.networks[entity] = properties
+            self.portgroups[properties.get('key')] = entity
+        else:
+            self.networks[entity] = properties
+
+    def describe(self, network):
+        '''
+        Returns the name, type, VLAN and switch of a Network managed object
+        '''
+        if network not in self.networks:
+            # Not seen during the bulk retrieval (e.g. created since)
+            self.networks[network] = {'name': network.name}
+        properties = self.networks[network]
+
+        if isinstance(network, vim.dvs.DistributedVirtualPortgroup):
+            switch = properties.get('config.distributedVirtualSwitch')
+            return {'network': properties.get('name'),
+                    'type': 'distributed',
+                    'vlan': vlan_of(
+                        properties.get('config.defaultPortConfig')),
+                    'switch': self.switches.get(switch)}
+
+        if isinstance(network, vim.OpaqueNetwork):
+            return {'network': properties.get('name'), 'type': 'opaque'}
+
+        name = properties.get('name')
+        return {'network': name,
+                'type': 'standard',
+                'vlan': self.standard_vlans.get(name)}
+
+    def resolve(self, backing):
+        '''
+        Returns the description of the network a NIC backing is attached to
+        '''
+        if isinstance(backing, vim.vm.device.VirtualEthernetCard.
+                      DistributedVirtualPortBackingInfo):
+            portgroup = self.portgroups.get(backing.port.portgroupKey)
+            if portgroup is None:
+                return {'network': backing.port.portgroupKey,
+                        'type': 'distributed'}
+            return self.describe(portgroup)
+
+        if isinstance(backing, vim.vm.device.VirtualEthernetCard.
+                      OpaqueNetworkBackingInfo):
+            return {'network': backing.opaqueNetworkId, 'type': 'opaque'}
+
+        network = getattr(backing, 'network', None)
+        if network is not None:
+            return self.describe(network)
+        return {'network': getattr(backing, 'deviceName', None),
+                'type': 'standard'}
+
+
+def build_network_index(content, roots=None):
+    '''
+    Index the networks, switches and host portgroups below each of roots,
+    or the whole inventory when roots is None
+    '''
+    network_specs = {
+        vim.Network: ['name'],
+        vim.dvs.DistributedVirtualPortgroup: [
+            'key',
+            'config.defaultPortConfig',
+            'config.distributedVirtualSwitch'],
+        vim.DistributedVirtualSwitch: ['name'],
+        vim.HostSystem: ['config.network.portgroup'],
+    }
+    index = NetworkIndex()
+    for root in [None] if roots is None else roots:
+        for entity, properties in retrieve_properties(content, network_specs,
+                                                      root):
+            index.add(entity, properties)
+    return index
@@ -0,0 +1,111 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+An abstraction to store information on the network adapters of a VM.
+
+VMWare MOB:
+    Data Object Type:           Virtual Hardware, Guest Information
+    Property Path :             config.hardware, guest.net
+'''
+
+import ipaddress
+
+from lazy import vim
+from records import NicRecord
+
+
+def guest_subnets(guest_nics):
+    '''
+    Returns {device key: subnet} for the first IPv4 address the guest
+    reports on each NIC
+    '''
+    subnets = {}
+    for guest_nic in guest_nics or []:
+        ip_config = getattr(guest_nic, 'ipConfig', None)
+        if ip_config is None:
+            continue
+        for address in ip_config.ipAddress:
+            interface = ipaddress.ip_interface('%s/%d' % (address.ipAddress,
+                                                          address.prefixLength))
+            if interface.version == 4:
+                subnets[guest_nic.deviceConfigId] = str(interface.network)
+                break
+    return subnets
+
+
+def network_type(network):
+    '''
+    Returns the type of a Network managed object, as NetworkIndex does
+    '''
+    if isinstance(network, vim.dvs.DistributedVirtualPortgroup):
+        return 'distributed'
+    if isinstance(network, vim.OpaqueNetwork):
+        return 'opaque'
+    return 'standard'
+
+
+def describe_backing(backing):
+    '''
+    Describe a NIC backing without a network index, dereferencing the
+    network it is attached to. The type is the one NetworkIndex.resolve
+    gives, so that every collection strategy describes a NIC alike.
+    '''
+    if isinstance(backing, vim.vm.device.VirtualEthernetCard.
+                  OpaqueNetworkBackingInfo):
+        return {'network': backing.opaqueNetworkId, 'type': 'opaque'}
+    network = getattr(backing, 'network', None)
+    if network is not None:
+        return {'network': network.name, 'type': network_type(network)}
+    port = getattr(backing, 'port', None)
+    if port is not None:
+        return {'network': port.portgroupKey, 'type': 'distributed'}
+    return {'network': getattr(backing, 'deviceName', None),
+            'type': 'standard'}
+
+
+class VirtualNicSpec():
+
+    __slots__ = ('nics',)
+
+    def __init__(self, vm, devices=None, guest_nics=None, network_index=None):
+        nics = []
+        if devices is None:
+            devices = vm.config.hardware.device
+            guest_nics = vm.guest.net
+        subnets = guest_subnets(guest_nics)
+
+        for device in devices:
+            if isinstance(device, vim.vm.device.VirtualEthernetCard):
+                nic_name = device.deviceInfo.label
+
+                if network_index is not None:
+                    details = network_index.resolve(device.backing)
+                else:
+                    details = describe_backing(device.backing)
+
+                nics.append(NicRecord(nic_name,
+                                      mac=device.macAddress,
+                                      subnet=subnets.get(device.key),
+                                      **details))
+        self.nics = tuple(nics)
+
+    def as_dictionary(self):
+        return dict((nic.label, nic.as_dictionary()) for nic in self.nics)
@@ -0,0 +1,361 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+Bulk retrieval of vSphere inventory using a ContainerView and the
+PropertyCollector.
+
+Rather than dereferencing managed object properties one at a time (one SOAP
+round trip each), the properties needed to describe every VM are requested
+up front with RetrievePropertiesEx and paged through with
+ContinueRetrievePropertiesEx.
+
+When collection is narrowed by a scope.Scope, the selection is made on the
+server: only the VMs of the hosts in scope are traversed, and only the few
+properties the scope needs are fetched for them. The full VM_PROPERTIES,
+hardware and guest details included, are then fetched for the VMs in scope
+alone.
+'''
+
+from lazy import vim
+from lazy import vmodl
+
+from compute_spec import ComputeSpec
+
+PAGE_SIZE = 1000
+
+VM_PROPERTIES = ['name',
+                 'config.instanceUuid',
+                 'summary.config.numCpu',
+                 'summary.config.memorySizeMB',
+                 'summary.config.guestFullName',
+                 'config.hardware.device',
+                 'guest.net',
+                 'runtime.host']
+
+TOPOLOGY_TYPES = ['Datacenter', 'Folder', 'ComputeResource', 'HostSystem']
+
+
+def topology_properties():
+    '''
+    Returns the property specs for the topology. They are built on demand
+    so that importing this module does not import pyVmomi.
+    '''
+    return {getattr(vim, name): ['name', 'parent'] for name in TOPOLOGY_TYPES}
+
+
+def build_filter_spec(view, property_specs):
+    '''
+    A FilterSpec selecting the given properties of every object in a
+    ContainerView
+    '''
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+        name='traverseView', path='view', skip=False,
+        type=vim.view.ContainerView)
+    object_spec = vmodl.query.PropertyCollector.ObjectSpec(
+        obj=view, skip=True, selectSet=[traversal_spec])
+    prop_specs = [vmodl.query.PropertyCollector.PropertySpec(
+                      type=obj_type, pathSet=paths, all=False)
+                  for obj_type, paths in property_specs.items()]
+    return vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=[object_spec], propSet=prop_specs)
+
+
+def build_object_filter_spec(objects, property_specs, path=None):
+    '''
+    A FilterSpec selecting the given properties of a list of managed
+    objects or, with path, of the objects each of them references through
+    that property (e.g. the 'vm' of a HostSystem)
+    '''
+    object_specs = []
+    for obj in objects:
+        if path is None:
+            object_specs.append(vmodl.query.PropertyCollector.ObjectSpec(
+                obj=obj, skip=False))
+        else:
+            traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+                path=path, skip=False, type=type(obj))
+            object_specs.append(vmodl.query.PropertyCollector.ObjectSpec(
+                obj=obj, skip=True, selectSet=[traversal_spec]))
+    prop_specs = [vmodl.query.PropertyCollector.PropertySpec(
+                      type=obj_type, pathSet=paths, all=False)
+                  for obj_type, paths in property_specs.items()]
+    return vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=object_specs, propSet=prop_specs)
+
+
+def retrieve(content, filter_spec, page_size=PAGE_SIZE):
+    '''
+    Yields (managed object, {property path: value}) for every object a
+    FilterSpec selects, a page at a time
+    '''
+    collector = content.propertyCollector
+    token = None
+    try:
+        options = vmodl.query.PropertyCollector.RetrieveOptions(
+            maxObjects=page_size)
+
+        result = collector.RetrievePropertiesEx([filter_spec], options)
+        while result is not None:
+            token = result.token
+            for object_content in result.objects:
+                properties = dict((prop.name, prop.val)
+                                  for prop in object_content.propSet)
+                yield object_content.obj, properties
+            if not token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(token)
+            token = None
+    finally:
+        if token:
+            # The caller stopped early; release the server side result set
+            collector.CancelRetrievePropertiesEx(token)
+
+
+def retrieve_properties(content, property_specs, root=None,
+                        page_size=PAGE_SIZE):
+    '''
+    Yields (managed object, {property path: value}) for every object below
+    root whose type appears in property_specs, a mapping of managed object
+    type to the list of property paths to collect for it
+    '''
+    if root is None:
+        root = content.rootFolder
+    view = content.viewManager.CreateContainerView(root,
+                                                   list(property_specs),
+                                                   True)
+    try:
+        filter_spec = build_filter_spec(view, property_specs)
+        for obj, properties in retrieve(content, filter_spec, page_size):
+            yield obj, properties
+    finally:
+        view.Destroy()
+
+
+def retrieve_object_properties(content, objects, property_specs, path=None,
+                               page_size=PAGE_SIZE):
+    '''
+    As retrieve_properties, for a list of managed objects (or the objects
+    they reference through path) rather than everything below a root. The
+    objects are requested page_size at a time.
+    '''
+    for start in range(0, len(objects), page_size):
+        filter_spec = build_object_filter_spec(
+            objects[start:start + page_size], property_specs, path)
+        for obj, properties in retrieve(content, filter_spec, page_size):
+            yield obj, properties
+
+
+class Topology:
+    '''
+    The datacenter / cluster / host parent chain, collected in bulk so that
+    a VM's location can be resolved without further round trips
+    '''
+
+    def __init__(self):
+        self.entities = {}
+        self.locations = {}
+
+    def add(self, entity, properties):
+        self.entities[entity] = properties
+        self.locations.clear()
+
+    def remove(self, entity):
+        self.entities.pop(entity, None)
+        self.locations.clear()
+
+    def name(self, entity):
+        return self.entities[entity]['name']
+
+    def hosts(self):
+        return [entity for entity in self.entities
+                if isinstance(entity, vim.HostSystem)]
+
+    def datacenters(self):
+        return [entity for entity in self.entities
+                if isinstance(entity, vim.Datacenter)]
+
+    def folder_path(self, folder):
+        '''
+        The path of a VM folder below its datacenter's VM folder, e.g.
+        'prod/web'
+        '''
+        names = []
+        while folder in self.entities and \
+                not isinstance(folder, vim.Datacenter):
+            names.append(self.name(folder))
+            folder = self.entities[folder].get('parent')
+        # The last folder is the datacenter's own VM folder
+        return '/'.join(reversed(names[:-1]))
+
+    def locate(self, host):
+        '''
+        Returns the (datacenter, cluster, host) names for a HostSystem. The
+        cluster of a standalone host is its ComputeResource, named after it.
+        '''
+        if host not in self.locations:
+            compute_resource = self.entities[host]['parent']
+            parent = self.entities[compute_resource].get('parent')
+            while parent is not None and \
+                    not isinstance(parent, vim.Datacenter):
+                parent = self.entities[parent].get('parent')
+            self.locations[host] = (self.name(parent),
+                                    self.name(compute_resource),
+                                    self.name(host))
+        return self.locations[host]
+
+    def selected_hosts(self, scope=None):
+        '''
+        The hosts in the datacenters and clusters of scope
+        '''
+        return [host for host in self.hosts()
+                if scope is None or
+                scope.selects_location(*self.locate(host)[:2])]
+
+    def skeleton(self, scope=None):
+        '''
+        The datacenter -> cluster -> host dictionary, with no VMs yet
+        '''
+        data_dict = {}
+        for dc in self.datacenters():
+            if scope is None or scope.selects_datacenter(self.name(dc)):
+                data_dict[self.name(dc)] = {}
+        for host in self.selected_hosts(scope):
+            dc_name, cluster_name, hostname = self.locate(host)
+            data_dict.setdefault(dc_name, {}).setdefault(cluster_name, {})
+            data_dict[dc_name][cluster_name][hostname] = {}
+        return data_dict
+
+
+def collect_topology(content, root=None):
+    topology = Topology()
+    if isinstance(root, vim.Datacenter):
+        # A ContainerView holds the descendants of its container only
+        topology.add(root, {'name': root.name, 'parent': None})
+    for entity, properties in retrieve_properties(content,
+                                                  topology_properties(),
+                                                  root):
+        topology.add(entity, properties)
+    return topology
+
+
+def make_record(datacenter, cluster, host, vmname, uuid, vm_record):
+    '''
+    A flat, self-describing record for one VM, as streamed by
+    build_data_dictionary. compute holds the records.VmRecord of the VM,
+    which the emitters convert to its dictionary when it is written.
+    '''
+    return {'datacenter': datacenter,
+            'cluster': cluster,
+            'host': host,
+            'vm': vmname,
+            'uuid': uuid,
+            'compute': vm_record}
+
+
+def add_record(data_dict, record):
+    '''
+    Place a record in the datacenter -> cluster -> host -> vm dictionary
+    '''
+    hosts = data_dict.setdefault(record['datacenter'], {}) \
+                     .setdefault(record['cluster'], {})
+    vms = hosts.setdefault(record['host'], {})
+    vms[record['vm']] = {'compute': record['compute']}
+
+
+def select_vms(content, topology, scope, root=None):
+    '''
+    The VMs in scope, in inventory order. Only the VMs of the hosts in
+    scope are traversed, and only the properties the scope tests are
+    fetched for them.
+    '''
+    vm_specs = {vim.VirtualMachine: scope.vm_properties()}
+    if scope.filters_location():
+        candidates = retrieve_object_properties(
+            content, topology.selected_hosts(scope), vm_specs, path='vm')
+    else:
+        candidates = retrieve_properties(content, vm_specs, root)
+
+    selected = []
+    for vm, properties in candidates:
+        host = properties.get('runtime.host')
+        if host is None or host not in topology.entities:
+            continue
+        folder = None
+        if 'parent' in properties:
+            folder = topology.folder_path(properties['parent'])
+        tags = [tag.key for tag in properties.get('tag') or []]
+        if scope.selects_vm(properties.get('name', ''), folder, tags,
+                            properties.get('runtime.powerState'),
+                            properties.get('config.instanceUuid')):
+            selected.append(vm)
+    return selected
+
+
+def iter_vm_records(content, root=None, datastore_index=None,
+                    network_index=None, topology=None, capacity=None,
+                    scope=None):
+    '''
+    Yields one record per VM as each page of results arrives, so that only
+    a page of VMs is held in memory at a time. Each VM is also added to the
+    capacity_report.InventoryTable capacity, when one is supplied. Only the
+    VMs in the scope.Scope scope are collected, when one is supplied.
+    '''
+    if topology is None:
+        topology = collect_topology(content, root)
+
+    vm_specs = {vim.VirtualMachine: VM_PROPERTIES}
+    if scope is None or scope.is_everything():
+        vms = retrieve_properties(content, vm_specs, root)
+    else:
+        vms = retrieve_object_properties(
+            content, select_vms(content, topology, scope, root), vm_specs)
+
+    for vm, properties in vms:
+        host = properties.get('runtime.host')
+        if host is None:
+            continue
+        dc_name, cluster_name, hostname = topology.locate(host)
+        compute_spec = ComputeSpec(vm, properties=properties,
+                                   datastore_index=datastore_index,
+                                   network_index=network_index)
+        if capacity is not None:
+            capacity.add_vm_record(dc_name, cluster_name, hostname,
+                                   properties['name'], compute_spec.record)
+        yield make_record(dc_name, cluster_name, hostname,
+                          properties['name'],
+                          properties.get('config.instanceUuid'),
+                          compute_spec.record)
+
+
+def collect_inventory(content, root=None, datastore_index=None,
+                      network_index=None, capacity=None, scope=None):
+    '''
+    Build the datacenter -> cluster -> host -> vm dictionary in a handful of
+    round trips
+    '''
+    topology = collect_topology(content, root)
+
+    data_dict = topology.skeleton(scope)
+    for record in iter_vm_records(content, root, datastore_index,
+                                  network_index, topology, capacity, scope):
+        add_record(data_dict, record)
+
+    return data_dict
@@ -0,0 +1,86 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+
+'''
+Compact, immutable records of the compute resources of a VM.
+
+The specs (ComputeSpec, VirtualDiskSpec and VirtualNicSpec) copy the
+scalars they need out of pyVmomi objects into these records, so no managed
+or data objects stay referenced once a VM has been described. The records
+are tuples with numeric fields, so they are small, hashable and picklable,
+and are only converted to the nested dictionaries of the output formats
+(as_dictionary) when they are written.
+'''
+
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from utilities import quantize_storage_size
+
+
+class DiskRecord(NamedTuple):
+    label: str
+    capacity_bytes: int
+    ssd: bool
+
+    def as_dictionary(self):
+        details = {'size': quantize_storage_size(self.capacity_bytes)}
+        if self.ssd:
+            details['type'] = 'ssd'
+        return details
+
+
+class NicRecord(NamedTuple):
+    label: str
+    network: Optional[str] = None
+    type: Optional[str] = None
+    # A VLAN id, or a trunk's id ranges as e.g. '1-5,10-20'
+    vlan: Optional[Union[int, str]] = None
+    switch: Optional[str] = None
+    mac: Optional[str] = None
+    subnet: Optional[str] = None
+
+    def as_dictionary(self):
+        return dict((key, value)
+                    for key, value in self._asdict().items()
+                    if key != 'label' and value is not None)
+
+
+class VmRecord(NamedTuple):
+    cores: int
+    memory_mb: int
+    image: str
+    nics: Tuple[NicRecord, ...] = ()
+    disks: Tuple[DiskRecord, ...] = ()
+
+    def as_dictionary(self):
+        '''
+        The compute stanza of a VM, as output by build_data_dictionary
+        '''
+        return {'vm': {'cores': self.cores,
+                       'memory': str(self.memory_mb / 1024) + 'Gb',
+                       'image': self.image,
+                       'nics': dict((nic.label, nic.as_dictionary())
+                                    for nic in self.nics),
+                       'disks': dict((disk.label, disk.as_dictionary())
+                                     for disk in self.disks)}}
@@ -0,0 +1,170 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+
+'''
+Selection of the part of an inventory to collect, and sharding of it.
+
+A Scope narrows collection to datacenters, clusters and VM folders matching
+shell style globs, VMs whose name matches a regular expression, VMs
+carrying given tags, and powered on VMs only. With a shard i/N only every
+VM whose instance UUID hashes to i modulo N is collected, so N processes
+given shards 0/N to N-1/N collect disjoint parts of one vCenter whose
+outputs merge into the whole.
+
+Folders are given as the path below the datacenter's VM folder, e.g.
+'prod/web*'. Tags are the keys in a VM's legacy 'tag' property
+(ManagedEntity.tag), which the PropertyCollector can fetch along with the
+other properties. They are not the tags assigned through the vSphere
+Client, which live in the separate CIS tagging service.
+'''
+
+import argparse
+import fnmatch
+import re
+import zlib
+
+SHARD_PATTERN = re.compile(r'^(\d+)/(\d+)$')
+
+
+def add_scope_arguments(parser):
+    parser.add_argument('--datacenter',
+                        action='append', metavar='GLOB',
+                        help='Only collect datacenters matching GLOB, may '
+                             'be repeated')
+    parser.add_argument('--cluster',
+                        action='append', metavar='GLOB',
+                        help='Only collect clusters (or standalone hosts) '
+                             'matching GLOB, may be repeated')
+    parser.add_argument('--folder',
+                        action='append', metavar='GLOB',
+                        help='Only collect VMs in VM folders matching GLOB, '
+                             'may be repeated')
+    parser.add_argument('--vm',
+                        metavar='REGEX',
+                        help='Only collect VMs whose name matches REGEX')
+    parser.add_argument('--tag',
+                        action='append',
+                        help='Only collect VMs carrying the tag, a key of '
+                             'the legacy ManagedEntity.tag property rather '
+                             'than a vSphere Client tag, may be repeated')
+    parser.add_argument('--powered-on',
+                        action='store_true',
+                        help='Only collect powered on VMs')
+    parser.add_argument('--shard',
+                        type=parse_shard, metavar='I/N',
+                        help='Only collect shard I of N, for I from 0 to '
+                             'N - 1')
+    return parser
+
+
+def parse_shard(value):
+    match = SHARD_PATTERN.match(value)
+    if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise argparse.ArgumentTypeError(
+            'a shard is I/N with 0 <= I < N, not %s' % value)
+    return int(match.group(1)), int(match.group(2))
+
+
+def matches(name, globs):
+    return any(fnmatch.fnmatchcase(name, glob) for glob in globs)
+
+
+def shard_of(key, count):
+    '''
+    The shard of a VM, the same in every process and on every node
+    '''
+    return zlib.crc32(key.encode('utf-8')) % count
+
+
+class Scope:
+
+    def __init__(self, datacenters=None, clusters=None, folders=None,
+                 vm_pattern=None, tags=None, powered_on=False, shard=None):
+        self.datacenters = datacenters or []
+        self.clusters = clusters or []
+        self.folders = folders or []
+        self.vm_pattern = re.compile(vm_pattern) if vm_pattern else None
+        self.tags = set(tags or [])
+        self.powered_on = powered_on
+        self.shard = shard
+
+    def is_everything(self):
+        return not (self.datacenters or self.clusters or self.folders or
+                    self.vm_pattern or self.tags or self.powered_on or
+                    self.shard)
+
+    def filters_location(self):
+        return bool(self.datacenters or self.clusters)
+
+    def selects_datacenter(self, datacenter):
+        return not self.datacenters or matches(datacenter, self.datacenters)
+
+    def selects_location(self, datacenter, cluster):
+        '''
+        Whether the hosts of a cluster (or standalone host) are in scope
+        '''
+        if not self.selects_datacenter(datacenter):
+            return False
+        if self.clusters and not matches(cluster, self.clusters):
+            return False
+        return True
+
+    def vm_properties(self):
+        '''
+        The VM properties selects_vm needs, which are fetched for every VM
+        of the selected hosts before anything else
+        '''
+        properties = ['name', 'runtime.host']
+        if self.folders:
+            properties.append('parent')
+        if self.tags:
+            properties.append('tag')
+        if self.powered_on:
+            properties.append('runtime.powerState')
+        if self.shard:
+            properties.append('config.instanceUuid')
+        return properties
+
+    def selects_vm(self, name, folder=None, tags=(), power_state=None,
+                   uuid=None):
+        if self.vm_pattern and not self.vm_pattern.search(name):
+            return False
+        if self.folders and not matches(folder or '', self.folders):
+            return False
+        if self.tags and not self.tags.issubset(tags):
+            return False
+        if self.powered_on and power_state != 'poweredOn':
+            return False
+        if self.shard:
+            index, count = self.shard
+            if shard_of(uuid or name, count) != index:
+                return False
+        return True
+
+
+def scope_from_args(args):
+    return Scope(datacenters=args.datacenter,
+                 clusters=args.cluster,
+                 folders=args.folder,
+                 vm_pattern=args.vm,
+                 tags=args.tag,
+                 powered_on=args.powered_on,
+                 shard=args.shard)
@@ -0,0 +1,300 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+A local SQLite store of collected per-VM records, and a diff between any
+two snapshots of it.
+
+Records are read from the JSON Lines output of build_data_dictionary:
+
+    ./build_data_dictionary.py -s vcenter -u user -p pass --format jsonl \
+        | ./snapshot_store.py inventory.db record -
+
+Rather than copying the whole estate for each snapshot, a record is stored
+once per version, keyed by VM instance UUID, together with the snapshot it
+appeared in (valid_from) and the snapshot it was superseded or removed in
+(valid_until). A snapshot therefore only adds rows for the VMs that changed,
+and a diff only visits the versions that start or end between the two
+snapshots, so its cost is proportional to the number of changes rather than
+to the size of the estate.
+
+Snapshot ids are taken to be in collection order, so a snapshot cannot be
+recorded with a --collected-at earlier than that of the latest one.
+'''
+
+import argparse
+import datetime
+import hashlib
+import json
+import sqlite3
+import sys
+
+from emitters import dump_yaml
+from emitters import plain_record
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshots (
+    id              INTEGER PRIMARY KEY,
+    collected_at    TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS vm_versions (
+    uuid            TEXT NOT NULL,
+    valid_from      INTEGER NOT NULL REFERENCES snapshots (id),
+    valid_until     INTEGER REFERENCES snapshots (id),
+    digest          TEXT NOT NULL,
+    record          TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vm_versions_uuid
+    ON vm_versions (uuid, valid_from);
+CREATE INDEX IF NOT EXISTS vm_versions_valid_from
+    ON vm_versions (valid_from);
+CREATE INDEX IF NOT EXISTS vm_versions_valid_until
+    ON vm_versions (valid_until);
+'''
+
+
+class SnapshotOrderError(ValueError):
+    '''A snapshot collected before the latest one stored'''
+
+
+def record_key(record):
+    '''
+    VMs are identified by instance UUID, falling back to their location
+    for records collected without one
+    '''
+    if record.get('uuid'):
+        return record['uuid']
+    return '/'.join([record['datacenter'], record['cluster'],
+                     record['host'], record['vm']])
+
+
+def changed_paths(old, new, prefix=''):
+    '''
+    Returns {dotted path: [old value, new value]} for the leaves that differ
+    '''
+    changes = {}
+    for key in sorted(set(old) | set(new)):
+        path = prefix + str(key)
+        old_value = old.get(key)
+        new_value = new.get(key)
+        if isinstance(old_value, dict) and isinstance(new_value, dict):
+            changes.update(changed_paths(old_value, new_value, path + '.'))
+        elif old_value != new_value:
+            changes[path] = [old_value, new_value]
+    return changes
+
+
+class SnapshotStore:
+
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def snapshots(self):
+        return self.connection.execute(
+            'SELECT id, collected_at FROM snapshots ORDER BY id').fetchall()
+
+    def resolve(self, reference):
+        '''
+        Returns the id of a snapshot given its id, its collection timestamp
+        (or a prefix of it), 'latest' or 'previous'
+        '''
+        query = self.connection.execute
+        if reference in ('latest', 'previous'):
+            offset = 0 if reference == 'latest' else 1
+            row = query('SELECT id FROM snapshots ORDER BY id DESC '
+                        'LIMIT 1 OFFSET ?', (offset,)).fetchone()
+        elif reference.isdigit():
+            row = query('SELECT id FROM snapshots WHERE id = ?',
+                        (int(reference),)).fetchone()
+        else:
+            row = query('SELECT id FROM snapshots WHERE collected_at >= ? '
+                        'ORDER BY collected_at LIMIT 1',
+                        (reference,)).fetchone()
+        if row is None:
+            raise KeyError('No such snapshot: %s' % reference)
+        return row[0]
+
+    def record(self, records, collected_at=None):
+        '''
+        Store a snapshot of the given records, returning its id
+        '''
+        if collected_at is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            collected_at = now.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        with self.connection:
+            latest = self.connection.execute(
+                'SELECT MAX(collected_at) FROM snapshots').fetchone()[0]
+            if latest is not None and collected_at <= latest:
+                # Versions are ordered by snapshot id
+                raise SnapshotOrderError(
+                    'Snapshot collected at %s is not later than the latest '
+                    'snapshot, collected at %s' % (collected_at, latest))
+
+            cursor = self.connection.execute(
+                'INSERT INTO snapshots (collected_at) VALUES (?)',
+                (collected_at,))
+            snapshot = cursor.lastrowid
+
+            current = {}
+            for rowid, uuid, digest in self.connection.execute(
+                    'SELECT rowid, uuid, digest FROM vm_versions '
+                    'WHERE valid_until IS NULL'):
+                current[uuid] = (rowid, digest)
+
+            seen = set()
+            for record in records:
+                uuid = record_key(record)
+                if uuid in seen:
+                    continue
+                seen.add(uuid)
+
+                serialized = json.dumps(plain_record(record), sort_keys=True,
+                                        separators=(',', ':'))
+                digest = hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+                if uuid in current:
+                    rowid, current_digest = current[uuid]
+                    if current_digest == digest:
+                        continue
+                    self.end_version(rowid, snapshot)
+                self.connection.execute(
+                    'INSERT INTO vm_versions (uuid, valid_from, digest, '
+                    'record) VALUES (?, ?, ?, ?)',
+                    (uuid, snapshot, digest, serialized))
+
+            for uuid, (rowid, _) in current.items():
+                if uuid not in seen:
+                    self.end_version(rowid, snapshot)
+
+        return snapshot
+
+    def end_version(self, rowid, snapshot):
+        self.connection.execute(
+            'UPDATE vm_versions SET valid_until = ? WHERE rowid = ?',
+            (snapshot, rowid))
+
+    def version_at(self, uuid, snapshot):
+        return self.connection.execute(
+            'SELECT digest, record FROM vm_versions '
+            'WHERE uuid = ? AND valid_from <= ? '
+            'AND (valid_until IS NULL OR valid_until > ?)',
+            (uuid, snapshot, snapshot)).fetchone()
+
+    def diff(self, old, new):
+        '''
+        Returns the VMs added, removed and changed between two snapshot ids
+        '''
+        low, high = min(old, new), max(old, new)
+        uuids = [row[0] for row in self.connection.execute(
+            'SELECT uuid FROM vm_versions '
+            'WHERE valid_from > ? AND valid_from <= ? '
+            'UNION '
+            'SELECT uuid FROM vm_versions '
+            'WHERE valid_until > ? AND valid_until <= ?',
+            (low, high, low, high))]
+
+        result = {'added': [], 'removed': [], 'changed': []}
+        for uuid in sorted(uuids):
+            before = self.version_at(uuid, old)
+            after = self.version_at(uuid, new)
+            if before is None and after is not None:
+                result['added'].append(json.loads(after[1]))
+            elif before is not None and after is None:
+                result['removed'].append(json.loads(before[1]))
+            elif before is not None and before[0] != after[0]:
+                old_record = json.loads(before[1])
+                new_record = json.loads(after[1])
+                result['changed'].append(
+                    {'uuid': uuid,
+                     'vm': new_record['vm'],
+                     'changes': changed_paths(old_record, new_record)})
+        return result
+
+
+def read_json_lines(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Store inventory snapshots and report the differences '
+                    'between them'
+    )
+    parser.add_argument('database',
+                        help='SQLite file holding the snapshots')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser(
+        'record', help='Store a snapshot read from JSON Lines output')
+    record.add_argument('input',
+                        help="build_data_dictionary --format jsonl output, "
+                             "or '-' for stdin")
+    record.add_argument('--collected-at',
+                        help='Timestamp of the snapshot, later than that of '
+                             'the latest snapshot (default: now, UTC)')
+
+    subparsers.add_parser('list', help='List the stored snapshots')
+
+    diff = subparsers.add_parser(
+        'diff', help='Report the VMs added, removed and changed between two '
+                     'snapshots')
+    diff.add_argument('old',
+                      help="Snapshot id, timestamp, 'latest' or 'previous'")
+    diff.add_argument('new', nargs='?', default='latest',
+                      help="Snapshot id, timestamp, 'latest' or 'previous'")
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    store = SnapshotStore(args.database)
+    try:
+        if args.command == 'record':
+            try:
+                if args.input == '-':
+                    snapshot = store.record(read_json_lines(sys.stdin),
+                                            args.collected_at)
+                else:
+                    with open(args.input) as stream:
+                        snapshot = store.record(read_json_lines(stream),
+                                                args.collected_at)
+            except SnapshotOrderError as error:
+                sys.exit(str(error))
+            print('Recorded snapshot %d' % snapshot)
+        elif args.command == 'list':
+            for snapshot, collected_at in store.snapshots():
+                print('%d %s' % (snapshot, collected_at))
+        else:
+            result = store.diff(store.resolve(args.old),
+                                store.resolve(args.new))
+            print(dump_yaml(result))
+    finally:
+        store.close()
+
+if __name__ == '__main__':
+    main()
@@ -32,6 +32,16 @@ def quantize_storage_size(size):
     return '%3.1f%s' % (size, 'Tib')
 
 
+def parse_storage_size(quantized_size):
+    '''
+    Returns the size in bytes of a string produced by quantize_storage_size
+    '''
+    for power, item in enumerate(['bytes', 'Kib', 'Mib', 'Gib', 'Tib']):
+        if quantized_size.endswith(item):
+            return float(quantized_size[:-len(item)]) * 1024 ** power
+    raise ValueError('Unrecognised storage size: %s' % quantized_size)
+
+
 def get_all_attributes(entity):
     list = []
     for attr in dir(entity):
@@ -8,34 +8,48 @@ VMWare MOB:
     Property Path :             config.hardware
 '''
 
-import json
-import yaml
+from lazy import vim
+from records import DiskRecord
+
+def backing_is_ssd(backing, datastore_index=None):
+    '''
+    Returns whether a virtual disk backing lives on SSD. The datastore is
+    resolved through datastore_index when one is supplied.
+    '''
+    if isinstance(backing,
+                  vim.vm.device.VirtualDisk.RawDiskMappingVer1BackingInfo):
+        # The datastore only holds the mapping file, not the LUN itself
+        return False
+
+    datastore = getattr(backing, 'datastore', None)
+    if datastore is None:
+        return False
+
+    if datastore_index is not None:
+        return datastore_index.is_ssd(datastore)
+
+    # NFS, vSAN and vVol datastores carry no vmfs information
+    vmfs = getattr(datastore.info, 'vmfs', None)
+    return vmfs is not None and bool(vmfs.ssd)
 
-from pyVmomi import vim
-from utilities import quantize_storage_size
 
 class VirtualDiskSpec():
 
-    def __init__(self, vm):
-        self.disk_dict = {}
-        config = vm.config
-        hardware = config.hardware
-        devices = hardware.device
+    __slots__ = ('disks',)
+
+    def __init__(self, vm, devices=None, datastore_index=None):
+        disks = []
+        if devices is None:
+            config = vm.config
+            hardware = config.hardware
+            devices = hardware.device
         for device in devices:
             if (type(device) == vim.vm.device.VirtualDisk):
-                details = {}
                 disk_name = device.deviceInfo.label
-
                 size_in_bytes = device.capacityInBytes
-                quantized_size = quantize_storage_size(size_in_bytes)
-                size = quantized_size
-                details['size'] = size
-
-                ssd = device.backing.datastore.info.vmfs.ssd
-                if ssd:
-                    details['type'] = 'ssd'
-
-                self.disk_dict[disk_name] = details
+                ssd = backing_is_ssd(device.backing, datastore_index)
+                disks.append(DiskRecord(disk_name, size_in_bytes, ssd))
+        self.disks = tuple(disks)
 
     def as_dictionary(self):
-        return self.disk_dict
+        return dict((disk.label, disk.as_dictionary()) for disk in self.disks)
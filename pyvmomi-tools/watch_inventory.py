@@ -0,0 +1,237 @@
+# !/usr/bin/env python2
+#
+# -*- coding: utf-8 -*-
+#
+#  Contributors: John Rearden
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+
+'''
+Keep an up to date model of the inventory by following PropertyCollector
+change notifications rather than re-reading the whole inventory.
+
+The initial fetch and every subsequent change arrive through
+WaitForUpdatesEx. Only the objects that changed (VMs added, removed or
+reconfigured, disks added, VMs moved to another host, ...) are updated in
+the model, and the document is re-emitted after each set of changes and/or
+served over HTTP on demand.
+'''
+
+import os
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from lazy import vim
+from lazy import vmodl
+
+from login import build_arg_parser
+from login import get_service_instance
+from compute_spec import ComputeSpec
+from datastore_index import build_datastore_index
+from network_index import build_network_index
+from emitters import dump_yaml
+from property_collector import PAGE_SIZE
+from property_collector import VM_PROPERTIES
+from property_collector import Topology
+from property_collector import add_record
+from property_collector import build_filter_spec
+from property_collector import make_record
+from property_collector import topology_properties
+
+MAX_WAIT_SECONDS = 60
+
+
+def get_args():
+    parser = build_arg_parser()
+    parser.add_argument('--output',
+                        action='store',
+                        help='File to rewrite with the current document '
+                             'after every set of changes (default: stdout)')
+    parser.add_argument('--serve',
+                        type=int, action='store', metavar='PORT',
+                        help='Serve the current document over HTTP on PORT')
+    parser.add_argument('--max-wait',
+                        type=int, default=MAX_WAIT_SECONDS, action='store',
+                        help='Seconds each WaitForUpdatesEx call may block')
+    return parser.parse_args()
+
+
+class InventoryModel:
+    '''
+    The inventory as last reported by the PropertyCollector. Compute specs
+    are rebuilt only for VMs whose properties changed; locations are
+    resolved when the document is rendered, so a vMotion or a host moving
+    cluster costs nothing more than the property change itself.
+    '''
+
+    def __init__(self, datastore_index=None, network_index=None):
+        self.datastore_index = datastore_index
+        self.network_index = network_index
+        self.topology = Topology()
+        self.vms = {}
+        self.compute = {}
+        self.version = ''
+        self.lock = threading.Lock()
+
+    def apply(self, update_set):
+        with self.lock:
+            for filter_update in update_set.filterSet:
+                for object_update in filter_update.objectSet:
+                    self.apply_object_update(object_update)
+            self.version = update_set.version
+
+    def apply_object_update(self, object_update):
+        entity = object_update.obj
+        is_vm = isinstance(entity, vim.VirtualMachine)
+
+        if object_update.kind == 'leave':
+            if is_vm:
+                self.vms.pop(entity, None)
+                self.compute.pop(entity, None)
+            else:
+                self.topology.remove(entity)
+            return
+
+        if is_vm:
+            properties = self.vms.setdefault(entity, {})
+        else:
+            properties = dict(self.topology.entities.get(entity, {}))
+
+        for change in object_update.changeSet:
+            if change.op == 'assign':
+                properties[change.name] = change.val
+            elif change.op in ('remove', 'indirectRemove'):
+                properties.pop(change.name, None)
+
+        if is_vm:
+            self.compute.pop(entity, None)
+        else:
+            self.topology.add(entity, properties)
+
+    def document(self):
+        with self.lock:
+            data_dict = self.topology.skeleton()
+            for vm, properties in self.vms.items():
+                host = properties.get('runtime.host')
+                if host is None or host not in self.topology.entities:
+                    continue
+                if vm not in self.compute:
+                    self.compute[vm] = ComputeSpec(
+                        vm, properties=properties,
+                        datastore_index=self.datastore_index,
+                        network_index=self.network_index).record
+                dc_name, cluster_name, hostname = self.topology.locate(host)
+                add_record(data_dict,
+                           make_record(dc_name, cluster_name, hostname,
+                                       properties['name'],
+                                       properties.get('config.instanceUuid'),
+                                       self.compute[vm]))
+            return data_dict
+
+
+def watch(content, model, on_change, max_wait=MAX_WAIT_SECONDS):
+    '''
+    Follow the inventory until interrupted, calling on_change(model) after
+    each complete set of changes
+    '''
+    property_specs = topology_properties()
+    property_specs[vim.VirtualMachine] = VM_PROPERTIES
+
+    collector = content.propertyCollector.CreatePropertyCollector()
+    view = content.viewManager.CreateContainerView(content.rootFolder,
+                                                   list(property_specs),
+                                                   True)
+    try:
+        # Without partial updates a disk or NIC being added, removed or
+        # reconfigured arrives as an assign of the whole device list, rather
+        # than as add and remove ops on indexed paths such as
+        # config.hardware.device[2001]
+        collector.CreateFilter(build_filter_spec(view, property_specs),
+                               partialUpdates=False)
+        options = vmodl.query.PropertyCollector.WaitOptions(
+            maxWaitSeconds=max_wait, maxObjectUpdates=PAGE_SIZE)
+        while True:
+            update_set = collector.WaitForUpdatesEx(model.version, options)
+            if update_set is None:
+                # Nothing changed within max_wait
+                continue
+            model.apply(update_set)
+            if not update_set.truncated:
+                on_change(model)
+    finally:
+        collector.Destroy()
+        view.Destroy()
+
+
+def write_document(model, filename):
+    document = dump_yaml(model.document())
+    partial = filename + '.partial'
+    with open(partial, 'w') as output:
+        output.write(document)
+    os.replace(partial, filename)
+
+
+def serve(model, port):
+    class DocumentHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = dump_yaml(model.document()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/yaml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('', port), DocumentHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    args = get_args()
+    si = get_service_instance(args)
+    if not si:
+        raise Exception('Authentication failed ...... please check your \
+                        credentials and try again')
+
+    content = si.RetrieveContent()
+    model = InventoryModel(build_datastore_index(content),
+                           build_network_index(content))
+
+    if args.serve:
+        serve(model, args.serve)
+
+    if args.output:
+        def on_change(model):
+            write_document(model, args.output)
+    elif args.serve:
+        def on_change(model):
+            pass
+    else:
+        def on_change(model):
+            print('---')
+            print(dump_yaml(model.document()))
+            sys.stdout.flush()
+
+    try:
+        watch(content, model, on_change, args.max_wait)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
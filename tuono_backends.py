@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Provisioning backends for the Tuono credential add tool.
+
+Both backends implement the ProvisioningBackend interface:
+
+    cli     shells out to the aws and az command line tools (default)
+    sdk     calls AWS through boto3 and Azure through Microsoft Graph and
+            azure-mgmt-authorization, with clients created once and reused
+
+The sdk backend needs boto3, azure-identity, azure-mgmt-authorization and
+azure-mgmt-resource. Its endpoints can be pointed at local stand-ins (such
+as a moto server, and tuono_fake_graph for Microsoft Graph) for testing.
+
+A backend must implement every method of ProvisioningBackend, or it cannot
+be instantiated.
+'''
+
+import base64
+import datetime
+import json
+import os
+import subprocess
+import uuid
+
+from abc import ABC
+from abc import abstractmethod
+
+CONTRIBUTOR_ROLE = 'b24988ac-6180-42a0-ab88-20f7382dd24c'
+
+GRAPH_URL = 'https://graph.microsoft.com/v1.0'
+
+# Microsoft Graph: (connect, read) timeouts in seconds
+GRAPH_TIMEOUT = (10, 60)
+
+SECRET_LIFETIME_YEARS = 5
+
+# IAM allows a user this many access keys
+ACCESS_KEY_LIMIT = 2
+
+# Written to the App Registrations created here, so that only those are
+# ever adopted by name when a run is resumed
+APP_TAG = 'tuono-credential-add'
+
+
+class ProvisioningBackend(ABC):
+    '''Operations used to provision AWS and Azure credentials'''
+
+    @abstractmethod
+    def get_user(self, user_name):
+        '''Existence check: the get-user response, or None'''
+
+    @abstractmethod
+    def create_user(self, user_name):
+        '''Create an IAM user, returning the create-user response'''
+
+    @abstractmethod
+    def get_group(self, group_name):
+        '''Existence check: the get-group response, or None'''
+
+    @abstractmethod
+    def create_group(self, group_name):
+        '''Create an IAM group, returning the create-group response'''
+
+    @abstractmethod
+    def attach_group_policy(self, group_name, policy_arn):
+        '''Attach a managed policy to an IAM group'''
+
+    @abstractmethod
+    def add_user_to_group(self, user_name, group_name):
+        '''Add an IAM user to an IAM group'''
+
+    @abstractmethod
+    def list_access_keys(self, user_name):
+        '''The ids of the access keys of an IAM user'''
+
+    @abstractmethod
+    def create_access_key(self, user_name):
+        '''Create an access key, returning its AccessKey structure'''
+
+    @abstractmethod
+    def access_key_ready(self, keys):
+        '''Probe: the new access key can make EC2 calls'''
+
+    @abstractmethod
+    def azure_account(self):
+        '''The tenant and account signed in to Azure, as "tenant/account"'''
+
+    @abstractmethod
+    def list_subscriptions(self):
+        '''List the Azure subscriptions as {"id", "name", "tenantId"}'''
+
+    @abstractmethod
+    def find_app(self, display_name):
+        '''Existence check: the App Registration named display_name, or None'''
+
+    @abstractmethod
+    def create_app(self, display_name):
+        '''Create an App Registration tagged APP_TAG, returning it (with
+        "appId" and the object "id")'''
+
+    @abstractmethod
+    def reset_app_credential(self, app, description):
+        '''Create a client secret for the App Registration app, as returned
+        by create_app or find_app, as {"appId", "password", "tenant"}'''
+
+    @abstractmethod
+    def app_credential_ready(self, app_id):
+        '''Probe: the client secret is listed against the app'''
+
+    @abstractmethod
+    def create_service_principal(self, app_id):
+        '''Create the Service Principal of an app'''
+
+    @abstractmethod
+    def service_principal_ready(self, app_id):
+        '''Probe: the Service Principal can be read back'''
+
+    @abstractmethod
+    def create_role_assignment(self, app_id, subscription_id):
+        '''Assign the Contributor role on a subscription to an app'''
+
+    @abstractmethod
+    def role_assignment_ready(self, app_id, subscription_id):
+        '''Probe: the role assignment is listed'''
+
+
+def run_cli(command, capture_output=True):
+    '''Run a provisioning command, returning its parsed JSON output'''
+
+    result = subprocess.run(command, check=True, shell=True,
+                            capture_output=capture_output)
+    if capture_output and result.stdout.strip():
+        return json.loads(result.stdout)
+    return None
+
+
+def cli_output(command, env=None):
+    '''Run a probe command, returning its parsed JSON output or None'''
+
+    result = subprocess.run(command, shell=True, capture_output=True,
+                            env=env)
+    if result.returncode != 0:
+        return None
+    try:
+        return json.loads(result.stdout or 'null')
+    except ValueError:
+        return None
+
+
+def azure_cli_account():
+    '''The tenant and user of the default az CLI subscription, or None'''
+
+    directory = os.environ.get('AZURE_CONFIG_DIR',
+                               os.path.join(os.path.expanduser('~'),
+                                            '.azure'))
+    try:
+        # The az CLI writes its profile with a byte order mark
+        with open(os.path.join(directory, 'azureProfile.json'),
+                  encoding='utf-8-sig') as profile:
+            subscriptions = json.load(profile).get('subscriptions', [])
+    except (OSError, ValueError):
+        return None
+    for subscription in subscriptions:
+        if subscription.get('isDefault'):
+            return (f"{subscription.get('tenantId')}/"
+                    f"{subscription.get('user', {}).get('name')}")
+    return None
+
+
+def token_claims(token):
+    '''The claims of a JWT access token, or {} if it is not one'''
+
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except (IndexError, ValueError):
+        return {}
+
+
+class CliBackend(ProvisioningBackend):
+    '''Provision through the aws and az command line tools'''
+
+    def get_user(self, user_name):
+        return cli_output(f"aws iam get-user --user-name {user_name} "
+                          f"--output json")
+
+    def create_user(self, user_name):
+        return run_cli(f"aws iam create-user --user-name {user_name} "
+                       f"--output json")
+
+    def get_group(self, group_name):
+        return cli_output(f"aws iam get-group --group-name {group_name} "
+                          f"--output json")
+
+    def create_group(self, group_name):
+        return run_cli(f"aws iam create-group --group-name "
+                       f"{group_name} --output json")
+
+    def attach_group_policy(self, group_name, policy_arn):
+        run_cli(f"aws iam attach-group-policy "
+                f"--policy-arn {policy_arn} "
+                f"--group-name {group_name} --output json",
+                capture_output=False)
+
+    def add_user_to_group(self, user_name, group_name):
+        run_cli(f"aws iam add-user-to-group --user-name {user_name} "
+                f"--group-name {group_name} --output json",
+                capture_output=False)
+
+    def list_access_keys(self, user_name):
+        keys = run_cli(f"aws iam list-access-keys --user-name {user_name} "
+                       f"--output json")
+        return [key['AccessKeyId'] for key in keys['AccessKeyMetadata']]
+
+    def create_access_key(self, user_name):
+        keys = run_cli(f"aws iam create-access-key --user-name "
+                       f"{user_name} --output json")
+        return keys['AccessKey']
+
+    def access_key_ready(self, keys):
+        env = dict(os.environ,
+                   AWS_ACCESS_KEY_ID=keys['AccessKeyId'],
+                   AWS_SECRET_ACCESS_KEY=keys['SecretAccessKey'])
+        for variable in ('AWS_SESSION_TOKEN', 'AWS_PROFILE'):
+            env.pop(variable, None)
+
+        return cli_output("aws ec2 describe-regions --region us-east-1 "
+                          "--output json", env=env) is not None
+
+    def azure_account(self):
+        account = azure_cli_account()
+        if account is None:
+            shown = run_cli("az account show")
+            account = f"{shown['tenantId']}/{shown['user']['name']}"
+        return account
+
+    def list_subscriptions(self):
+        return run_cli("az account list")
+
+    def find_app(self, display_name):
+        apps = cli_output(f"az ad app list --display-name {display_name}")
+        return apps[0] if apps else None
+
+    def create_app(self, display_name):
+        app = run_cli(f"az ad app create --display-name {display_name}")
+        # az ad app create cannot set tags itself
+        run_cli(f"az rest --method PATCH "
+                f"--uri {GRAPH_URL}/applications/{app['id']} "
+                f"--headers Content-Type=application/json "
+                f"--body '{json.dumps({'tags': [APP_TAG]})}'",
+                capture_output=False)
+        app['tags'] = [APP_TAG]
+        return app
+
+    def reset_app_credential(self, app, description):
+        return run_cli(f'az ad app credential reset --id {app["appId"]} '
+                       f'--credential-description {description} '
+                       f'--end-date `date -d "+{SECRET_LIFETIME_YEARS} '
+                       f'years" +%F`')
+
+    def app_credential_ready(self, app_id):
+        return bool(cli_output(f"az ad app credential list --id {app_id}"))
+
+    def create_service_principal(self, app_id):
+        run_cli(f"az ad sp create --id {app_id}")
+
+    def service_principal_ready(self, app_id):
+        return cli_output(f"az ad sp show --id {app_id}") is not None
+
+    def create_role_assignment(self, app_id, subscription_id):
+        run_cli(f"az role assignment create --assignee {app_id} "
+                f"--role Contributor --subscription {subscription_id}")
+
+    def role_assignment_ready(self, app_id, subscription_id):
+        return bool(cli_output(f"az role assignment list --assignee {app_id} "
+                               f"--subscription {subscription_id}"))
+
+
+class SdkBackend(ProvisioningBackend):
+    '''Provision through boto3, Microsoft Graph and the Azure SDK'''
+
+    def __init__(self, aws_endpoint_url=None, graph_url=GRAPH_URL,
+                 azure_credential=None):
+        # Imported here so that the cli backend needs none of the SDKs
+        import boto3
+        import botocore.exceptions
+        import requests
+
+        self.boto3 = boto3
+        self.client_error = botocore.exceptions.ClientError
+        self.botocore_error = botocore.exceptions.BotoCoreError
+        self.aws_endpoint_url = aws_endpoint_url
+        self.iam = boto3.client('iam', endpoint_url=aws_endpoint_url)
+
+        self.graph_url = graph_url.rstrip('/')
+        self.graph = requests.Session()
+        self.azure_credential = azure_credential
+        self.authorization_clients = {}
+        self.service_principals = {}
+        self.tenant = None
+
+    # AWS
+
+    def iam_entity(self, method, **kwargs):
+        '''Call an IAM get method, returning None for a missing entity'''
+
+        try:
+            return method(**kwargs)
+        except self.client_error as exc:
+            if exc.response['Error']['Code'] == 'NoSuchEntity':
+                return None
+            raise
+
+    def get_user(self, user_name):
+        return self.iam_entity(self.iam.get_user, UserName=user_name)
+
+    def create_user(self, user_name):
+        return self.iam.create_user(UserName=user_name)
+
+    def get_group(self, group_name):
+        return self.iam_entity(self.iam.get_group, GroupName=group_name)
+
+    def create_group(self, group_name):
+        return self.iam.create_group(GroupName=group_name)
+
+    def attach_group_policy(self, group_name, policy_arn):
+        self.iam.attach_group_policy(GroupName=group_name,
+                                     PolicyArn=policy_arn)
+
+    def add_user_to_group(self, user_name, group_name):
+        self.iam.add_user_to_group(UserName=user_name, GroupName=group_name)
+
+    def list_access_keys(self, user_name):
+        keys = self.iam.list_access_keys(UserName=user_name)
+        return [key['AccessKeyId'] for key in keys['AccessKeyMetadata']]
+
+    def create_access_key(self, user_name):
+        return self.iam.create_access_key(UserName=user_name)['AccessKey']
+
+    def access_key_ready(self, keys):
+        ec2 = self.boto3.client('ec2', region_name='us-east-1',
+                                endpoint_url=self.aws_endpoint_url,
+                                aws_access_key_id=keys['AccessKeyId'],
+                                aws_secret_access_key=keys['SecretAccessKey'])
+        try:
+            ec2.describe_regions()
+        except (self.client_error, self.botocore_error):
+            # Also connection and credential errors, as wait_until only
+            # retries a False
+            return False
+        return True
+
+    # Azure
+
+    def credential(self):
+        if self.azure_credential is None:
+            from azure.identity import DefaultAzureCredential
+            self.azure_credential = DefaultAzureCredential()
+        return self.azure_credential
+
+    def graph_request(self, method, path, body=None):
+        '''Call Microsoft Graph, returning the parsed response or None'''
+
+        token = self.credential().get_token(
+            'https://graph.microsoft.com/.default').token
+        response = self.graph.request(
+            method, f"{self.graph_url}{path}", json=body,
+            headers={'Authorization': f'Bearer {token}'},
+            timeout=GRAPH_TIMEOUT)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        if response.content:
+            return response.json()
+        return {}
+
+    def authorization_client(self, subscription_id):
+        if subscription_id not in self.authorization_clients:
+            from azure.mgmt.authorization import AuthorizationManagementClient
+            self.authorization_clients[subscription_id] = \
+                AuthorizationManagementClient(self.credential(),
+                                              subscription_id)
+        return self.authorization_clients[subscription_id]
+
+    def azure_account(self):
+        token = self.credential().get_token(
+            'https://management.azure.com/.default').token
+        claims = token_claims(token)
+        if 'tid' in claims:
+            return f"{claims['tid']}/{claims.get('oid')}"
+        return azure_cli_account() or 'default'
+
+    def list_subscriptions(self):
+        from azure.mgmt.resource import SubscriptionClient
+
+        client = SubscriptionClient(self.credential())
+        return [{'id': subscription.subscription_id,
+                 'name': subscription.display_name,
+                 'tenantId': subscription.tenant_id}
+                for subscription in client.subscriptions.list()]
+
+    def find_app(self, display_name):
+        # OData string literals escape a quote by doubling it
+        quoted = display_name.replace("'", "''")
+        apps = self.graph_request(
+            'GET', f"/applications?$filter=displayName eq '{quoted}'")
+        if apps and apps.get('value'):
+            return apps['value'][0]
+        return None
+
+    def create_app(self, display_name):
+        return self.graph_request('POST', '/applications',
+                                  {'displayName': display_name,
+                                   'tags': [APP_TAG]})
+
+    def application(self, app_id):
+        return self.graph_request('GET', f"/applications(appId='{app_id}')")
+
+    def reset_app_credential(self, app, description):
+        if self.tenant is None:
+            organization = self.graph_request('GET', '/organization')
+            self.tenant = organization['value'][0]['id']
+
+        end = datetime.datetime.now(datetime.timezone.utc) + \
+            datetime.timedelta(days=365 * SECRET_LIFETIME_YEARS)
+        # The object id comes from the create response: looking the app up
+        # by appId can still 404 until Graph has replicated it
+        secret = self.graph_request(
+            'POST', f"/applications/{app['id']}/addPassword",
+            {'passwordCredential': {'displayName': description,
+                                    'endDateTime': end.isoformat()}})
+        return {'appId': app['appId'],
+                'password': secret['secretText'],
+                'tenant': self.tenant}
+
+    def app_credential_ready(self, app_id):
+        application = self.application(app_id)
+        return bool(application and application.get('passwordCredentials'))
+
+    def create_service_principal(self, app_id):
+        principal = self.graph_request('POST', '/servicePrincipals',
+                                       {'appId': app_id})
+        self.service_principals[app_id] = principal['id']
+
+    def service_principal(self, app_id):
+        if app_id not in self.service_principals:
+            principal = self.graph_request(
+                'GET', f"/servicePrincipals(appId='{app_id}')")
+            if principal is None:
+                return None
+            self.service_principals[app_id] = principal['id']
+        return self.service_principals[app_id]
+
+    def service_principal_ready(self, app_id):
+        return self.graph_request(
+            'GET', f"/servicePrincipals(appId='{app_id}')") is not None
+
+    def create_role_assignment(self, app_id, subscription_id):
+        from azure.mgmt.authorization.models import \
+            RoleAssignmentCreateParameters
+
+        scope = f'/subscriptions/{subscription_id}'
+        parameters = RoleAssignmentCreateParameters(
+            role_definition_id=(f'{scope}/providers/Microsoft.Authorization/'
+                                f'roleDefinitions/{CONTRIBUTOR_ROLE}'),
+            principal_id=self.service_principal(app_id),
+            principal_type='ServicePrincipal')
+        self.authorization_client(subscription_id).role_assignments.create(
+            scope, str(uuid.uuid4()), parameters)
+
+    def role_assignment_ready(self, app_id, subscription_id):
+        principal_id = self.service_principal(app_id)
+        assignments = self.authorization_client(subscription_id) \
+            .role_assignments.list_for_scope(
+                f'/subscriptions/{subscription_id}',
+                filter=f"assignedTo('{principal_id}')")
+        return any(True for _ in assignments)
+
+
+BACKENDS = {'cli': CliBackend,
+            'sdk': SdkBackend}
+
+
+def get_backend(name, **kwargs):
+    '''Instantiate the named backend'''
+
+    return BACKENDS[name](**kwargs)
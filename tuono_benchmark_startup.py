@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Startup benchmark for the commands of tuono_tools.
+
+Runs every command (or those named) with --help in a fresh interpreter
+under python -X importtime, and reports the median wall time and the median
+time spent importing modules, beyond what the interpreter imports on its
+own, over --runs runs.
+
+It exits with status 1, listing the offending commands, when a command
+imports one of HEAVY_MODULES before it has parsed its arguments, or when its
+median import time exceeds --budget-ms, so that it can guard startup latency
+in CI or before a release:
+
+    python tuono_benchmark_startup.py
+    python tuono_benchmark_startup.py build-data-dictionary --runs 20
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from tuono_tools import COMMANDS
+
+ENTRY_POINT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'tuono_tools.py')
+
+# Modules that must only be imported once a command has work to do
+HEAVY_MODULES = ('pyVmomi', 'pyVim', 'requests', 'urllib3', 'numpy',
+                 'boto3', 'botocore', 'azure', 'msgraph', 'asyncio')
+
+DEFAULT_RUNS = 5
+DEFAULT_BUDGET_MS = 150
+
+
+def parse_importtime(stderr):
+    '''Return the import time in ms and the modules imported'''
+
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        # Nested imports are indented, and counted in their parent's time
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def measure(arguments):
+    '''Run the entry point once, returning wall ms, import ms and modules'''
+
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + arguments,
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE,
+                             text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    import_ms, modules = parse_importtime(process.stderr)
+    return wall_ms, import_ms, modules
+
+
+def heavy_modules(modules):
+    '''Return the heavy modules among those imported'''
+
+    return sorted({module.split('.')[0] for module in modules
+                   if module.split('.')[0] in HEAVY_MODULES})
+
+
+def benchmark(commands, runs):
+    '''Return {command: (wall ms, import ms, heavy modules)}, medians'''
+
+    baseline = [measure(['-c', 'pass'])[1] for _ in range(runs)]
+    baseline_ms = statistics.median(baseline)
+
+    results = {}
+    for command in commands:
+        arguments = [ENTRY_POINT] + ([command, '--help'] if command else [])
+        samples = [measure(arguments) for _ in range(runs)]
+        results[command or '(list)'] = (
+            statistics.median(wall for wall, _, _ in samples),
+            max(statistics.median(imports for _, imports, _ in samples)
+                - baseline_ms, 0),
+            heavy_modules(set().union(*[modules
+                                        for _, _, modules in samples])))
+    return baseline_ms, results
+
+
+def get_args():
+    '''Parse the command line'''
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the startup of the tuono_tools commands')
+    parser.add_argument('commands', nargs='*', metavar='command',
+                        help='commands to benchmark (default: all)')
+    parser.add_argument('-r', '--runs', type=int, default=DEFAULT_RUNS,
+                        help='runs of each command (default: %(default)s)')
+    parser.add_argument('-b', '--budget-ms', type=float,
+                        default=DEFAULT_BUDGET_MS,
+                        help='largest median import time allowed for a '
+                             'command, beyond the interpreter\'s own, in ms '
+                             '(default: %(default)s)')
+    args = parser.parse_args()
+
+    unknown = [command for command in args.commands
+               if command not in COMMANDS]
+    if unknown:
+        parser.error(f'unknown commands: {", ".join(unknown)}')
+    if args.runs < 1:
+        parser.error('--runs must be at least 1')
+
+    return args
+
+
+def main():
+    '''Benchmark the commands and check them against the budget'''
+
+    args = get_args()
+    commands = args.commands or [''] + list(COMMANDS)
+
+    baseline_ms, results = benchmark(commands, args.runs)
+
+    width = max(len(command) for command in results)
+    print(f'interpreter imports: {baseline_ms:.1f} ms, '
+          f'median of {args.runs} runs\n')
+    print(f'{"command":<{width}}  {"wall ms":>8}  {"import ms":>9}  heavy')
+    failures = []
+    for command, (wall_ms, import_ms, heavy) in results.items():
+        print(f'{command:<{width}}  {wall_ms:8.1f}  {import_ms:9.1f}  '
+              f'{", ".join(heavy) or "-"}')
+        if heavy:
+            failures.append(f'{command} imports {", ".join(heavy)}')
+        if import_ms > args.budget_ms:
+            failures.append(f'{command} imports for {import_ms:.1f} ms, '
+                            f'over the {args.budget_ms:g} ms budget')
+
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -32,39 +32,190 @@ USAGE: ./tuono_credential_add.py --username <username>
                                 --venue aws
                                   --iam_user <iam_user>
                                   --iam_group <iam_group>
+                                --manifest <manifest.csv|manifest.yaml>
+                                  --workers <workers> (optional)
+                                 --backend cli|sdk (optional)
+                                 --journal <journal.json> (optional)
+                                 --repush (optional)
+                                 --subscription-ttl <seconds> (optional)
+                                 --spans <spans.jsonl> (optional)
+                                 --metrics <file.prom> (optional)
+                                   --metrics-format prometheus|openmetrics
+                                 --portal-url <url> (optional)
+
+A manifest onboards several targets in one run, logging in to the Tuono
+Portal once and provisioning up to --workers targets at a time. It is a CSV
+file with a header row, or a YAML list of mappings, with the keys:
+
+    venue, iam_user, iam_group                          (aws)
+    venue, subscription_name, app_name, credential      (azure)
+
+Resources are provisioned with the aws and az CLIs by default, or with
+boto3 and the Azure SDKs with --backend sdk (see tuono_backends).
+
+Completed steps are recorded in a local journal (--journal, default
+~/.local/state/tuono/journal.json, see tuono_journal). Rerunning a failed
+run resumes from the first incomplete step, and resources that already
+exist are reused. Journal entries are kept per portal (--portal-url) and
+username, and --repush forgets them to push new credentials. An App
+Registration is only reused if this tool created it, and an IAM user that
+already has two access keys is reported rather than given a third.
+
+Azure subscriptions are looked up by name or id in a listing cached for
+--subscription-ttl seconds (see tuono_subscriptions).
+
+Every backend call, wait and Tuono Portal request is timed. The timings are
+summarised at the end of the run and written to --spans as JSON Lines, and
+to --metrics as a Prometheus textfile or OpenMetrics (see tuono_metrics).
+
+The Tuono Portal API is reached at --portal-url, by default the production
+portal. tuono_mock_portal serves a local stand-in of it, and tuono_load_test
+measures credential pushes against either.
+
+The tool is also the credential-add command of tuono_tools.
 '''
 
 import argparse
+import csv
 import getpass
 import json
 import logging
 import sys
 import subprocess
+import threading
 import time
-import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+
+from tuono_backends import ACCESS_KEY_LIMIT
+from tuono_backends import APP_TAG
+from tuono_backends import BACKENDS
+from tuono_backends import GRAPH_URL
+from tuono_backends import get_backend
+
+from tuono_dag import StepGraph
+
+from tuono_journal import JOURNAL
+from tuono_journal import Journal
+
+from tuono_metrics import METRICS_FORMATS
+from tuono_metrics import SPANS
+from tuono_metrics import TRACER
+from tuono_metrics import TracedBackend
+from tuono_metrics import span
+
+from tuono_subscriptions import SUBSCRIPTION_TTL
+from tuono_subscriptions import SubscriptionIndex
+from tuono_subscriptions import SubscriptionNotFound
+
+MANIFEST_KEYS = {'aws': ('iam_user', 'iam_group'),
+                 'azure': ('subscription_name', 'app_name', 'credential')}
+
+DEFAULT_WORKERS = 4
+
+REPORT = 'tuono_batch_report.json'
+
+BASE_URI = 'https://portal.tuono.io/api/v1'
+
+# Tuono Portal API: (connect, read) timeouts in seconds, retries on
+# throttled or unavailable responses and the connection pool size
+TIMEOUT = (10, 60)
+RETRIES = 5
+RETRY_STATUSES = (429, 502, 503, 504)
+POOL_SIZE = 32
+
+# Pushing credentials starts a portal job, so it is only retried when the
+# portal cannot have received it: connection errors, and responses saying
+# the request was not processed
+POST_RETRY_STATUSES = (429, 503)
+
+# Status of a job still pending when the wait for it timed out
+JOB_PENDING = 412
+
+# Job polling: first poll after JOB_INITIAL_DELAY seconds, doubling up to
+# JOB_MAX_DELAY, giving up after JOB_TIMEOUT
+JOB_INITIAL_DELAY = 2
+JOB_MAX_DELAY = 30
+JOB_TIMEOUT = 900
+
+# Readiness polling: first retry after INITIAL_DELAY seconds, doubling up
+# to MAX_DELAY, giving up after READINESS_TIMEOUT
+INITIAL_DELAY = 1
+MAX_DELAY = 16
+READINESS_TIMEOUT = 300
+
+
+def build_session(retries=RETRIES, base_uri=BASE_URI):
+    '''Create a keep-alive session retrying throttled and unavailable calls'''
+
+    # requests is imported here rather than at the top of the module so that
+    # --help and argument errors do not pay for importing it
+    import requests
+
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries,
+                  backoff_factor=1,
+                  status_forcelist=RETRY_STATUSES,
+                  allowed_methods=frozenset(['GET', 'POST']),
+                  respect_retry_after_header=True,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=POOL_SIZE)
+
+    # Credential pushes are not idempotent: a read timeout, 502 or 504 may
+    # come after the portal has started the job
+    post_retry = Retry(total=retries,
+                       read=0,
+                       backoff_factor=1,
+                       status_forcelist=POST_RETRY_STATUSES,
+                       allowed_methods=frozenset(['POST']),
+                       respect_retry_after_header=True,
+                       raise_on_status=False)
+    post_adapter = HTTPAdapter(max_retries=post_retry,
+                               pool_maxsize=POOL_SIZE)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # requests uses the adapter with the longest matching prefix
+    session.mount(f'{base_uri.rstrip("/")}/credential/', post_adapter)
+    return session
 
 
 class Tuono():
     '''Base class'''
 
-    def __init__(self, username, password):
+    def __init__(self, username, password, timeout=TIMEOUT, retries=RETRIES,
+                 base_uri=BASE_URI, job_initial_delay=JOB_INITIAL_DELAY,
+                 job_max_delay=JOB_MAX_DELAY):
         '''Instantiate a generic connection instance'''
 
-        self.base_uri = 'https://portal.tuono.io/api/v1'
+        self.base_uri = base_uri.rstrip('/')
 
         self.headers = {'Content-Type': 'application/json'}
 
         self.creds = {'username': username,
                       'password': password}
 
+        self.timeout = timeout
+
+        self.job_initial_delay = job_initial_delay
+        self.job_max_delay = job_max_delay
+
+        self.session = build_session(retries, self.base_uri)
+
         self.get_token()
 
     def get_token(self):
         '''Create token class object'''
 
-        request = requests.post(url=f'{self.base_uri}/auth/login',
-                                headers=self.headers,
-                                data=json.dumps(self.creds))
+        with span('portal.login'):
+            request = self.session.post(url=f'{self.base_uri}/auth/login',
+                                        headers=self.headers,
+                                        data=json.dumps(self.creds),
+                                        timeout=self.timeout)
         if not request.ok:
 
             print(f"Error getting auth token: {request.text}")
@@ -78,22 +229,83 @@ class Tuono():
     def add_credentials(self, payload, venue):
         '''Add credentials'''
 
-        request = requests.post(url=f'{self.base_uri}/credential/{venue}',
-                                headers=self.headers,
-                                data=json.dumps(payload))
+        with span('portal.credential_post', venue=venue):
+            request = self.session.post(
+                url=f'{self.base_uri}/credential/{venue}',
+                headers=self.headers,
+                data=json.dumps(payload),
+                timeout=self.timeout)
 
         return request.json()['object']
 
     def get_job(self, job_id):
         '''Invoke Job GET method'''
 
-        request = requests.get(url=f'{self.base_uri}/async_job?job_id={job_id}',
-                               headers=self.headers)
+        with span('portal.get_job', job_id=job_id):
+            request = self.session.get(
+                url=f'{self.base_uri}/async_job?job_id={job_id}',
+                headers=self.headers,
+                timeout=self.timeout)
+            response = request.json()
 
-        if not 'object' in request.json().keys():
-            return request.json()['status']
+        if not 'object' in response.keys():
+            return response['status']
         else:
-            return request.json()['object']['status']
+            return response['object']['status']
+
+    def wait_for_job(self, job_id, timeout=JOB_TIMEOUT, logger=None):
+        '''Poll a job with exponential backoff until it has finished'''
+
+        deadline = time.monotonic() + timeout
+        delay = self.job_initial_delay
+
+        with span('portal.job_wait', job_id=job_id):
+            job_status = self.get_job(job_id)
+            while job_status == JOB_PENDING and time.monotonic() < deadline:
+                if logger:
+                    logger.info(f"Job still running")
+                time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+                delay = min(delay * 2, self.job_max_delay)
+                job_status = self.get_job(job_id)
+
+        return job_status
+
+    async def async_wait_for_job(self, job_id, timeout=JOB_TIMEOUT):
+        '''Coroutine variant of wait_for_job'''
+
+        import asyncio
+
+        deadline = time.monotonic() + timeout
+        delay = self.job_initial_delay
+
+        with span('portal.job_wait', job_id=job_id):
+            job_status = await asyncio.to_thread(self.get_job, job_id)
+            while job_status == JOB_PENDING and time.monotonic() < deadline:
+                await asyncio.sleep(min(delay,
+                                        max(deadline - time.monotonic(), 0)))
+                delay = min(delay * 2, self.job_max_delay)
+                job_status = await asyncio.to_thread(self.get_job, job_id)
+
+        return job_status
+
+    def wait_for_jobs(self, job_ids, timeout=JOB_TIMEOUT):
+        '''Track many jobs concurrently, returning {job_id: status}
+
+        The status of a job whose polling raised is the exception, so that
+        one failing job does not abort the wait for the others.
+        '''
+
+        # Imported here, like requests, to keep startup fast
+        import asyncio
+
+        async def wait_for_all():
+            statuses = await asyncio.gather(
+                *[self.async_wait_for_job(job_id, timeout)
+                  for job_id in job_ids],
+                return_exceptions=True)
+            return dict(zip(job_ids, statuses))
+
+        return asyncio.run(wait_for_all())
 
 
 class UserNameSpace(object):
@@ -117,11 +329,67 @@ def get_shared_args(parser):
                         required=True,
                         help="Specify the Tuono Portal username")
 
-    parser.add_argument('-v', '--venue',
-                        required=True,
+    target = parser.add_mutually_exclusive_group(required=True)
+
+    target.add_argument('-v', '--venue',
                         choices=['aws', 'azure'],
                         help='Select venue: [aws, azure]')
 
+    target.add_argument('-m', '--manifest',
+                        help="Onboard every target listed in a CSV or YAML "
+                             "manifest")
+
+    parser.add_argument('-b', '--backend',
+                        choices=sorted(BACKENDS), default='cli',
+                        help="Provision with the aws/az CLIs (default) or "
+                             "with the native SDKs")
+
+    parser.add_argument('--portal-url',
+                        default=BASE_URI,
+                        help="Tuono Portal API endpoint, e.g. a local "
+                             "stand-in (see tuono_mock_portal)")
+
+    parser.add_argument('--aws-endpoint-url',
+                        help="AWS endpoint for the sdk backend, e.g. a "
+                             "local stand-in")
+
+    parser.add_argument('--graph-url',
+                        default=GRAPH_URL,
+                        help="Microsoft Graph endpoint for the sdk backend")
+
+    parser.add_argument('-w', '--workers',
+                        type=int, default=DEFAULT_WORKERS,
+                        help="Number of manifest targets to provision at "
+                             "once")
+
+    parser.add_argument('-j', '--journal',
+                        default=JOURNAL,
+                        help="Record completed steps in this file and resume "
+                             "from it")
+
+    parser.add_argument('--repush',
+                        action='store_true',
+                        help="Forget the journaled progress of the targets "
+                             "and provision and push their credentials "
+                             "again, e.g. to rotate them")
+
+    parser.add_argument('--subscription-ttl',
+                        type=int, default=SUBSCRIPTION_TTL,
+                        help="Seconds to reuse the cached Azure subscription "
+                             "listing, 0 to always list them")
+
+    parser.add_argument('--spans',
+                        default=SPANS,
+                        help="Write the timing spans of the run to this JSON "
+                             "Lines file")
+
+    parser.add_argument('--metrics',
+                        help="Also write the timings as metrics to this file")
+
+    parser.add_argument('--metrics-format',
+                        choices=METRICS_FORMATS, default='prometheus',
+                        help="Prometheus textfile (default) or OpenMetrics")
+
     user_namespace = UserNameSpace()
 
     parser.parse_known_args(namespace=user_namespace)
@@ -132,7 +400,10 @@ def get_shared_args(parser):
 def get_additional_args(parser, user_namespace):
     '''Options parser'''
 
-    if user_namespace.venue == 'aws':
+    if user_namespace.manifest:
+        args = parser.parse_args(namespace=user_namespace)
+
+    elif user_namespace.venue == 'aws':
         parser, args = get_aws_args(parser, user_namespace)
 
     elif user_namespace.venue == 'azure':
@@ -162,7 +433,8 @@ def get_azure_args(parser, user_namespace):
 
     parser.add_argument('-n', '--subscription_name',
                         required=True,
-                        help="Specify subscription name for registration")
+                        help="Specify subscription name or id for "
+                             "registration")
 
     parser.add_argument('-a', '--app_name',
                         required=True,
@@ -177,6 +449,15 @@ def get_azure_args(parser, user_namespace):
     return parser, args
 
 
+def backend_options(args):
+    '''Keyword arguments for the selected backend'''
+
+    if args.backend == 'sdk':
+        return {'aws_endpoint_url': args.aws_endpoint_url,
+                'graph_url': args.graph_url}
+    return {}
+
+
 def get_logger(filename):
     '''Logger configuration'''
 
@@ -199,22 +480,33 @@ def get_logger(filename):
     return logger
 
 
-def aws_user_group_create(args, logger):
-    '''Create AWS user and group'''
+def wait_until(probe, description, logger, timeout=READINESS_TIMEOUT):
+    '''Poll probe with exponential backoff until it returns True'''
+
+    logger.info(f"Waiting for {description}")
+    start = time.monotonic()
+    delay = INITIAL_DELAY
+
+    # A TargetLogger carries the name of the target being onboarded
+    with span(f"wait: {description}", **getattr(logger, 'extra', {})) \
+            as record:
+        while not probe():
+            elapsed = time.monotonic() - start
+            if elapsed >= timeout:
+                logger.warning(f"Gave up waiting for {description} after "
+                               f"{elapsed:.0f}s, continuing")
+                record['timed_out'] = True
+                return False
+            time.sleep(min(delay, timeout - elapsed))
+            delay = min(delay * 2, MAX_DELAY)
+
+    logger.info(f"Done waiting for {description} "
+                f"({time.monotonic() - start:.1f}s)")
+    return True
 
-    logger.info(f"Creating IAM user {args.iam_user}")
-    user = subprocess.run(f"aws iam create-user --user-name {args.iam_user} "
-                          f"--output json",
-                          check=True, shell=True, capture_output=True)
-    user = json.loads(user.stdout)
-    logger.debug(json.dumps(user, indent=2, sort_keys=True))
 
-    logger.info(f"Creating IAM group {args.iam_user}")
-    group = subprocess.run(f"aws iam create-group --group-name "
-                           f"{args.iam_group} --output json",
-                           check=True, shell=True, capture_output=True)
-    group = json.loads(group.stdout)
-    logger.debug(json.dumps(group, indent=2, sort_keys=True))
+def aws_user_group_create(args, logger, backend, journal=None):
+    '''Create AWS user and group'''
 
     permissions = ("AmazonEC2FullAccess",
                    "AWSCertificateManagerFullAccess",
@@ -223,87 +515,179 @@ def aws_user_group_create(args, logger):
                    "ResourceGroupsandTagEditorFullAccess",
                    "AmazonRDSReadOnlyAccess")
 
-    logger.info(f"Adding IAM permissions to {args.iam_group}")
+    def create_user(results):
+        user = backend.get_user(args.iam_user)
+        if user:
+            logger.info(f"IAM user {args.iam_user} exists, reusing it")
+            return user
+        logger.info(f"Creating IAM user {args.iam_user}")
+        user = backend.create_user(args.iam_user)
+        logger.debug(json.dumps(user, indent=2, sort_keys=True, default=str))
+        return user
+
+    def create_group(results):
+        group = backend.get_group(args.iam_group)
+        if group:
+            logger.info(f"IAM group {args.iam_group} exists, reusing it")
+            return group
+        logger.info(f"Creating IAM group {args.iam_group}")
+        group = backend.create_group(args.iam_group)
+        logger.debug(json.dumps(group, indent=2, sort_keys=True, default=str))
+        return group
+
+    def attach_group_policy(permission):
+        def attach(results):
+            logger.info(f"Adding {permission} to {args.iam_group}")
+            backend.attach_group_policy(
+                args.iam_group, f"arn:aws:iam::aws:policy/{permission}")
+        return attach
+
+    def add_user_to_group(results):
+        logger.info(f"Adding {args.iam_user} to {args.iam_group}")
+        backend.add_user_to_group(args.iam_user, args.iam_group)
+
+    def create_access_key(results):
+        # A key created by an earlier run that was not journaled cannot be
+        # recovered, as its secret is only returned on creation
+        existing = backend.list_access_keys(args.iam_user)
+        if len(existing) >= ACCESS_KEY_LIMIT:
+            raise RuntimeError(
+                f"IAM user {args.iam_user} already has {len(existing)} "
+                f"access keys ({', '.join(existing)}), the most IAM allows. "
+                f"Delete one with: aws iam delete-access-key --user-name "
+                f"{args.iam_user} --access-key-id <id>, then rerun")
+        logger.info("Generating secret")
+        return backend.create_access_key(args.iam_user)
+
+    def access_key_ready(results):
+        keys = results['create-access-key']
+        wait_until(lambda: backend.access_key_ready(keys),
+                   "the access key and permissions to propagate", logger)
+
+    # The policy attachments only need the group, and the access key only
+    # needs the user, so they run alongside each other
+    graph = StepGraph(logger, journal=journal)
+    graph.add('create-user', create_user)
+    graph.add('create-group', create_group)
+    attachments = []
     for permission in permissions:
-        subprocess.run(f"aws iam attach-group-policy "
-                       f"--policy-arn arn:aws:iam::aws:policy/{permission} "
-                       f"--group-name {args.iam_group} --output json",
-                       check=True, shell=True)
-
-    logger.info(f"Adding {args.iam_user} to {args.iam_group}")
-    subprocess.run(f"aws iam add-user-to-group --user-name {args.iam_user} "
-                   f"--group-name {args.iam_group} --output json",
-                   check=True, shell=True)
-
-    logger.info("Generating secret")
-    keys = subprocess.run(f"aws iam create-access-key --user-name "
-                          f"{args.iam_user} --output json",
-                          check=True, shell=True, capture_output=True)
-
-    logger.info("Waiting 20s to reconcile changes")
-    time.sleep(20)
-
-    return (user, group, json.loads(keys.stdout)['AccessKey'])
-
-
-def azure_app_create(args, logger):
+        attachments.append(f"attach-{permission}")
+        graph.add(attachments[-1], attach_group_policy(permission),
+                  requires=['create-group'])
+    graph.add('add-user-to-group', add_user_to_group,
+              requires=['create-user', 'create-group'])
+    graph.add('create-access-key', create_access_key,
+              requires=['create-user'])
+    graph.add('access-key-ready', access_key_ready,
+              requires=['create-access-key', 'add-user-to-group']
+              + attachments)
+
+    results = graph.run()
+    graph.report()
+
+    return (results['create-user'], results['create-group'],
+            results['create-access-key'])
+
+
+def azure_app_create(args, logger, backend, journal=None,
+                     subscriptions=None):
     '''Create Azure registration ond credentials'''
 
-    logger.info("Generating Subscription details")
-    subscriptions = subprocess.run("az account list",
-                                   check=True, shell=True, capture_output=True)
-    for subscription in json.loads(subscriptions.stdout):
-        if subscription["name"] == args.subscription_name:
-            current = subscription
-    logger.debug(json.dumps(current, indent=2, sort_keys=True))
-
-    logger.info(f"Creating App Registration {args.app_name}")
-    app = subprocess.run(f"az ad app create --display-name {args.app_name}",
-                         check=True, shell=True, capture_output=True)
-    app = json.loads(app.stdout)
-    logger.debug(json.dumps(app, indent=2, sort_keys=True))
-
-    app_id = app['appId']
-
-    logger.info("Generating Client Secret")
-    values = subprocess.run(f'az ad app credential reset --id {app_id} '
-                            f'--credential-description {args.credential} '
-                            f'--end-date `date -d "+5 years" +%F`',
-                            check=True, shell=True, capture_output=True)
-    logger.info("Waiting 20s reconcile the secret creation")
-    time.sleep(20)
-
-    logger.info("Creating Service Principal")
-    subprocess.run(f"az ad sp create --id {app_id}",
-                   check=True, shell=True, capture_output=True)
-    logger.info("Waiting 20s reconcile the Service Principal creation")
-    time.sleep(20)
-
-    logger.info("Creating role assignment")
-    subprocess.run(f"az role assignment create --assignee {app_id} "
-                   f"--role Contributor --subscription {current['id']}",
-                   check=True, shell=True, capture_output=True)
-    logger.info("Waiting 20s reconcile role assignment")
-    time.sleep(20)
-
-    return (current, app, json.loads(values.stdout))
-
-
-def main():
-    '''Main'''
-
-    parser = start_argparser()
-    parser, user_namespace = get_shared_args(parser)
-    args = get_additional_args(parser, user_namespace)
+    def find_subscription(results):
+        logger.info("Generating Subscription details")
+        index = subscriptions
+        if index is None:
+            index = SubscriptionIndex(backend, args.subscription_ttl)
+        current = index.lookup(args.subscription_name)
+        logger.debug(json.dumps(current, indent=2, sort_keys=True))
+        return current
+
+    def create_app(results):
+        app = backend.find_app(args.app_name)
+        if app and APP_TAG not in (app.get('tags') or []):
+            raise RuntimeError(
+                f"An App Registration named {args.app_name} exists that "
+                f"this tool did not create, choose another --app_name")
+        if app:
+            logger.info(f"App Registration {args.app_name} exists, "
+                        f"reusing it")
+            return app
+        logger.info(f"Creating App Registration {args.app_name}")
+        app = backend.create_app(args.app_name)
+        logger.debug(json.dumps(app, indent=2, sort_keys=True))
+        return app
+
+    def reset_app_credential(results):
+        logger.info("Generating Client Secret")
+        return backend.reset_app_credential(results['create-app'],
+                                            args.credential)
+
+    def app_credential_ready(results):
+        app_id = results['create-app']['appId']
+        wait_until(lambda: backend.app_credential_ready(app_id),
+                   "the secret creation to propagate", logger)
+
+    def create_service_principal(results):
+        app_id = results['create-app']['appId']
+        if backend.service_principal_ready(app_id):
+            logger.info("Service Principal exists, reusing it")
+            return
+        logger.info("Creating Service Principal")
+        backend.create_service_principal(app_id)
+
+    def service_principal_ready(results):
+        app_id = results['create-app']['appId']
+        wait_until(lambda: backend.service_principal_ready(app_id),
+                   "the Service Principal creation to propagate", logger)
+
+    def create_role_assignment(results):
+        app_id = results['create-app']['appId']
+        subscription_id = results['find-subscription']['id']
+        if backend.role_assignment_ready(app_id, subscription_id):
+            logger.info("Role assignment exists, reusing it")
+            return
+        logger.info("Creating role assignment")
+        backend.create_role_assignment(app_id, subscription_id)
+
+    def role_assignment_ready(results):
+        app_id = results['create-app']['appId']
+        subscription_id = results['find-subscription']['id']
+        wait_until(lambda: backend.role_assignment_ready(app_id,
+                                                         subscription_id),
+                   "the role assignment to propagate", logger)
+
+    # The secret and the Service Principal both only need the app, so their
+    # propagation waits overlap
+    graph = StepGraph(logger, journal=journal)
+    graph.add('find-subscription', find_subscription)
+    graph.add('create-app', create_app)
+    graph.add('reset-app-credential', reset_app_credential,
+              requires=['create-app'])
+    graph.add('app-credential-ready', app_credential_ready,
+              requires=['reset-app-credential'])
+    graph.add('create-service-principal', create_service_principal,
+              requires=['create-app'])
+    graph.add('service-principal-ready', service_principal_ready,
+              requires=['create-service-principal'])
+    graph.add('create-role-assignment', create_role_assignment,
+              requires=['find-subscription', 'service-principal-ready'])
+    graph.add('role-assignment-ready', role_assignment_ready,
+              requires=['create-role-assignment', 'app-credential-ready'])
+
+    results = graph.run()
+    graph.report()
+
+    return (results['find-subscription'], results['create-app'],
+            results['reset-app-credential'])
+
+
+def provision(args, logger, backend, journal=None, subscriptions=None):
+    '''Create the cloud resources and build the REST payload'''
 
-    password = getpass.getpass((f"\nPlease enter the Password for "
-                                f"{args.username}: "))
     if args.venue == "azure":
 
-        log = 'tuono_azure_setup.txt'
-        logger = get_logger(log)
-
-        subscription, app, values = azure_app_create(args, logger)
+        subscription, app, values = azure_app_create(args, logger, backend,
+                                                    journal, subscriptions)
 
         payload = {"cred_type"   : "static",
                    "name"        : args.app_name,
@@ -314,17 +698,19 @@ def main():
 
     if args.venue == "aws":
 
-        log = 'tuono_aws_setup.txt'
-        logger = get_logger(log)
-
-        user, group, keys = aws_user_group_create(args, logger)
+        user, group, keys = aws_user_group_create(args, logger, backend,
+                                                  journal)
 
         payload = {"cred_type" : "static",
                    "name"      : args.iam_user,
                    "access_key": keys['AccessKeyId'],
                    "secret_key": keys['SecretAccessKey']}
 
-    tuono = Tuono(args.username, password)
+    return payload
+
+
+def show_payload(payload, logger):
+    '''Print the credential details to screen'''
 
     logger.info("Credential details for the Tuono Portal. "
                 "THESE WILL NOT BE LOGGED:")
@@ -332,28 +718,302 @@ def main():
     print(f"\n{json.dumps(payload, indent=2, sort_keys=True)}\n")
     logger.info("Keep these details in a secure place. If you lose these "
                 "you will need to recreate the registration")
+
+
+def submit_credentials(tuono, payload, venue, logger, journal=None):
+    '''Add credentials to the Tuono Portal, returning the job id'''
+
+    if journal is not None and journal.job_id:
+        logger.info(f"Credentials already pushed as job {journal.job_id}")
+        return journal.job_id
+
     logger.info("Making REST call to add credentials to the Tuono Portal")
 
-    if args.venue == "azure":
-        creds = tuono.add_credentials(payload, "azure")
-    if args.venue == "aws":
-        creds = tuono.add_credentials(payload, "aws")
+    creds = tuono.add_credentials(payload, venue)
     logger.debug(f"{json.dumps(creds, indent=2, sort_keys=True)}")
 
-    job_id = creds['_id']
-    job_status = tuono.get_job(job_id)
+    if journal is not None:
+        journal.submitted(creds['_id'])
+
+    return creds['_id']
+
+
+def push_credentials(tuono, payload, venue, logger, journal=None):
+    '''Add credentials to the Tuono Portal and wait for the job'''
+
+    job_id = submit_credentials(tuono, payload, venue, logger, journal)
+    job_status = tuono.wait_for_job(job_id, logger=logger)
+    if journal is not None:
+        journal.finished(job_status)
+
+    if job_status == JOB_PENDING:
+        logger.info(f"Timed out waiting for job {job_id}, rerun to wait "
+                    f"for it again")
+    elif job_status != 200:
+        logger.info(f"The job Failed. Error code HTTP {job_status}")
+
+    return job_id, job_status
 
-    while job_status != 200:
-        if job_status != 412:
-            logger.info(f"The job Failed. Error code HTTP {job_status}")
+
+def target_name(args):
+    '''Name of the credential a target creates'''
+
+    if args.venue == "aws":
+        return args.iam_user
+    return args.app_name
+
+
+def load_manifest(filename):
+    '''Read the batch targets from a CSV or YAML manifest'''
+
+    with open(filename) as manifest:
+        if filename.endswith(('.yaml', '.yml')):
+            # Only needed for YAML manifests
+            import yaml
+            rows = yaml.safe_load(manifest) or []
+        else:
+            rows = list(csv.DictReader(manifest))
+
+    targets = []
+    for number, row in enumerate(rows, 1):
+        venue = row.get('venue')
+        if venue not in MANIFEST_KEYS:
+            print(f"Manifest entry {number}: venue must be one of "
+                  f"{', '.join(MANIFEST_KEYS)}")
             sys.exit(1)
+
+        missing = [key for key in MANIFEST_KEYS[venue] if not row.get(key)]
+        if missing:
+            print(f"Manifest entry {number}: missing {', '.join(missing)}")
+            sys.exit(1)
+
+        target = UserNameSpace()
+        target.venue = venue
+        for key in MANIFEST_KEYS[venue]:
+            setattr(target, key, str(row[key]))
+        targets.append(target)
+
+    return targets
+
+
+class TargetLogger(logging.LoggerAdapter):
+    '''Prefix log lines with the target they relate to'''
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['target']}] {msg}", kwargs
+
+
+def onboard_target(tuono, target, logger, backend, screen_lock, journal,
+                   subscriptions):
+    '''Provision one manifest target and submit its credentials'''
+
+    name = target_name(target)
+    logger = TargetLogger(logger, {'target': name})
+    result = {'venue': target.venue, 'name': name}
+    start = time.time()
+
+    if journal.succeeded:
+        logger.info(f"Already onboarded as job {journal.job_id}, skipping")
+        result.update(status='succeeded', job_id=journal.job_id, seconds=0)
+        return result
+
+    backend = TracedBackend(backend, TRACER, target=name)
+
+    try:
+        payload = provision(target, logger, backend, journal, subscriptions)
+        with screen_lock:
+            show_payload(payload, logger)
+
+        result['job_id'] = submit_credentials(tuono, payload, target.venue,
+                                              logger, journal)
+        result['status'] = 'submitted'
+
+    except subprocess.CalledProcessError as error:
+        result['status'] = 'failed'
+        result['error'] = (f"Command failed ({error.returncode}): "
+                           f"{(error.stderr or b'').decode().strip()}")
+    except Exception as error:
+        # Reported with the other targets rather than aborting the batch
+        result['status'] = 'failed'
+        result['error'] = str(error)
+
+    result['seconds'] = round(time.time() - start, 1)
+    logger.info(f"Provisioning {result['status']}")
+    return result
+
+
+def run_batch(args, targets, password, logger, backend):
+    '''Onboard every manifest target, sharing one portal login'''
+
+    tuono = Tuono(args.username, password, base_uri=args.portal_url)
+    screen_lock = threading.Lock()
+    journal = Journal(args.journal, args.portal_url, args.username)
+    journals = {}
+
+    # One listing resolves the subscriptions of every Azure target. If it
+    # cannot be made, only the Azure targets fail
+    subscriptions = None
+    subscription_error = None
+    if any(target.venue == 'azure' for target in targets):
+        try:
+            subscriptions = SubscriptionIndex(TracedBackend(backend, TRACER),
+                                              args.subscription_ttl)
+        except Exception as error:
+            subscription_error = (f"Listing the Azure subscriptions "
+                                  f"failed: {error}")
+            logger.error(subscription_error)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = []
+        for target in targets:
+            key = (target.venue, target_name(target))
+            journals[key] = journal.target(*key)
+            if args.repush:
+                journals[key].reset()
+            if target.venue == 'azure' and subscription_error:
+                results.append({'venue': target.venue, 'name': key[1],
+                                'status': 'failed', 'seconds': 0,
+                                'error': subscription_error})
+                continue
+            futures.append(executor.submit(onboard_target, tuono, target,
+                                           logger, backend, screen_lock,
+                                           journals[key], subscriptions))
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    # The portal jobs of every target are tracked together
+    submitted = [result for result in results
+                 if result['status'] == 'submitted']
+    logger.info(f"Waiting for {len(submitted)} Tuono Portal jobs")
+    start = time.time()
+    statuses = tuono.wait_for_jobs([result['job_id']
+                                    for result in submitted])
+    for result in submitted:
+        job_status = statuses[result['job_id']]
+        result['seconds'] = round(result['seconds'] + time.time() - start, 1)
+        if isinstance(job_status, Exception):
+            # The job may still succeed, so the journal keeps its id
+            result['status'] = 'failed'
+            result['error'] = f"Polling job failed: {job_status!r}"
+            continue
+        journals[(result['venue'], result['name'])].finished(job_status)
+        if job_status == 200:
+            result['status'] = 'succeeded'
+        elif job_status == JOB_PENDING:
+            result['status'] = 'timed out'
+            result['error'] = (f"Job {result['job_id']} still running, "
+                               f"rerun to wait for it again")
         else:
-            logger.info(f"Job still running")
-            time.sleep(10)
-            job_status = tuono.get_job(job_id)
+            result['status'] = 'failed'
+            result['error'] = f"Job failed with HTTP {job_status}"
+
+    results.sort(key=lambda result: (result['venue'], result['name']))
+    logger.info(f"{'VENUE':<6} {'NAME':<32} {'STATUS':<10} {'SECONDS':>8}")
+    for result in results:
+        logger.info(f"{result['venue']:<6} {result['name']:<32} "
+                    f"{result['status']:<10} {result['seconds']:>8}")
+        if 'error' in result:
+            logger.info(f"       {result['error']}")
+
+    with open(REPORT, 'w') as report:
+        json.dump(results, report, indent=2, sort_keys=True)
+    logger.info(f"Per-target results written to {REPORT}")
+
+    return results
+
+
+def onboard(args, password, logger):
+    '''Provision one target and push its credentials, True on success'''
+
+    journal = Journal(args.journal, args.portal_url, args.username) \
+        .target(args.venue, target_name(args))
+    if args.repush:
+        journal.reset()
+    if journal.succeeded:
+        logger.info(f"Credentials already pushed to Tuono as job "
+                    f"{journal.job_id}, nothing to do")
+        return True
+
+    backend = TracedBackend(get_backend(args.backend, **backend_options(args)),
+                            TRACER, target=target_name(args))
+    try:
+        payload = provision(args, logger, backend, journal)
+    except SubscriptionNotFound as error:
+        logger.error(error)
+        return False
+
+    tuono = Tuono(args.username, password, base_uri=args.portal_url)
+
+    show_payload(payload, logger)
+
+    job_id, job_status = push_credentials(tuono, payload, args.venue, logger,
+                                          journal)
+    if job_status != 200:
+        return False
 
     logger.info(f"Pushing credentials to Tuono succeeded!")
+    return True
+
+
+def export_spans(args, logger):
+    '''Summarise the timing spans of the run and write them out'''
+
+    TRACER.summary(logger)
+
+    TRACER.write_jsonl(args.spans)
+    logger.info(f"Timing spans written to {args.spans}")
+
+    if args.metrics:
+        TRACER.write_metrics(args.metrics, args.metrics_format)
+        logger.info(f"Timing metrics written to {args.metrics}")
+
+
+def main():
+    '''Main'''
+
+    parser = start_argparser()
+    parser, user_namespace = get_shared_args(parser)
+    args = get_additional_args(parser, user_namespace)
+
+    if args.manifest:
+        targets = load_manifest(args.manifest)
+
+    password = getpass.getpass((f"\nPlease enter the Password for "
+                                f"{args.username}: "))
+
+    if args.manifest:
+
+        log = 'tuono_batch_setup.txt'
+        logger = get_logger(log)
+
+        try:
+            results = run_batch(args, targets, password, logger,
+                                get_backend(args.backend,
+                                            **backend_options(args)))
+        finally:
+            export_spans(args, logger)
+
+        logger.info(f"To see DEBUG logs, please review {log}. "
+                    f"Command: less {log}")
+        if any(result['status'] != 'succeeded' for result in results):
+            sys.exit(1)
+        return
+
+    if args.venue == "azure":
+        log = 'tuono_azure_setup.txt'
+    if args.venue == "aws":
+        log = 'tuono_aws_setup.txt'
+    logger = get_logger(log)
+
+    try:
+        succeeded = onboard(args, password, logger)
+    finally:
+        export_spans(args, logger)
+
     logger.info(f"To see DEBUG logs, please review {log}. Command: less {log}")
+    if not succeeded:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Dependency graph executor for the Tuono credential add tool.
+
+Provisioning steps are added to a StepGraph with the names of the steps they
+depend on. Running the graph starts every step as soon as its dependencies
+have finished, so independent steps (for example the IAM policy attachments
+and the IAM user creation) run concurrently.
+
+Each step is called with the dict of results of the steps finished so far.
+With a journal (see tuono_journal), every finished step is recorded, and
+steps the journal already holds are skipped, reusing their recorded result.
+After a run, report() logs when each step started, how long it took and the
+length of the longest chain of steps ending with it; the steps on the
+critical path of the whole graph are marked with a *.
+'''
+
+import time
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+DEFAULT_WORKERS = 8
+
+
+class Step():
+    '''One node of a StepGraph'''
+
+    def __init__(self, name, function, requires):
+        self.name = name
+        self.function = function
+        self.requires = tuple(requires)
+        self.start = None
+        self.finish = None
+
+    @property
+    def seconds(self):
+        return self.finish - self.start
+
+
+class StepGraph():
+    '''Run named steps concurrently in dependency order'''
+
+    def __init__(self, logger, max_workers=DEFAULT_WORKERS, journal=None):
+        self.logger = logger
+        self.max_workers = max_workers
+        self.journal = journal
+        self.steps = {}
+        self.results = {}
+
+    def add(self, name, function, requires=()):
+        '''Add a step called with the results of the steps it requires'''
+
+        if name in self.steps:
+            raise ValueError(f"Duplicate step {name}")
+        for required in requires:
+            if required not in self.steps:
+                raise ValueError(f"Step {name} requires unknown step "
+                                 f"{required}")
+        # Steps can only require steps added before them, so the graph
+        # can never contain a cycle
+        self.steps[name] = Step(name, function, requires)
+
+    def run(self):
+        '''Run every step, returning {name: result}'''
+
+        self.origin = time.monotonic()
+        pending = dict(self.steps)
+        running = {}
+        error = None
+
+        if self.journal is not None:
+            for name, result in self.journal.steps.items():
+                if name in pending:
+                    step = pending.pop(name)
+                    step.start = step.finish = self.origin
+                    self.results[name] = result
+            if len(pending) < len(self.steps):
+                self.logger.info(f"Resuming, {len(self.steps) - len(pending)}"
+                                 f" of {len(self.steps)} steps already done")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if error is None:
+                    for step in list(pending.values()):
+                        if all(required in self.results
+                               for required in step.requires):
+                            del pending[step.name]
+                            running[executor.submit(self._call, step)] = step
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        self.results[step.name] = future.result()
+                        if self.journal is not None:
+                            self.journal.record(step.name,
+                                                self.results[step.name])
+                    except Exception as exc:
+                        # Let the running steps finish, but start no more
+                        if error is None:
+                            error = exc
+                        self.logger.error(f"Step {step.name} failed: {exc}")
+
+        if error is not None:
+            raise error
+
+        return self.results
+
+    def _call(self, step):
+        step.start = time.monotonic()
+        try:
+            return step.function(self.results)
+        finally:
+            step.finish = time.monotonic()
+
+    def path_seconds(self):
+        '''Length of the longest chain of steps ending with each step'''
+
+        lengths = {}
+        for name, step in self.steps.items():
+            longest = max((lengths[required] for required in step.requires),
+                          default=0)
+            lengths[name] = longest + step.seconds
+        return lengths
+
+    def critical_path(self):
+        '''Names of the steps on the longest chain through the graph'''
+
+        lengths = self.path_seconds()
+        path = []
+        name = max(lengths, key=lengths.get, default=None)
+        while name is not None:
+            path.append(name)
+            name = max(self.steps[name].requires, key=lengths.get,
+                       default=None)
+        return path[::-1]
+
+    def report(self):
+        '''Log the timing of every step that ran'''
+
+        if any(step.finish is None for step in self.steps.values()):
+            return
+
+        lengths = self.path_seconds()
+        critical = self.critical_path()
+        width = max(len(name) for name in self.steps)
+
+        self.logger.info(f"  {'STEP':<{width}} {'START':>7} {'SECONDS':>8} "
+                         f"{'PATH':>7}")
+        for name, step in sorted(self.steps.items(),
+                                 key=lambda item: item[1].start):
+            marker = '*' if name in critical else ' '
+            self.logger.info(f"{marker} {name:<{width}} "
+                             f"{step.start - self.origin:>7.1f} "
+                             f"{step.seconds:>8.1f} {lengths[name]:>7.1f}")
+        self.logger.info(f"Critical path: {' -> '.join(critical)} "
+                         f"({lengths[critical[-1]]:.1f}s)")
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Local stand-in for the parts of Microsoft Graph used by the sdk backend.
+
+Serves, under /v1.0:
+
+    GET  /organization
+    GET  /applications?$filter=displayName eq '<name>'
+    POST /applications
+    GET  /applications(appId='<appId>')
+    POST /applications/{id}/addPassword
+    POST /servicePrincipals
+    GET  /servicePrincipals(appId='<appId>')
+
+Graph is eventually consistent: an application or Service Principal can
+take a while to be readable by appId or listed after it has been created.
+--replication-seconds reproduces this, answering 404 (or leaving it out of
+listings) until then, while addresses by object id work at once.
+
+Together with a moto server for IAM, the sdk backend can be exercised
+without touching a real account:
+
+    python tuono_fake_graph.py --port 8081 --replication-seconds 5
+    moto_server -p 5000
+
+    SdkBackend(aws_endpoint_url='http://localhost:5000',
+               graph_url='http://localhost:8081/v1.0',
+               azure_credential=StaticCredential())
+
+Role assignments and subscriptions use Azure Resource Manager, which this
+does not stand in for.
+'''
+
+import argparse
+import re
+import sys
+import threading
+import time
+import uuid
+
+from collections import namedtuple
+from tuono_json_server import endpoint
+from tuono_json_server import serve_json
+from tuono_json_server import serve_until_interrupted
+
+API_PREFIX = '/v1.0'
+
+DEFAULT_PORT = 8081
+
+BY_APP_ID = re.compile(r"^/(applications|servicePrincipals)"
+                       r"\(appId='([^']*)'\)$")
+ADD_PASSWORD = re.compile(r'^/applications/([^/]+)/addPassword$')
+DISPLAY_NAME = re.compile(r"^displayName eq '((?:[^']|'')*)'$")
+
+AccessToken = namedtuple('AccessToken', ['token', 'expires_on'])
+
+
+class StaticCredential():
+    '''Azure credential handing out a fixed token, for a fake Graph'''
+
+    def get_token(self, *scopes, **kwargs):
+        return AccessToken('fake-graph-token', int(time.time()) + 3600)
+
+
+class FakeGraph():
+    '''Applications and Service Principals held in memory'''
+
+    def __init__(self, replication_seconds=0.0, tenant=None):
+
+        self.replication_seconds = replication_seconds
+        self.tenant = tenant or str(uuid.uuid4())
+        self.lock = threading.Lock()
+        # object id: (readable from, resource)
+        self.applications = {}
+        self.service_principals = {}
+
+    def create(self, collection, resource):
+        '''Store a new resource, returning it with its ids'''
+
+        resource = dict(resource, id=str(uuid.uuid4()))
+        with self.lock:
+            collection[resource['id']] = (time.monotonic()
+                                          + self.replication_seconds,
+                                          resource)
+        return resource
+
+    def replicated(self, collection):
+        '''Resources of collection readable by appId and in listings'''
+
+        now = time.monotonic()
+        with self.lock:
+            return [resource for readable, resource in collection.values()
+                    if readable <= now]
+
+    def by_app_id(self, collection, app_id):
+        for resource in self.replicated(collection):
+            if resource['appId'] == app_id:
+                return 200, resource
+        return 404, {'error': {'code': 'Request_ResourceNotFound'}}
+
+    def list_applications(self, query):
+        applications = self.replicated(self.applications)
+        match = DISPLAY_NAME.match(query.get('$filter', [''])[0])
+        if match:
+            name = match.group(1).replace("''", "'")
+            applications = [application for application in applications
+                            if application['displayName'] == name]
+        return 200, {'value': applications}
+
+    def add_password(self, object_id, body):
+        with self.lock:
+            entry = self.applications.get(object_id)
+        if entry is None:
+            return 404, {'error': {'code': 'Request_ResourceNotFound'}}
+
+        credential = dict(body.get('passwordCredential') or {},
+                          keyId=str(uuid.uuid4()))
+        with self.lock:
+            entry[1]['passwordCredentials'].append(credential)
+        return 200, dict(credential, secretText=uuid.uuid4().hex)
+
+    def handle(self, method, path, query, headers, body):
+        '''Return the status and JSON response to one request'''
+
+        if not path.startswith(API_PREFIX + '/'):
+            return 404, {'error': {'code': 'NotFound'}}
+        path = path[len(API_PREFIX):]
+
+        match = BY_APP_ID.match(path)
+        if method == 'GET' and match:
+            collection = (self.applications
+                          if match.group(1) == 'applications'
+                          else self.service_principals)
+            return self.by_app_id(collection, match.group(2))
+
+        match = ADD_PASSWORD.match(path)
+        if method == 'POST' and match:
+            return self.add_password(match.group(1), body)
+
+        if method == 'GET' and path == '/organization':
+            return 200, {'value': [{'id': self.tenant}]}
+
+        if method == 'GET' and path == '/applications':
+            return self.list_applications(query)
+
+        if method == 'POST' and path == '/applications':
+            return 201, self.create(self.applications,
+                                    dict(body, appId=str(uuid.uuid4()),
+                                         passwordCredentials=[]))
+
+        if method == 'POST' and path == '/servicePrincipals':
+            return 201, self.create(self.service_principals,
+                                    {'appId': body.get('appId')})
+
+        return 404, {'error': {'code': 'NotFound'}}
+
+
+def serve(graph, port=DEFAULT_PORT, host='127.0.0.1'):
+    '''Serve graph in a background thread, returning the server'''
+
+    return serve_json(graph, port, host)
+
+
+def graph_url(server):
+    '''The Graph endpoint of a server started by serve'''
+
+    return endpoint(server, API_PREFIX)
+
+
+def main():
+    '''Serve the fake Graph until interrupted'''
+
+    parser = argparse.ArgumentParser(
+        description='Local stand-in for Microsoft Graph')
+    parser.add_argument('-p', '--port',
+                        type=int, default=DEFAULT_PORT,
+                        help="Port to listen on (default: %(default)s)")
+    parser.add_argument('--host',
+                        default='127.0.0.1',
+                        help="Address to listen on (default: %(default)s)")
+    parser.add_argument('--replication-seconds',
+                        type=float, default=0.0,
+                        help="Seconds before a new application or Service "
+                             "Principal can be read by appId")
+    args = parser.parse_args()
+
+    server = serve(FakeGraph(args.replication_seconds), args.port, args.host)
+    print(f"Serving a fake Microsoft Graph at {graph_url(server)}")
+
+    serve_until_interrupted(server)
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
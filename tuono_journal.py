@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Local state journal for the Tuono credential add tool.
+
+The journal records every provisioning step a target completes, together
+with its result, and the Tuono Portal job its credentials were pushed as.
+When a run fails part way, rerunning the same command resumes from the
+first incomplete step instead of failing on resources that already exist.
+
+Step results include the new access key or client secret, so the journal
+file is only readable by its owner, and a target's step results are
+removed as soon as its credentials have been pushed successfully. Only
+the job id and status of finished targets are kept.
+
+Entries are kept per Tuono Portal and username as well as per target, so
+that a rehearsal against a local stand-in portal (see tuono_mock_portal)
+does not stop the real push. reset() forgets a target, so that its
+credentials are provisioned and pushed again, for example to rotate them.
+
+The journal is kept in the user's state directory ($XDG_STATE_HOME, by
+default ~/.local/state), so that a rerun from another working directory
+still finds it.
+'''
+
+import json
+import os
+import threading
+
+JOURNAL = os.path.join(os.environ.get('XDG_STATE_HOME')
+                       or os.path.join(os.path.expanduser('~'), '.local',
+                                       'state'),
+                       'tuono', 'journal.json')
+
+
+class Journal():
+    '''The journal file, shared by every target of a run'''
+
+    def __init__(self, filename=JOURNAL, portal=None, username=None):
+        self.filename = filename
+        self.scope = f"{username}@{portal}"
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if os.path.exists(filename):
+            with open(filename) as journal:
+                self.entries = json.load(journal)
+
+    def target(self, venue, name):
+        '''The journal entry of one target'''
+
+        with self.lock:
+            entry = self.entries.setdefault(f"{self.scope} {venue}:{name}",
+                                            {'steps': {}})
+        return TargetJournal(self, entry)
+
+    def save(self):
+        '''Rewrite the journal file atomically, readable by its owner only'''
+
+        with self.lock:
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            temporary = f"{self.filename}.tmp"
+            descriptor = os.open(temporary,
+                                 os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            # A temporary file left by an earlier run keeps its own mode
+            os.fchmod(descriptor, 0o600)
+            with os.fdopen(descriptor, 'w') as journal:
+                json.dump(self.entries, journal, indent=2, sort_keys=True,
+                          default=str)
+            os.replace(temporary, self.filename)
+
+
+class TargetJournal():
+    '''Completed steps and portal job of one target'''
+
+    def __init__(self, journal, entry):
+        self.journal = journal
+        self.entry = entry
+
+    @property
+    def steps(self):
+        return self.entry.setdefault('steps', {})
+
+    @property
+    def job_id(self):
+        return self.entry.get('job_id')
+
+    @property
+    def succeeded(self):
+        return self.entry.get('job_status') == 200
+
+    def record(self, step, result):
+        '''Record a completed provisioning step and its result'''
+
+        # Round trip through JSON so that resumed runs see the same values
+        result = json.loads(json.dumps(result, default=str))
+        with self.journal.lock:
+            self.steps[step] = result
+        self.journal.save()
+
+    def reset(self):
+        '''Forget the steps and portal job of the target'''
+
+        with self.journal.lock:
+            self.entry.clear()
+            self.entry['steps'] = {}
+        self.journal.save()
+
+    def submitted(self, job_id):
+        '''Record the portal job the credentials were pushed as'''
+
+        with self.journal.lock:
+            self.entry['job_id'] = job_id
+        self.journal.save()
+
+    def finished(self, job_status):
+        '''Record the outcome of the portal job'''
+
+        with self.journal.lock:
+            if job_status == 200:
+                # The credentials are in the portal, drop the secrets
+                self.entry.pop('steps', None)
+                self.entry['job_status'] = job_status
+            elif job_status != 412:
+                # The job failed, push the credentials again next time
+                self.entry.pop('job_id', None)
+        self.journal.save()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+HTTP scaffolding shared by the local stand-ins (tuono_mock_portal,
+tuono_fake_graph).
+
+An application is any object with a handle(method, path, query, headers,
+body) method returning a status and a JSON-serialisable response.
+serve_json() answers GET and POST requests with it from a background
+thread, decoding JSON request bodies and encoding the responses.
+
+Connections are kept alive, as the clients reuse one session for every
+call, and Nagle's algorithm is disabled on them: otherwise the response
+body, written after the headers, waits for the client's delayed ACK and
+every request takes at least 40 ms whatever latency was asked for.
+'''
+
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+
+class JsonServer(ThreadingHTTPServer):
+    '''Threaded server accepting as many connections as a load test opens'''
+
+    daemon_threads = True
+    # The default backlog of 5 drops connections under load, which clients
+    # only retry after a second
+    request_queue_size = 128
+
+
+def handler_class(app):
+    '''Build a request handler serving app'''
+
+    class JsonHandler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def respond(self, method):
+            url = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or '{}')
+            except ValueError:
+                body = None
+            if not isinstance(body, dict):
+                body = {}
+
+            status, response = app.handle(method, url.path,
+                                          parse_qs(url.query),
+                                          self.headers, body)
+
+            data = json.dumps(response).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.respond('GET')
+
+        def do_POST(self):
+            self.respond('POST')
+
+        def log_message(self, format, *args):
+            # Thousands of requests a second would drown the terminal
+            pass
+
+    return JsonHandler
+
+
+def serve_json(app, port, host='127.0.0.1'):
+    '''Serve app in a background thread, returning the server'''
+
+    server = JsonServer((host, port), handler_class(app))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def endpoint(server, prefix):
+    '''The URL of prefix on a server started by serve_json'''
+
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}{prefix}'
+
+
+def serve_until_interrupted(server):
+    '''Block until interrupted, then shut server down'''
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Load test of credential pushes to the Tuono Portal API.
+
+Pushes --targets dummy credentials with --concurrency pushes in flight,
+through the same Tuono client as the credential add tool, and reports the
+push throughput and the p50 and p99 latencies of the pushes and of the jobs
+they start, from the push until the job has finished.
+
+Jobs are waited for the way the tool does it for --mode:
+
+    single      each worker pushes a credential and polls its job, as for
+                one target
+    batch       every credential is pushed first, then all of the jobs are
+                polled together, as for a manifest
+
+Without --portal-url a stand-in portal (see tuono_mock_portal) is started
+for the run, configured with the same latency, pending and error options.
+Do not point --portal-url at the production portal.
+
+    python tuono_load_test.py --targets 500 --concurrency 32 --mode batch \\
+        --pending-seconds 2 --job-initial-delay 0.5 --job-max-delay 4
+'''
+
+import argparse
+import getpass
+import json
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from tuono_credential_add import BASE_URI
+from tuono_credential_add import JOB_INITIAL_DELAY
+from tuono_credential_add import JOB_MAX_DELAY
+from tuono_credential_add import JOB_TIMEOUT
+from tuono_credential_add import Tuono
+
+from tuono_metrics import TRACER
+
+from tuono_mock_portal import add_portal_arguments
+from tuono_mock_portal import base_uri
+from tuono_mock_portal import portal_from_args
+from tuono_mock_portal import serve
+
+MODES = ('single', 'batch')
+
+DEFAULT_TARGETS = 100
+DEFAULT_CONCURRENCY = 16
+
+
+def percentile(values, fraction):
+    '''Nearest-rank percentile of values, None when there are none'''
+
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def dummy_payload(venue, number):
+    '''A credential payload shaped like the ones the tool pushes'''
+
+    name = f'loadtest-{number:05d}'
+    if venue == 'aws':
+        return {'name': name, 'access_key_id': 'AKIA' + '0' * 16,
+                'secret_access_key': 'x' * 40}
+    return {'name': name, 'subscription': '0' * 32, 'tenant': '0' * 32,
+            'client_id': '0' * 32, 'client_secret': 'x' * 40}
+
+
+class LoadTest():
+    '''Push credentials and time them until their jobs finish'''
+
+    def __init__(self, tuono, venue, targets, concurrency, mode,
+                 timeout=JOB_TIMEOUT):
+
+        self.tuono = tuono
+        self.venue = venue
+        self.targets = targets
+        self.concurrency = concurrency
+        self.mode = mode
+        self.timeout = timeout
+
+        self.lock = threading.Lock()
+        # number: {'push': seconds, 'job': seconds, 'status': status}
+        self.results = {}
+
+    def record(self, number, **values):
+        '''Record timings of one target'''
+
+        with self.lock:
+            self.results.setdefault(number, {}).update(values)
+
+    def push(self, number):
+        '''Push one credential, returning its job id and push time'''
+
+        start = time.monotonic()
+        try:
+            job = self.tuono.add_credentials(dummy_payload(self.venue,
+                                                           number),
+                                             self.venue)
+        except Exception as error:
+            self.record(number, status=f'push failed: {error}')
+            return None, start
+        finish = time.monotonic()
+        self.record(number, push=finish - start, pushed=finish)
+        return job['_id'], start
+
+    def push_and_wait(self, number):
+        '''Push one credential and poll its job, as for a single target'''
+
+        job_id, start = self.push(number)
+        if job_id is None:
+            return
+        try:
+            status = self.tuono.wait_for_job(job_id, self.timeout)
+        except Exception as error:
+            self.record(number, status=f'poll failed: {error!r}')
+            return
+        self.record(number, job=time.monotonic() - start, status=status)
+
+    def run_single(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(self.push_and_wait, range(self.targets)))
+
+    def run_batch(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pushed = list(executor.map(self.push, range(self.targets)))
+
+        # The same concurrent polling as Tuono.wait_for_jobs, timing each job
+        import asyncio
+
+        async def wait(number, job_id, start):
+            try:
+                status = await self.tuono.async_wait_for_job(job_id,
+                                                             self.timeout)
+            except Exception as error:
+                # One failed poll must not end the wait for the other jobs
+                self.record(number, status=f'poll failed: {error!r}')
+                return
+            self.record(number, job=time.monotonic() - start, status=status)
+
+        async def wait_for_all():
+            await asyncio.gather(*[wait(number, job_id, start)
+                                   for number, (job_id, start)
+                                   in enumerate(pushed)
+                                   if job_id is not None])
+
+        asyncio.run(wait_for_all())
+
+    def run(self):
+        '''Run the load test, returning its report'''
+
+        start = time.monotonic()
+        if self.mode == 'batch':
+            self.run_batch()
+        else:
+            self.run_single()
+        seconds = time.monotonic() - start
+
+        return self.report(start, seconds)
+
+    def report(self, start, seconds):
+        '''Summarise the results of a run started at start'''
+
+        results = list(self.results.values())
+        pushes = [result['push'] for result in results if 'push' in result]
+        # Throughput of the pushes alone, up to the last of them
+        push_seconds = max([result['pushed'] - start for result in results
+                            if 'pushed' in result], default=seconds)
+        jobs = [result['job'] for result in results if 'job' in result]
+        succeeded = sum(result.get('status') == 200 for result in results)
+        polls = TRACER.totals().get('portal.get_job', (0,))[0]
+
+        def milliseconds(value):
+            return None if value is None else round(value * 1000, 1)
+
+        return {'mode': self.mode,
+                'targets': self.targets,
+                'concurrency': self.concurrency,
+                'seconds': round(seconds, 2),
+                'succeeded': succeeded,
+                'failed': self.targets - succeeded,
+                'pushes_per_second': round(len(pushes) / push_seconds, 1),
+                'jobs_per_second': round(len(jobs) / seconds, 1),
+                'job_polls': polls,
+                'push_p50_ms': milliseconds(percentile(pushes, 0.50)),
+                'push_p99_ms': milliseconds(percentile(pushes, 0.99)),
+                'job_p50_ms': milliseconds(percentile(jobs, 0.50)),
+                'job_p99_ms': milliseconds(percentile(jobs, 0.99))}
+
+
+def get_args():
+    '''Parse the command line'''
+
+    parser = argparse.ArgumentParser(
+        description='Load test credential pushes to the Tuono Portal API')
+    parser.add_argument('--portal-url',
+                        help="Tuono Portal API to load, by default a "
+                             "stand-in started for the run")
+    parser.add_argument('-u', '--username',
+                        default='loadtest',
+                        help="Portal username (default: %(default)s)")
+    parser.add_argument('-v', '--venue',
+                        choices=['aws', 'azure'], default='aws',
+                        help="Venue of the credentials (default: "
+                             "%(default)s)")
+    parser.add_argument('-n', '--targets',
+                        type=int, default=DEFAULT_TARGETS,
+                        help="Credentials to push (default: %(default)s)")
+    parser.add_argument('-c', '--concurrency',
+                        type=int, default=DEFAULT_CONCURRENCY,
+                        help="Pushes in flight at once (default: "
+                             "%(default)s)")
+    parser.add_argument('--mode',
+                        choices=MODES, default='batch',
+                        help="Wait for the jobs as for single targets or "
+                             "for a manifest (default: %(default)s)")
+    parser.add_argument('--job-initial-delay',
+                        type=float, default=JOB_INITIAL_DELAY,
+                        help="Seconds before the first job poll "
+                             "(default: %(default)s)")
+    parser.add_argument('--job-max-delay',
+                        type=float, default=JOB_MAX_DELAY,
+                        help="Longest wait between job polls "
+                             "(default: %(default)s)")
+    parser.add_argument('--format',
+                        choices=['text', 'json'], default='text',
+                        help="Report format (default: %(default)s)")
+    add_portal_arguments(parser)
+    args = parser.parse_args()
+
+    if args.portal_url and \
+            urlsplit(args.portal_url).hostname == urlsplit(BASE_URI).hostname:
+        parser.error('refusing to load test the production Tuono Portal')
+    if args.targets < 1 or args.concurrency < 1:
+        parser.error('--targets and --concurrency must be at least 1')
+
+    return args
+
+
+def main():
+    '''Run the load test and print its report'''
+
+    args = get_args()
+
+    server = None
+    if args.portal_url:
+        uri = args.portal_url
+        password = getpass.getpass(f"Password for {args.username}: ")
+    else:
+        server = serve(portal_from_args(args), port=0)
+        uri = base_uri(server)
+        password = 'loadtest'
+
+    try:
+        tuono = Tuono(args.username, password, base_uri=uri,
+                      job_initial_delay=args.job_initial_delay,
+                      job_max_delay=args.job_max_delay)
+        report = LoadTest(tuono, args.venue, args.targets, args.concurrency,
+                          args.mode).run()
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if args.format == 'json':
+        print(json.dumps(report, indent=2))
+    else:
+        width = max(len(key) for key in report)
+        for key, value in report.items():
+            print(f'{key:<{width}}  {value}')
+
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Timing spans for the Tuono credential add tool.
+
+Every backend call, readiness wait and Tuono Portal request is timed as a
+span. Spans only carry the attributes they are given explicitly (such as
+the target name or the method called), never call arguments or results,
+so access keys and client secrets cannot end up in the exports.
+
+At the end of a run the spans are written as JSON Lines, and optionally as
+a Prometheus textfile (for the node_exporter textfile collector) or in the
+OpenMetrics text format, and summarised in the log.
+'''
+
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+SPANS = 'tuono_spans.jsonl'
+
+METRIC = 'tuono_span'
+
+METRICS_FORMATS = ('prometheus', 'openmetrics')
+
+
+class Tracer():
+    '''Collects the spans of a run'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+
+    @contextmanager
+    def span(self, name, **attributes):
+        '''Time the body of a with statement as a span called name'''
+
+        record = {'name': name,
+                  'start': time.time(),
+                  'thread': threading.current_thread().name}
+        record.update(attributes)
+        start = time.monotonic()
+        try:
+            yield record
+            record['status'] = 'ok'
+        except BaseException:
+            record['status'] = 'error'
+            raise
+        finally:
+            record['seconds'] = round(time.monotonic() - start, 6)
+            with self.lock:
+                self.spans.append(record)
+
+    def totals(self):
+        '''{name: (count, errors, total seconds, max seconds)}'''
+
+        totals = {}
+        with self.lock:
+            spans = list(self.spans)
+        for record in spans:
+            count, errors, total, longest = totals.get(record['name'],
+                                                       (0, 0, 0.0, 0.0))
+            totals[record['name']] = (count + 1,
+                                      errors + (record['status'] != 'ok'),
+                                      total + record['seconds'],
+                                      max(longest, record['seconds']))
+        return totals
+
+    def write_jsonl(self, filename=SPANS):
+        '''Write one JSON object per span'''
+
+        with self.lock:
+            spans = sorted(self.spans, key=lambda record: record['start'])
+        with open(filename, 'w') as output:
+            for record in spans:
+                output.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def write_metrics(self, filename, metrics_format='prometheus'):
+        '''Write the span totals in the Prometheus or OpenMetrics format'''
+
+        lines = [f"# HELP {METRIC}_duration_seconds Time spent in each "
+                 f"operation of the Tuono credential add tool.",
+                 f"# TYPE {METRIC}_duration_seconds summary"]
+        totals = sorted(self.totals().items())
+        for name, (count, errors, total, longest) in totals:
+            label = f'{{span="{escape_label(name)}"}}'
+            lines.append(f"{METRIC}_duration_seconds_sum{label} {total:.6f}")
+            lines.append(f"{METRIC}_duration_seconds_count{label} {count}")
+
+        # OpenMetrics names counters without their _total suffix
+        if metrics_format == 'openmetrics':
+            family = f"{METRIC}_errors"
+        else:
+            family = f"{METRIC}_errors_total"
+        lines += [f"# HELP {family} Operations that raised an error.",
+                  f"# TYPE {family} counter"]
+        for name, (count, errors, total, longest) in totals:
+            lines.append(f'{METRIC}_errors_total{{span="{escape_label(name)}"}}'
+                         f' {errors}')
+
+        if metrics_format == 'openmetrics':
+            lines.append('# EOF')
+
+        # Renamed into place, so a textfile collector never reads half a file
+        temporary = f"{filename}.tmp"
+        with open(temporary, 'w') as output:
+            output.write('\n'.join(lines) + '\n')
+        os.replace(temporary, filename)
+
+    def summary(self, logger):
+        '''Log a table of the time spent in each kind of span'''
+
+        totals = self.totals()
+        if not totals:
+            return
+
+        width = max(len(name) for name in totals)
+        logger.info(f"{'SPAN':<{width}} {'COUNT':>6} {'ERRORS':>6} "
+                    f"{'TOTAL':>8} {'MEAN':>7} {'MAX':>7}")
+        for name, (count, errors, total, longest) in sorted(
+                totals.items(), key=lambda item: -item[1][2]):
+            logger.info(f"{name:<{width}} {count:>6} {errors:>6} "
+                        f"{total:>8.1f} {total / count:>7.2f} "
+                        f"{longest:>7.2f}")
+
+
+def escape_label(value):
+    '''Escape a Prometheus label value'''
+
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+class TracedBackend():
+    '''Wrap a provisioning backend, timing every method call as a span'''
+
+    def __init__(self, backend, tracer, **attributes):
+        self.backend = backend
+        self.tracer = tracer
+        self.attributes = attributes
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+        if not callable(method):
+            return method
+
+        def traced(*args, **kwargs):
+            with self.tracer.span(f"backend.{name}", **self.attributes):
+                return method(*args, **kwargs)
+        return traced
+
+
+TRACER = Tracer()
+
+
+def span(name, **attributes):
+    '''Time a span with the tracer of the run'''
+
+    return TRACER.span(name, **attributes)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Local stand-in for the Tuono Portal API.
+
+Serves the three endpoints the credential add tool uses, under /api/v1:
+
+    POST /auth/login                  returns a bearer token
+    POST /credential/{venue}          starts a credential job (aws, azure)
+    GET  /async_job?job_id=<id>       status 412 while the job is pending,
+                                      then 200, or 500 if the job failed
+
+Each request is delayed by --latency-ms, give or take --jitter-ms. Jobs stay
+pending for --pending-seconds, give or take half of it, and --job-error-rate
+of them fail. --error-rate of all requests are answered 503 Service
+Unavailable instead, which the tool retries. Nothing is stored beyond the
+life of the server.
+
+    python tuono_mock_portal.py --port 8080 --pending-seconds 5
+    python tuono_credential_add.py --portal-url http://localhost:8080/api/v1 ...
+'''
+
+import argparse
+import random
+import sys
+import threading
+import time
+import uuid
+
+from tuono_json_server import endpoint
+from tuono_json_server import serve_json
+from tuono_json_server import serve_until_interrupted
+
+API_PREFIX = '/api/v1'
+
+VENUES = ('aws', 'azure')
+
+DEFAULT_PORT = 8080
+DEFAULT_LATENCY_MS = 50
+DEFAULT_PENDING_SECONDS = 5
+
+
+class MockPortal():
+    '''State and behaviour of the stand-in portal'''
+
+    def __init__(self, latency_ms=DEFAULT_LATENCY_MS, jitter_ms=0,
+                 pending_seconds=DEFAULT_PENDING_SECONDS, error_rate=0.0,
+                 job_error_rate=0.0, seed=None):
+
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.pending_seconds = pending_seconds
+        self.error_rate = error_rate
+        self.job_error_rate = job_error_rate
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = set()
+        # job id: (finish time, status once finished)
+        self.jobs = {}
+        self.requests = {}
+
+    def draw(self):
+        '''Return one uniform random number, shared safely across threads'''
+
+        with self.lock:
+            return self.random.random()
+
+    def delay(self):
+        '''Sleep for the configured request latency'''
+
+        latency = self.latency + self.jitter * (2 * self.draw() - 1)
+        time.sleep(max(latency, 0))
+
+    def count(self, endpoint, status):
+        '''Count a request by endpoint and response status'''
+
+        with self.lock:
+            key = (endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def login(self, body):
+        '''Issue a token to any username and password'''
+
+        if not body.get('username') or not body.get('password'):
+            return 401, {'status': 401, 'message': 'Invalid credentials'}
+
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens.add(token)
+        return 200, {'status': 200, 'object': {'token': token}}
+
+    def authorized(self, authorization):
+        '''Whether a request carries a token issued by login'''
+
+        scheme, _, token = (authorization or '').partition(' ')
+        with self.lock:
+            return scheme == 'Bearer' and token in self.tokens
+
+    def add_credential(self, venue, body):
+        '''Start a credential job'''
+
+        if venue not in VENUES:
+            return 404, {'status': 404, 'message': f'Unknown venue {venue}'}
+        if not body.get('name'):
+            return 400, {'status': 400, 'message': 'A name is required'}
+
+        pending = self.pending_seconds * (0.5 + self.draw())
+        status = 500 if self.draw() < self.job_error_rate else 200
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = (time.monotonic() + pending, status)
+
+        return 200, {'status': 200,
+                     'object': {'_id': job_id, 'name': body['name'],
+                                'venue': venue}}
+
+    def get_job(self, job_id):
+        '''Report the status of a job'''
+
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return 404, {'status': 404, 'message': f'Unknown job {job_id}'}
+
+        finish, status = job
+        if time.monotonic() < finish:
+            status = 412
+        return 200, {'status': 200, 'object': {'_id': job_id,
+                                               'status': status}}
+
+    def handle(self, method, path, query, headers, body):
+        '''Return the status and JSON response to one request, counting it'''
+
+        status, response = self.route(method, path, query, headers, body)
+
+        endpoint = path
+        if path.startswith(API_PREFIX + '/'):
+            endpoint = path[len(API_PREFIX):]
+        if endpoint.startswith('/credential/'):
+            endpoint = '/credential/{venue}'
+        self.count(f'{method} {endpoint}', status)
+
+        return status, response
+
+    def route(self, method, path, query, headers, body):
+        '''Return the status and JSON response to one request'''
+
+        self.delay()
+
+        if self.draw() < self.error_rate:
+            return 503, {'status': 503, 'message': 'Service Unavailable'}
+
+        if not path.startswith(API_PREFIX + '/'):
+            return 404, {'status': 404, 'message': f'Unknown path {path}'}
+        path = path[len(API_PREFIX):]
+
+        if method == 'POST' and path == '/auth/login':
+            return self.login(body)
+
+        if not self.authorized(headers.get('Authorization')):
+            return 401, {'status': 401, 'message': 'Not authorized'}
+
+        if method == 'POST' and path.startswith('/credential/'):
+            return self.add_credential(path[len('/credential/'):], body)
+
+        if method == 'GET' and path == '/async_job':
+            return self.get_job(query.get('job_id', [''])[0])
+
+        return 404, {'status': 404, 'message': f'Unknown path {path}'}
+
+    def summary(self):
+        '''Return the request counts as lines of text'''
+
+        with self.lock:
+            requests = sorted(self.requests.items())
+        return [f'{endpoint:<24} {status} {count:>8}'
+                for (endpoint, status), count in requests]
+
+
+def serve(portal, port=DEFAULT_PORT, host='127.0.0.1'):
+    '''Serve portal in a background thread, returning the server'''
+
+    return serve_json(portal, port, host)
+
+
+def base_uri(server):
+    '''The API endpoint of a server started by serve'''
+
+    return endpoint(server, API_PREFIX)
+
+
+def add_portal_arguments(parser):
+    '''Add the options describing the behaviour of the stand-in'''
+
+    parser.add_argument('--latency-ms',
+                        type=float, default=DEFAULT_LATENCY_MS,
+                        help="Delay every request by this many ms "
+                             "(default: %(default)s)")
+    parser.add_argument('--jitter-ms',
+                        type=float, default=0,
+                        help="Vary the delay by up to this many ms either "
+                             "way")
+    parser.add_argument('--pending-seconds',
+                        type=float, default=DEFAULT_PENDING_SECONDS,
+                        help="Mean seconds a job stays pending (412) "
+                             "(default: %(default)s)")
+    parser.add_argument('--error-rate',
+                        type=float, default=0.0,
+                        help="Fraction of requests answered 503")
+    parser.add_argument('--job-error-rate',
+                        type=float, default=0.0,
+                        help="Fraction of jobs that fail")
+    parser.add_argument('--seed',
+                        type=int,
+                        help="Seed the random latencies and errors")
+
+
+def portal_from_args(args):
+    '''Build a MockPortal from the options of add_portal_arguments'''
+
+    return MockPortal(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                      pending_seconds=args.pending_seconds,
+                      error_rate=args.error_rate,
+                      job_error_rate=args.job_error_rate, seed=args.seed)
+
+
+def main():
+    '''Serve the stand-in portal until interrupted'''
+
+    parser = argparse.ArgumentParser(
+        description='Local stand-in for the Tuono Portal API')
+    parser.add_argument('-p', '--port',
+                        type=int, default=DEFAULT_PORT,
+                        help="Port to listen on (default: %(default)s)")
+    parser.add_argument('--host',
+                        default='127.0.0.1',
+                        help="Address to listen on (default: %(default)s)")
+    add_portal_arguments(parser)
+    args = parser.parse_args()
+
+    portal = portal_from_args(args)
+    server = serve(portal, args.port, args.host)
+    print(f"Serving a stand-in Tuono Portal at {base_uri(server)}")
+
+    serve_until_interrupted(server)
+    print('\n'.join(portal.summary()))
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
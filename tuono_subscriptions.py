@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Azure subscription index for the Tuono credential add tool.
+
+Listing the subscriptions of a large tenant is slow, so the listing is
+cached on disk (in SUBSCRIPTION_CACHE_DIR) for SUBSCRIPTION_TTL seconds and
+indexed by both subscription name and id. Each tenant and account signed in
+to has a cache file of its own, so switching between them never serves
+another tenant's subscriptions. A lookup that misses a cached listing
+refreshes it once before giving up, so newly created subscriptions are
+still found.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+SUBSCRIPTION_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                      'tuono')
+
+SUBSCRIPTION_TTL = 3600
+
+
+class SubscriptionNotFound(LookupError):
+    '''No single subscription matches a name or id'''
+
+
+class SubscriptionIndex():
+    '''Subscriptions by name and by id'''
+
+    def __init__(self, backend, ttl=SUBSCRIPTION_TTL,
+                 cache_dir=SUBSCRIPTION_CACHE_DIR):
+        self.backend = backend
+        self.ttl = ttl
+        self.account = None
+        self.filename = None
+        if ttl > 0:
+            self.account = backend.azure_account()
+            digest = hashlib.sha256(self.account.encode()).hexdigest()
+            self.filename = os.path.join(cache_dir,
+                                         f'subscriptions-{digest[:16]}.json')
+        self.lock = threading.Lock()
+        self.by_id = {}
+        self.by_name = {}
+        self.fresh = False
+
+        subscriptions = self.load_cache()
+        if subscriptions is None:
+            self.refresh()
+        else:
+            self.index(subscriptions)
+
+    def load_cache(self):
+        '''The cached listing, or None when it is missing or expired'''
+
+        if self.ttl <= 0 or not os.path.exists(self.filename):
+            return None
+        try:
+            with open(self.filename) as cache:
+                cached = json.load(cache)
+        except ValueError:
+            return None
+        if cached.get('account') != self.account:
+            return None
+        if time.time() - cached.get('fetched', 0) > self.ttl:
+            return None
+        return cached['subscriptions']
+
+    def refresh(self):
+        '''List the subscriptions again and rewrite the cache'''
+
+        subscriptions = self.backend.list_subscriptions()
+        self.index(subscriptions)
+        self.fresh = True
+
+        if self.ttl > 0:
+            self.save(subscriptions)
+
+    def save(self, subscriptions):
+        '''Replace the cache file atomically'''
+
+        directory = os.path.dirname(self.filename)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, partial = tempfile.mkstemp(dir=directory,
+                                               suffix='.partial')
+        try:
+            with os.fdopen(descriptor, 'w') as cache:
+                json.dump({'account': self.account,
+                           'fetched': time.time(),
+                           'subscriptions': subscriptions}, cache)
+            os.replace(partial, self.filename)
+        except BaseException:
+            os.unlink(partial)
+            raise
+
+    def index(self, subscriptions):
+        self.by_id = {}
+        self.by_name = {}
+        for subscription in subscriptions:
+            self.by_id[subscription['id']] = subscription
+            self.by_name.setdefault(subscription['name'], []) \
+                .append(subscription)
+
+    def find(self, key):
+        matches = self.by_name.get(key, [])
+        if key in self.by_id:
+            matches = [self.by_id[key]]
+        return matches
+
+    def lookup(self, key):
+        '''The subscription with name or id key'''
+
+        with self.lock:
+            matches = self.find(key)
+            if not matches and not self.fresh:
+                self.refresh()
+                matches = self.find(key)
+
+        if not matches:
+            raise SubscriptionNotFound(
+                f"No Azure subscription is named or has the id {key!r}, "
+                f"check the name with: az account list --output table")
+        if len(matches) > 1:
+            raise SubscriptionNotFound(
+                f"{len(matches)} Azure subscriptions are named {key!r}, "
+                f"use one of their ids instead: "
+                f"{', '.join(match['id'] for match in matches)}")
+        return matches[0]
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2021 Tuono, Inc.
+#
+#  Contributors: Scott Harrison (Tuono)
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+'''
+Single entry point for the Tuono open tools.
+
+    tuono_tools.py <command> [options]
+    tuono_tools.py <command> --help
+
+Each command is one of the tools in this repository, run exactly as if it
+had been invoked on its own. Only the module of the command being run is
+imported, and the tools themselves import pyVmomi, requests, numpy and the
+cloud SDKs when they first need them, so that listing the commands, --help
+and argument errors return quickly (see tuono_benchmark_startup).
+'''
+
+import importlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# command: (directory, module, summary)
+COMMANDS = {
+    'credential-add': (
+        '.', 'tuono_credential_add',
+        'Onboard AWS and Azure credentials into the Tuono Portal'),
+    'mock-portal': (
+        '.', 'tuono_mock_portal',
+        'Serve a local stand-in for the Tuono Portal API'),
+    'load-test': (
+        '.', 'tuono_load_test',
+        'Load test credential pushes to the Tuono Portal API'),
+    'fake-graph': (
+        '.', 'tuono_fake_graph',
+        'Serve a local stand-in for Microsoft Graph'),
+    'build-data-dictionary': (
+        'pyvmomi-tools', 'build_data_dictionary',
+        'Describe the VMs of a vCenter inventory'),
+    'watch-inventory': (
+        'pyvmomi-tools', 'watch_inventory',
+        'Keep a vCenter inventory up to date and serve it over HTTP'),
+    'multi-vcenter': (
+        'pyvmomi-tools', 'multi_vcenter',
+        'Collect the inventory of several vCenters at once'),
+    'snapshot-store': (
+        'pyvmomi-tools', 'snapshot_store',
+        'Store inventory snapshots and report the differences'),
+    'capacity-report': (
+        'pyvmomi-tools', 'capacity_report',
+        'Capacity and right-sizing report for collected inventory'),
+    'blueprint-generator': (
+        'pyvmomi-tools', 'blueprint_generator',
+        'Generate Tuono blueprints from collected inventory'),
+    'benchmark-collectors': (
+        'pyvmomi-tools', 'benchmark_collectors',
+        'Benchmark the collectors against a synthetic vCenter'),
+    'validate-blueprints': (
+        'blueprint-tools', 'validate_blueprints',
+        'Validate Tuono blueprints'),
+    'render-blueprints': (
+        'blueprint-tools', 'render_blueprints',
+        'Render Tuono blueprints for a venue'),
+}
+
+
+def usage(program):
+    '''Return the list of commands'''
+
+    width = max(len(command) for command in COMMANDS)
+    lines = [f'usage: {program} <command> [options]', '', 'commands:']
+    for command, (_, _, summary) in COMMANDS.items():
+        lines.append(f'  {command:<{width}}  {summary}')
+    lines.append('')
+    lines.append(f'Run {program} <command> --help for the options of each.')
+    return '\n'.join(lines)
+
+
+def load(command):
+    '''Import the module implementing command'''
+
+    directory, module, _ = COMMANDS[command]
+    # The tools import their sibling modules by name
+    path = os.path.normpath(os.path.join(ROOT, directory))
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(module)
+
+
+def main(argv=None):
+    '''Run the command named by the first argument'''
+
+    argv = sys.argv[1:] if argv is None else argv
+    program = os.path.basename(sys.argv[0])
+
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage(program))
+        return 0 if argv else 2
+
+    command = argv[0]
+    if command not in COMMANDS:
+        print(usage(program), file=sys.stderr)
+        print(f'\n{program}: error: unknown command {command!r}',
+              file=sys.stderr)
+        return 2
+
+    # The tool parses sys.argv itself, and names itself after the command
+    sys.argv = [f'{program} {command}'] + argv[1:]
+    return load(command).main()
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())